@@ -0,0 +1,149 @@
+"""
+Локальная замена API Кинопоиска для нагрузочного тестирования.
+
+Отдаёт записанные ответы из `benchmarks/fixtures` с настраиваемой задержкой, долей ошибок и ответами 429.
+Для запуска бота против этого сервера достаточно указать `KINOPOISK__BASE_URL=http://localhost:8081/`:
+
+    python -m benchmarks.fake_kinopoisk --port 8081 --latency-median-ms 120 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import copy
+import dataclasses
+import json
+import math
+import pathlib
+import random
+import time
+from typing import Any
+
+from aiohttp import web
+
+from cinemabot.infrastructure.clients.kinopoisk import normalize_keyword
+
+
+FIXTURES_PATH = pathlib.Path(__file__).parent / "fixtures"
+
+
+@dataclasses.dataclass
+class LatencyDistribution:
+    """Логнормальное распределение задержки: `median_ms` - медиана, `sigma` задаёт длину хвоста (p99 ~ median * e^(2.33 * sigma))."""
+
+    median_ms: float = 0.0
+    sigma: float = 0.0
+
+    def sample(self) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        return random.lognormvariate(math.log(self.median_ms), self.sigma) / 1000
+
+
+@dataclasses.dataclass
+class FakeKinopoiskConfig:
+    latency: LatencyDistribution = dataclasses.field(default_factory=LatencyDistribution)
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    requests_per_second: float | None = None
+    poster_size: int = 150_000
+    poster_preview_size: int = 30_000
+
+
+class FakeKinopoisk:
+    def __init__(self, config: FakeKinopoiskConfig) -> None:
+        self.config = config
+        self.requests_count: dict[str, int] = {"search": 0, "details": 0, "poster": 0}
+        with (FIXTURES_PATH / "search_by_keyword.json").open() as file:
+            self._search_fixtures: dict[str, list[dict[str, Any]]] = json.load(file)
+        with (FIXTURES_PATH / "film_details.json").open() as file:
+            self._details_fixture: dict[str, Any] = json.load(file)
+        self._window_started_at = time.monotonic()
+        self._window_requests = 0
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._faults_middleware])
+        app.router.add_get("/api/v2.1/films/search-by-keyword", self.search_by_keyword)
+        app.router.add_get("/api/v2.2/films/{film_id:\\d+}", self.film_details)
+        app.router.add_route("*", "/images/posters/{kind}/{film_id:\\d+}.jpg", self.poster)
+        return app
+
+    @web.middleware
+    async def _faults_middleware(self, request: web.Request, handler: Any) -> web.StreamResponse:
+        await asyncio.sleep(self.config.latency.sample())
+        if request.path.startswith("/api/"):
+            if self._is_rate_limited() or random.random() < self.config.rate_limit_rate:
+                return web.json_response({"message": "You exceeded the quota"}, status=429)
+            if random.random() < self.config.error_rate:
+                return web.json_response({"message": "Internal server error"}, status=500)
+        return await handler(request)
+
+    def _is_rate_limited(self) -> bool:
+        if self.config.requests_per_second is None:
+            return False
+        now = time.monotonic()
+        if now - self._window_started_at >= 1:
+            self._window_started_at = now
+            self._window_requests = 0
+        self._window_requests += 1
+        return self._window_requests > self.config.requests_per_second
+
+    async def search_by_keyword(self, request: web.Request) -> web.Response:
+        self.requests_count["search"] += 1
+        keyword = normalize_keyword(request.query.get("keyword", ""))
+        page = int(request.query.get("page", 1))
+        # на неизвестный запрос отвечаем записью для первого ключевого слова, чтобы случайные запросы тоже находили фильмы
+        pages = self._search_fixtures.get(keyword) or next(iter(self._search_fixtures.values()))
+        if page > len(pages):
+            return self._render({"keyword": keyword, "pagesCount": len(pages), "films": []}, request)
+        return self._render(pages[page - 1], request)
+
+    async def film_details(self, request: web.Request) -> web.Response:
+        self.requests_count["details"] += 1
+        film_id = int(request.match_info["film_id"])
+        details = copy.deepcopy(self._details_fixture)
+        details["kinopoiskId"] = film_id
+        details["webUrl"] = f"https://www.kinopoisk.ru/film/{film_id}/"
+        return self._render(details, request)
+
+    async def poster(self, request: web.Request) -> web.StreamResponse:
+        self.requests_count["poster"] += 1
+        size = self.config.poster_preview_size if request.match_info["kind"] == "kp_small" else self.config.poster_size
+        headers = {"Content-Type": "image/jpeg", "Accept-Ranges": "bytes"}
+        if request.method == "HEAD":
+            return web.Response(headers={**headers, "Content-Length": str(size)})
+        if request.headers.get("Range") == "bytes=0-0":
+            return web.Response(status=206, body=b"\xff", headers={**headers, "Content-Range": f"bytes 0-0/{size}"})
+        return web.Response(body=bytes(size), headers=headers)
+
+    @staticmethod
+    def _render(data: dict[str, Any], request: web.Request) -> web.Response:
+        base_url = f"{request.scheme}://{request.host}/"
+        body = json.dumps(data, ensure_ascii=False).replace("{base_url}", base_url)
+        return web.Response(text=body, content_type="application/json")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-median-ms", type=float, default=0.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Доля ответов 429 независимо от нагрузки")
+    parser.add_argument("--rps", type=float, default=None, help="Отвечать 429 на запросы сверх этого количества в секунду")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    config = FakeKinopoiskConfig(
+        latency=LatencyDistribution(median_ms=args.latency_median_ms, sigma=args.latency_sigma),
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        requests_per_second=args.rps,
+    )
+    web.run_app(FakeKinopoisk(config).create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
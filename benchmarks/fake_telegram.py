@@ -0,0 +1,116 @@
+"""
+Замена сессии Bot API, чтобы прогонять `dispatcher.feed_update` без сети.
+
+Вместо HTTP-запросов в Telegram сессия сразу возвращает правдоподобный ответ нужного типа
+(с задержкой из `LatencyDistribution`) и запоминает, какие методы вызывались.
+"""
+
+import asyncio
+import collections
+import datetime as dt
+import itertools
+import json
+from typing import Any, AsyncGenerator
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import Message, Update, User
+
+from benchmarks.fake_kinopoisk import LatencyDistribution
+
+
+FAKE_BOT_TOKEN = "42:FAKE-TOKEN-FOR-BENCHMARKS"
+FAKE_BOT_USER = {"id": 42, "is_bot": True, "first_name": "cinemabot"}
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+class FakeBotSession(BaseSession):
+    def __init__(self, latency: LatencyDistribution | None = None) -> None:
+        super().__init__()
+        self.latency = latency or LatencyDistribution()
+        self.calls: collections.Counter[str] = collections.Counter()
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[TelegramType], timeout: int | None = None) -> TelegramType:
+        self.calls[type(method).__name__] += 1
+        await asyncio.sleep(self.latency.sample())
+        result = self._fake_result(method)
+        response = self.check_response(bot, method, status_code=200, content=json.dumps({"ok": True, "result": result}))
+        return response.result  # type: ignore[return-value]
+
+    async def stream_content(
+        self,
+        url: str,
+        headers: dict[str, Any] | None = None,
+        timeout: int = 30,
+        chunk_size: int = 65536,
+        raise_for_status: bool = True,
+    ) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+    @staticmethod
+    def _fake_result(method: TelegramMethod[Any]) -> Any:
+        returning = method.__returning__
+        if returning is Message:
+            chat_id = getattr(method, "chat_id", 0)
+            return {
+                "message_id": getattr(method, "message_id", None) or next(_message_ids),
+                "date": int(dt.datetime.now().timestamp()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": FAKE_BOT_USER,
+                "text": getattr(method, "text", None) or getattr(method, "caption", None),
+            }
+        if returning is User:
+            return FAKE_BOT_USER
+        # большинство остальных методов (setMyCommands, answerCallbackQuery, ...) возвращают True
+        return True
+
+
+def _user(user_id: int) -> dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+def make_message_update(user_id: int, text: str) -> Update:
+    entities = []
+    if text.startswith("/"):
+        entities.append({"type": "bot_command", "offset": 0, "length": len(text.split()[0])})
+    return Update.model_validate(
+        {
+            "update_id": next(_update_ids),
+            "message": {
+                "message_id": next(_message_ids),
+                "date": int(dt.datetime.now().timestamp()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": _user(user_id),
+                "text": text,
+                "entities": entities,
+            },
+        },
+    )
+
+
+def make_callback_update(user_id: int, data: str) -> Update:
+    return Update.model_validate(
+        {
+            "update_id": next(_update_ids),
+            "callback_query": {
+                "id": str(next(_update_ids)),
+                "from": _user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": next(_message_ids),
+                    "date": int(dt.datetime.now().timestamp()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": FAKE_BOT_USER,
+                    "caption": "",
+                },
+            },
+        },
+    )
@@ -0,0 +1,117 @@
+"""
+Замер задержки сценария `/find` -> ⏭ -> ▶️ без сети: Кинопоиск и Telegram заменены заглушками.
+
+Хранилище берётся из настроек как обычно, поэтому для запуска нужен Postgres из `docker-compose.yaml`
+или `STORAGE__BACKEND=memory` (`sqlite`), чтобы обойтись без него:
+
+    python -m benchmarks.find_latency --users 200 --concurrency 50 --latency-median-ms 120 --latency-sigma 0.6
+"""
+
+import argparse
+import asyncio
+import collections
+import os
+import statistics
+import time
+
+from aiogram.types import Update
+from aiohttp import web
+
+from benchmarks.fake_kinopoisk import FakeKinopoisk, FakeKinopoiskConfig, LatencyDistribution
+from benchmarks.fake_telegram import FAKE_BOT_TOKEN, FakeBotSession, make_callback_update, make_message_update
+
+from cinemabot import dependencies
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--next-presses", type=int, default=3)
+    parser.add_argument("--keywords", nargs="+", default=["груз", "брат"])
+    parser.add_argument("--latency-median-ms", type=float, default=100.0, help="Медиана задержки API Кинопоиска")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--telegram-latency-median-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rps", type=float, default=None, help="Лимит запросов в секунду у заглушки Кинопоиска")
+    return parser.parse_args()
+
+
+def format_percentiles(name: str, latencies: list[float]) -> str:
+    if len(latencies) < 2:
+        return f"{name:>8}: not enough samples"
+    quantiles = statistics.quantiles(latencies, n=100)
+    return f"{name:>8}: n={len(latencies):<6} p50={quantiles[49] * 1000:8.1f}ms p95={quantiles[94] * 1000:8.1f}ms p99={quantiles[98] * 1000:8.1f}ms"
+
+
+async def run(args: argparse.Namespace) -> None:
+    fake_kinopoisk = FakeKinopoisk(
+        FakeKinopoiskConfig(
+            latency=LatencyDistribution(median_ms=args.latency_median_ms, sigma=args.latency_sigma),
+            error_rate=args.error_rate,
+            requests_per_second=args.rps,
+        ),
+    )
+    runner = web.AppRunner(fake_kinopoisk.create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+
+    # настройки читаются лениво, поэтому достаточно подменить переменные окружения до первого обращения к ним
+    os.environ["KINOPOISK__BASE_URL"] = f"http://{host}:{port}/"
+    os.environ.setdefault("KINOPOISK__API_KEY", "fake")
+    os.environ["BOT__TOKEN"] = FAKE_BOT_TOKEN
+
+    bot_session = FakeBotSession(latency=LatencyDistribution(median_ms=args.telegram_latency_median_ms))
+    dispatcher, bot = await dependencies.get_dispatcher_and_bot(bot_session=bot_session)
+    await dispatcher.emit_startup(bot=bot)
+
+    latencies: collections.defaultdict[str, list[float]] = collections.defaultdict(list)
+    errors: collections.Counter[str] = collections.Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def feed(step: str, update: Update) -> None:
+        started_at = time.perf_counter()
+        try:
+            await dispatcher.feed_update(bot, update)
+        except Exception as error:
+            errors[f"{step}: {type(error).__name__}"] += 1
+            return
+        latencies[step].append(time.perf_counter() - started_at)
+
+    async def user_flow(user_id: int) -> None:
+        keyword = args.keywords[user_id % len(args.keywords)]
+        async with semaphore:
+            await feed("find", make_message_update(user_id, f"/find {keyword}"))
+            for _ in range(args.next_presses):
+                await feed("next", make_callback_update(user_id, "find_command_next_button"))
+            await feed("details", make_callback_update(user_id, "find_command_detail_button"))
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(user_flow(user_id) for user_id in range(1, args.users + 1)))
+    elapsed = time.perf_counter() - started_at
+
+    print(f"{args.users} users in {elapsed:.2f}s")
+    for step in ("find", "next", "details"):
+        print(format_percentiles(step, latencies[step]))
+    print("kinopoisk requests:", fake_kinopoisk.requests_count)
+    print("telegram calls:", dict(bot_session.calls))
+    print("coalesced requests:", dependencies.get_kinopoisk_client().coalescing_stats)
+    if dependencies.get_settings().storage.backend == "sqlalchemy":
+        print("database units of work:", dependencies.get_session_provider().stats)
+        print("database:")
+        print(dependencies.get_session_provider().metrics.report())
+    if errors:
+        print("errors:", dict(errors))
+
+    await dispatcher.emit_shutdown(bot=bot)
+    await runner.cleanup()
+
+
+def main() -> None:
+    asyncio.run(run(parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Сравнение репозиториев на ORM (`sqlalchemy`), на чистом asyncpg (`asyncpg`), в памяти (`memory`) и на SQLite (`sqlite`)
+на горячих запросах бота.
+
+Для `sqlalchemy` и `asyncpg` нужен Postgres с применёнными миграциями, настройки подключения берутся из окружения как обычно:
+
+    python -m benchmarks.storage_repository --iterations 2000 --concurrency 10
+
+`memory` и `sqlite` обходятся без внешних сервисов:
+
+    python -m benchmarks.storage_repository --backends memory sqlite
+"""
+
+import argparse
+import asyncio
+import collections
+import datetime as dt
+import tempfile
+import time
+import typing as tp
+import uuid
+
+from benchmarks.find_latency import format_percentiles
+
+from cinemabot import dependencies
+from cinemabot.domain.models import HistoryRecord
+from cinemabot.domain.repository.storage import AbstractStorageRepository
+from cinemabot.infrastructure.repository.asyncpg_storage import AsyncpgStorageRepository
+from cinemabot.infrastructure.repository.memory import MemoryStorageRepository
+from cinemabot.infrastructure.repository.sqlite import SqliteStorageRepository
+from cinemabot.infrastructure.repository.storage import StorageRepository
+
+
+# id пользователей и фильмов, которые не пересекаются с настоящими
+BENCHMARK_USER_ID = 9_000_000_000
+BENCHMARK_KINOPOISK_ID = 900_000_000
+BACKENDS = ("sqlalchemy", "asyncpg", "memory", "sqlite")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000, help="Сколько раз выполнить каждую операцию")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--films", type=int, default=100, help="Сколько фильмов в статистике пользователя")
+    parser.add_argument("--history", type=int, default=1000, help="Сколько запросов в истории пользователя")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=["sqlalchemy", "asyncpg"], help="Какие репозитории сравнивать")
+    return parser.parse_args()
+
+
+def create_repository(backend: str, directory: str) -> AbstractStorageRepository:
+    if backend == "memory":
+        return MemoryStorageRepository()
+    if backend == "sqlite":
+        return SqliteStorageRepository(path=f"{directory}/benchmark.sqlite3")
+    # кэши id на одну запись: сравниваются сами запросы к базе, а не попадания в кэш
+    cache_options: dict[str, tp.Any] = {"known_users_max_size": 1, "films_max_size": 1, "warm_up": False}
+    if backend == "asyncpg":
+        return AsyncpgStorageRepository(connection_settings=dependencies.get_settings().postgres, **cache_options)
+    return StorageRepository(session_provider=dependencies.get_session_provider(), **cache_options)
+
+
+async def seed(repository: AbstractStorageRepository, args: argparse.Namespace) -> None:
+    for i in range(args.iterations):
+        await repository.create_user(BENCHMARK_USER_ID + 1 + i, get_or_create=True)
+    now = dt.datetime.now(dt.timezone.utc)
+    await repository.add_requests_to_history(
+        [HistoryRecord(BENCHMARK_USER_ID, f"request {i}", now - dt.timedelta(seconds=i), uuid.uuid4()) for i in range(args.history)],
+    )
+    for i in range(args.films):
+        await repository.increase_number_of_film_view(BENCHMARK_USER_ID, BENCHMARK_KINOPOISK_ID + i, f"Фильм {i}", f"Film {i}", poster_size=i)
+
+
+def operations(repository: AbstractStorageRepository, args: argparse.Namespace) -> dict[str, tp.Callable[[int], tp.Awaitable[tp.Any]]]:
+    return {
+        "user": lambda i: repository.create_user(BENCHMARK_USER_ID + 1 + i, get_or_create=True),
+        "poster": lambda i: repository.get_film_poster_size(BENCHMARK_KINOPOISK_ID + i % args.films),
+        "view": lambda i: repository.increase_number_of_film_view(BENCHMARK_USER_ID, BENCHMARK_KINOPOISK_ID + i % args.films, "", ""),
+        "search": lambda i: repository.add_request_to_history(BENCHMARK_USER_ID, f"request {i}"),
+        "history": lambda i: repository.get_search_history(BENCHMARK_USER_ID),
+        "stats": lambda i: repository.get_stats(BENCHMARK_USER_ID),
+    }
+
+
+async def measure(operation: tp.Callable[[int], tp.Awaitable[tp.Any]], args: argparse.Namespace) -> tuple[list[float], float]:
+    latencies: list[float] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def call(i: int) -> None:
+        async with semaphore:
+            started_at = time.perf_counter()
+            await operation(i)
+            latencies.append(time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(call(i) for i in range(args.iterations)))
+    return latencies, time.perf_counter() - started_at
+
+
+async def run(args: argparse.Namespace) -> None:
+    results: collections.defaultdict[str, dict[str, tuple[list[float], float]]] = collections.defaultdict(dict)
+    with tempfile.TemporaryDirectory(prefix="cinemabot-benchmark-") as directory:
+        for name in args.backends:
+            repository = create_repository(name, directory)
+            await repository.start()
+            await seed(repository, args)
+            for operation_name, operation in operations(repository, args).items():
+                await measure(operation, argparse.Namespace(**{**vars(args), "iterations": min(args.iterations, 100)}))  # прогрев
+                results[operation_name][name] = await measure(operation, args)
+            await repository.close()
+    if "sqlalchemy" in args.backends:
+        # распределение по методам репозитория на ORM: ожидание соединения, заполненность пула и задержка запросов
+        sqlalchemy_report = dependencies.get_session_provider().metrics.report()
+        await dependencies.get_session_provider().close()
+
+    for operation_name, by_repository in results.items():
+        print(operation_name)
+        for name, (latencies, elapsed) in by_repository.items():
+            print(f"  {format_percentiles(name, latencies)} {len(latencies) / elapsed:8.0f} ops/s")
+    if "sqlalchemy" in args.backends:
+        print("sqlalchemy by method")
+        print(sqlalchemy_report)
+
+
+def main() -> None:
+    asyncio.run(run(parse_args()))
+
+
+if __name__ == "__main__":
+    main()
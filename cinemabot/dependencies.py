@@ -1,13 +1,33 @@
+import datetime as dt
+import logging
+
 import aiogram
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisStorage
 from aiogram.types import BotCommand
+from redis import asyncio as aioredis
 
 from cinemabot import handlers
+from cinemabot.domain.models import TopPeriod
 from cinemabot.domain.repository.storage import AbstractStorageRepository
+from cinemabot.handlers.middlewares import UnitOfWorkMiddleware
+from cinemabot.handlers.utils.export import Exporter, RedisExporter
+from cinemabot.handlers.utils.prefetch import Prefetcher
 from cinemabot.infrastructure import settings
-from cinemabot.infrastructure.clients import kinopoisk
+from cinemabot.infrastructure.cache import AbstractCache, MemoryCache, RedisCache, StaleWhileRevalidateCache
+from cinemabot.infrastructure.clients import kinopoisk, rate_limit
 from cinemabot.infrastructure.database import session_provider
+from cinemabot.infrastructure.repository.asyncpg_storage import AsyncpgStorageRepository
+from cinemabot.infrastructure.repository.cached_pages import CachedPagesStorageRepository
+from cinemabot.infrastructure.repository.memory import MemoryStorageRepository
+from cinemabot.infrastructure.repository.sqlite import SqliteStorageRepository
 from cinemabot.infrastructure.repository.storage import StorageRepository
+from cinemabot.infrastructure.repository.write_behind import WriteBehindStorageRepository
+
 
+logger = logging.getLogger(__name__)
 
 _settings: settings.Settings | None = None
 _dispatcher: aiogram.Dispatcher | None = None
@@ -15,6 +35,10 @@ _bot: aiogram.Bot | None = None
 _session_provider: session_provider.AsyncPostgresSessionProvider | None = None
 _storage_repository: AbstractStorageRepository | None = None
 _kinopoisk_client: kinopoisk.KinopoiskClient | None = None  # TODO: правильнее будет определить абстрактный data source
+_redis: aioredis.Redis | None = None
+_prefetcher: Prefetcher | None = None
+_top_cache: AbstractCache | None = None
+_exporter: Exporter | None = None
 
 
 def get_settings() -> settings.Settings:
@@ -24,17 +48,27 @@ def get_settings() -> settings.Settings:
     return _settings
 
 
-async def get_dispatcher_and_bot() -> tuple[aiogram.Dispatcher, aiogram.Bot]:
+async def get_dispatcher_and_bot(bot_session: BaseSession | None = None) -> tuple[aiogram.Dispatcher, aiogram.Bot]:
+    """`bot_session` позволяет подменить сессию Bot API, например, заглушкой из `benchmarks.fake_telegram`."""
     global _dispatcher, _bot
     if not _dispatcher or not _bot:
         settings = get_settings()
-        _bot = aiogram.Bot(token=settings.bot.token)
-        _dispatcher = aiogram.Dispatcher()  # TODO: add storage storage=RedisStorage2(host="cinemabot_redis")
+        _bot = aiogram.Bot(token=settings.bot.token, session=bot_session)
+        _dispatcher = aiogram.Dispatcher(storage=_create_fsm_storage())
+
+        _dispatcher.startup.register(on_startup)
+        _dispatcher.shutdown.register(on_shutdown)
+
+        # единица работы нужна только репозиторию на ORM, остальные бэкенды не ходят в базу через сессии
+        if settings.storage.backend == "sqlalchemy":
+            _dispatcher.update.middleware(UnitOfWorkMiddleware(get_session_provider()))
 
         _dispatcher.include_router(handlers.start_router)
         _dispatcher.include_router(handlers.find_router)
         _dispatcher.include_router(handlers.stats_router)
         _dispatcher.include_router(handlers.history_router)
+        _dispatcher.include_router(handlers.top_router)
+        _dispatcher.include_router(handlers.export_router)
         _dispatcher.include_router(handlers.help_router)
 
         # Установка команд бота
@@ -44,11 +78,33 @@ async def get_dispatcher_and_bot() -> tuple[aiogram.Dispatcher, aiogram.Bot]:
             BotCommand(command="/find", description="Найти фильм по названию"),
             BotCommand(command="/history", description="Посмотреть историю поиска"),
             BotCommand(command="/stats", description="Посмотреть статистику показа фильмов"),
+            BotCommand(command="/top", description="Посмотреть самые популярные фильмы"),
+            BotCommand(command="/export", description="Выгрузить историю поиска и статистику файлами"),
         ]
         await _bot.set_my_commands(commands)
     return _dispatcher, _bot
 
 
+async def on_startup() -> None:
+    await get_kinopoisk_client().start()
+    if get_settings().storage.backend == "sqlalchemy":
+        await get_session_provider().start()
+    await get_storage_repository().start()
+
+
+async def on_shutdown() -> None:
+    global _redis
+    await get_prefetcher().close()
+    await get_exporter().close()
+    await get_kinopoisk_client().close()
+    await get_storage_repository().close()
+    if _session_provider is not None:
+        await _session_provider.close()
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+
+
 def get_session_provider() -> session_provider.AsyncPostgresSessionProvider:
     global _session_provider
     if _session_provider is None:
@@ -62,12 +118,122 @@ def get_session_provider() -> session_provider.AsyncPostgresSessionProvider:
 def get_storage_repository() -> AbstractStorageRepository:
     global _storage_repository
     if _storage_repository is None:
-        _storage_repository = StorageRepository(
-            session_provider=get_session_provider(),
-        )
+        settings = get_settings()
+        if settings.storage.backend == "asyncpg":
+            _storage_repository = AsyncpgStorageRepository(
+                connection_settings=settings.postgres,
+                known_users_max_size=settings.storage.known_users_max_size,
+                films_max_size=settings.storage.films_max_size,
+                warm_up=settings.storage.warm_up,
+            )
+        elif settings.storage.backend == "memory":
+            _storage_repository = MemoryStorageRepository()
+        elif settings.storage.backend == "sqlite":
+            _storage_repository = SqliteStorageRepository(path=settings.storage.sqlite_path)
+        else:
+            _storage_repository = StorageRepository(
+                session_provider=get_session_provider(),
+                known_users_max_size=settings.storage.known_users_max_size,
+                films_max_size=settings.storage.films_max_size,
+                warm_up=settings.storage.warm_up,
+            )
+        if settings.write_behind.enabled:
+            _storage_repository = WriteBehindStorageRepository(
+                repository=_storage_repository,
+                flush_interval=settings.write_behind.flush_interval_ms / 1000,
+                flush_max_items=settings.write_behind.flush_max_items,
+                max_pending_items=settings.write_behind.max_pending_items,
+                # у репозитория на ORM пачка пишется одной транзакцией: вложенные сессии фиксируются внешней
+                transaction=get_session_provider().session if settings.storage.backend == "sqlalchemy" else None,
+            )
+        if settings.cache.first_pages_enabled:
+            _storage_repository = CachedPagesStorageRepository(
+                repository=_storage_repository,
+                history_cache=_create_cache(
+                    prefix="storage:history",
+                    ttl=settings.cache.first_pages_ttl,
+                    max_size=settings.cache.first_pages_max_size,
+                ),
+                stats_cache=_create_cache(
+                    prefix="storage:stats",
+                    ttl=settings.cache.first_pages_ttl,
+                    max_size=settings.cache.first_pages_max_size,
+                ),
+                cached_entries=settings.cache.first_pages_entries,
+                session_provider=get_session_provider() if settings.storage.backend == "sqlalchemy" else None,
+            )
     return _storage_repository
 
 
+def get_top_cache() -> AbstractCache:
+    """Кэш готовых текстов /top по периодам."""
+    global _top_cache
+    if _top_cache is None:
+        settings = get_settings()
+        _top_cache = _create_cache(prefix="top", ttl=settings.cache.top_ttl, max_size=len(TopPeriod))
+    return _top_cache
+
+
+def get_redis() -> aioredis.Redis:
+    global _redis
+    if _redis is None:
+        settings = get_settings()
+        _redis = aioredis.Redis.from_url(settings.redis.url.get_secret_value())
+    return _redis
+
+
+def _create_fsm_storage() -> BaseStorage:
+    settings = get_settings()
+    if settings.fsm.backend == "redis":
+        # TTL продлевается при каждой записи, так что удаляются только состояния неактивных пользователей
+        return RedisStorage(redis=get_redis(), state_ttl=settings.fsm.ttl, data_ttl=settings.fsm.ttl)
+    return MemoryStorage()
+
+
+def _create_cache(prefix: str, ttl: float, max_size: int) -> AbstractCache:
+    settings = get_settings()
+    if settings.cache.backend == "redis":
+        return RedisCache(client=get_redis(), ttl=ttl, prefix=prefix)
+    return MemoryCache(ttl=ttl, max_size=max_size)
+
+
+def _uses_redis() -> bool:
+    settings = get_settings()
+    return settings.cache.backend == "redis" or settings.fsm.backend == "redis"
+
+
+def _create_rate_limiter() -> rate_limit.RateLimiter:
+    settings = get_settings()
+    quota: rate_limit.DailyQuota | None = None
+    if settings.kinopoisk.daily_quota is not None:
+        # квота одна на ключ API, поэтому считаем её в Redis, если он вообще используется, а не только для кэша
+        if _uses_redis():
+            quota = rate_limit.RedisDailyQuota(
+                client=get_redis(),
+                prefix="kinopoisk:quota",
+                limit=settings.kinopoisk.daily_quota,
+                degrade_threshold=settings.kinopoisk.daily_quota_degrade_threshold,
+            )
+        else:
+            logger.warning(
+                "Kinopoisk daily quota is not shared: it is counted per process and reset on restart, use a redis cache or FSM backend",
+            )
+            quota = rate_limit.DailyQuota(
+                limit=settings.kinopoisk.daily_quota,
+                degrade_threshold=settings.kinopoisk.daily_quota_degrade_threshold,
+            )
+    return rate_limit.RateLimiter(
+        bucket=rate_limit.TokenBucket(
+            rate=settings.kinopoisk.requests_per_second,
+            capacity=settings.kinopoisk.burst,
+            background_reserve=settings.kinopoisk.background_reserve,
+            interactive_max_wait=settings.kinopoisk.interactive_max_wait,
+            background_max_wait=settings.kinopoisk.background_max_wait,
+        ),
+        quota=quota,
+    )
+
+
 def get_kinopoisk_client() -> kinopoisk.KinopoiskClient:
     global _kinopoisk_client
     if _kinopoisk_client is None:
@@ -75,5 +241,54 @@ def get_kinopoisk_client() -> kinopoisk.KinopoiskClient:
         _kinopoisk_client = kinopoisk.KinopoiskClient(
             base_url=settings.kinopoisk.base_url,
             api_key=settings.kinopoisk.api_key,
+            search_cache=_create_cache(
+                prefix="kinopoisk:search",
+                ttl=settings.cache.search_ttl,
+                max_size=settings.cache.search_max_size,
+            ),
+            details_cache=StaleWhileRevalidateCache(
+                cache=_create_cache(
+                    prefix="kinopoisk:details",
+                    ttl=settings.cache.details_ttl,
+                    max_size=settings.cache.details_max_size,
+                ),
+                soft_ttl=settings.cache.details_soft_ttl,
+            ),
+            image_size_cache=_create_cache(
+                prefix="kinopoisk:image_size",
+                ttl=settings.cache.image_size_ttl,
+                max_size=settings.cache.image_size_max_size,
+            ),
+            # всегда в памяти: мусорные запросы не должны вытеснять полезные записи из общего кэша в Redis
+            not_found_cache=MemoryCache(
+                ttl=settings.cache.not_found_ttl,
+                max_size=settings.cache.not_found_max_size,
+            ),
+            rate_limiter=_create_rate_limiter(),
+            connection_limit=settings.kinopoisk.connection_limit,
+            connection_limit_per_host=settings.kinopoisk.connection_limit_per_host,
+            keepalive_timeout=settings.kinopoisk.keepalive_timeout,
+            dns_cache_ttl=settings.kinopoisk.dns_cache_ttl,
+            connect_timeout=settings.kinopoisk.connect_timeout,
+            read_timeout=settings.kinopoisk.read_timeout,
         )
     return _kinopoisk_client
+
+
+def get_prefetcher() -> Prefetcher:
+    global _prefetcher
+    if _prefetcher is None:
+        settings = get_settings()
+        _prefetcher = Prefetcher(max_tasks_per_user=settings.prefetch.max_tasks_per_user)
+    return _prefetcher
+
+
+def get_exporter() -> Exporter:
+    global _exporter
+    if _exporter is None:
+        if _uses_redis():
+            # выгрузка большой истории занимает минуты, а блокировка упавшего процесса не должна висеть долго
+            _exporter = RedisExporter(client=get_redis(), prefix="export:lock", lock_ttl=dt.timedelta(minutes=30))
+        else:
+            _exporter = Exporter()
+    return _exporter
@@ -0,0 +1,150 @@
+import dataclasses
+import datetime as dt
+import enum
+import uuid
+from typing import NamedTuple
+
+
+class UserRecord(NamedTuple):
+    id: int
+
+
+class FilmRecord(NamedTuple):
+    id: uuid.UUID
+    kinopoisk_id: int
+    name_ru: str
+    name_eng: str
+    poster_size: int | None
+
+
+class UserFilmViewRecord(NamedTuple):
+    user_id: int
+    film_id: uuid.UUID
+    views: int
+
+
+class HistoryRecord(NamedTuple):
+    user_id: int
+    request_text: str
+    created_at: dt.datetime
+    # id генерируется при создании записи, чтобы её можно было показать в истории до записи в базу
+    id: uuid.UUID
+
+    @classmethod
+    def new(cls, user_id: int, request_text: str) -> "HistoryRecord":
+        return cls(user_id=user_id, request_text=request_text, created_at=dt.datetime.now(dt.timezone.utc), id=uuid.uuid4())
+
+
+@dataclasses.dataclass
+class FilmViewIncrement:
+    user_id: int
+    film_kinopoisk_id: int
+    film_name_ru: str | None
+    film_name_eng: str | None
+    poster_size: int | None = None
+    views: int = 1
+
+
+class HistoryCursor(NamedTuple):
+    """Позиция в истории поиска: следующая страница начинается с записей старше этой."""
+
+    created_at: dt.datetime
+    id: uuid.UUID
+
+    def to_state(self) -> list[str]:
+        return [self.created_at.isoformat(), str(self.id)]
+
+    @classmethod
+    def from_state(cls, state_data: list[str]) -> "HistoryCursor":
+        return cls(created_at=dt.datetime.fromisoformat(state_data[0]), id=uuid.UUID(state_data[1]))
+
+
+class HistoryEntry(NamedTuple):
+    id: uuid.UUID
+    request_text: str
+    created_at: dt.datetime
+
+    @property
+    def cursor(self) -> HistoryCursor:
+        return HistoryCursor(created_at=self.created_at, id=self.id)
+
+
+class StatsCursor(NamedTuple):
+    """Позиция в статистике показов: следующая страница начинается с фильмов, показанных меньше раз."""
+
+    views: int
+    film_id: uuid.UUID
+
+    def to_state(self) -> list[int | str]:
+        return [self.views, str(self.film_id)]
+
+    @classmethod
+    def from_state(cls, state_data: list[int | str]) -> "StatsCursor":
+        return cls(views=int(state_data[0]), film_id=uuid.UUID(str(state_data[1])))
+
+
+class FilmStat(NamedTuple):
+    film_id: uuid.UUID
+    kinopoisk_id: int
+    name_ru: str
+    views: int
+
+    @property
+    def cursor(self) -> StatsCursor:
+        return StatsCursor(views=self.views, film_id=self.film_id)
+
+
+class TopPeriod(str, enum.Enum):
+    """Период общего топа фильмов: календарные день и неделя по UTC или всё время."""
+
+    day = "day"
+    week = "week"
+    all = "all"
+
+    def bucket(self, at: dt.datetime) -> dt.date:
+        """Начало периода, в счётчик которого попадает показ в момент `at`."""
+        day = at.astimezone(dt.timezone.utc).date()
+        if self is TopPeriod.day:
+            return day
+        if self is TopPeriod.week:
+            return day - dt.timedelta(days=day.weekday())
+        return ALL_TIME_BUCKET
+
+
+# у счётчиков за всё время один период, которому нужна какая-то дата
+ALL_TIME_BUCKET = dt.date(1970, 1, 1)
+
+
+class PopularityIncrement(NamedTuple):
+    period: TopPeriod
+    bucket: dt.date
+    film_kinopoisk_id: int
+    views: int
+
+    @classmethod
+    def from_views(cls, increments: list[FilmViewIncrement], at: dt.datetime) -> list["PopularityIncrement"]:
+        """Прибавки к общим счётчикам фильмов за каждый период, по одной на фильм и период, в стабильном порядке."""
+        views_per_film: dict[int, int] = {}
+        for increment in increments:
+            views_per_film[increment.film_kinopoisk_id] = views_per_film.get(increment.film_kinopoisk_id, 0) + increment.views
+        return sorted(
+            cls(period=period, bucket=period.bucket(at), film_kinopoisk_id=kinopoisk_id, views=views)
+            for period in TopPeriod
+            for kinopoisk_id, views in views_per_film.items()
+        )
+
+
+__all__ = [
+    "UserRecord",
+    "FilmRecord",
+    "UserFilmViewRecord",
+    "HistoryRecord",
+    "FilmViewIncrement",
+    "HistoryCursor",
+    "HistoryEntry",
+    "StatsCursor",
+    "FilmStat",
+    "TopPeriod",
+    "ALL_TIME_BUCKET",
+    "PopularityIncrement",
+]
@@ -1,6 +1,19 @@
 import abc
+import typing as tp
+import uuid
 
-from cinemabot.infrastructure.database.schemas import Film, SearchHistory, User, UserFilmView
+from cinemabot.domain.models import (
+    FilmRecord,
+    FilmStat,
+    FilmViewIncrement,
+    HistoryCursor,
+    HistoryEntry,
+    HistoryRecord,
+    StatsCursor,
+    TopPeriod,
+    UserFilmViewRecord,
+    UserRecord,
+)
 
 
 # TODO: split to separate repositories
@@ -10,7 +23,7 @@ class AbstractStorageRepository(abc.ABC):
         self,
         user_id: int,
         get_or_create: bool = False,
-    ) -> User: ...
+    ) -> UserRecord: ...
 
     @abc.abstractmethod
     async def get_or_create_film(
@@ -18,14 +31,21 @@ class AbstractStorageRepository(abc.ABC):
         film_kinopoisk_id: int,
         film_name_ru: str,
         film_name_eng: str,
-    ) -> Film: ...
+        poster_size: int | None = None,
+    ) -> FilmRecord: ...
+
+    @abc.abstractmethod
+    async def get_film_poster_size(
+        self,
+        film_kinopoisk_id: int,
+    ) -> int | None: ...
 
     @abc.abstractmethod
     async def get_or_create_user_film_view(
         self,
         user_id: int,
-        film_id: int,
-    ) -> UserFilmView: ...
+        film_id: uuid.UUID,
+    ) -> UserFilmViewRecord: ...
 
     @abc.abstractmethod
     async def add_request_to_history(
@@ -34,6 +54,12 @@ class AbstractStorageRepository(abc.ABC):
         request_text: str,
     ) -> None: ...
 
+    @abc.abstractmethod
+    async def add_requests_to_history(
+        self,
+        records: list[HistoryRecord],
+    ) -> None: ...
+
     @abc.abstractmethod
     async def increase_number_of_film_view(
         self,
@@ -41,19 +67,59 @@ class AbstractStorageRepository(abc.ABC):
         film_kinopoisk_id: int,
         film_name_ru: str,
         film_name_eng: str,
+        poster_size: int | None = None,
+    ) -> None: ...
+
+    @abc.abstractmethod
+    async def increase_number_of_film_views(
+        self,
+        increments: list[FilmViewIncrement],
     ) -> None: ...
 
     @abc.abstractmethod
     async def get_search_history(
         self,
         user_id: int,
-        page_number: int,
+        after: HistoryCursor | None = None,
         page_size: int = 10,
-    ) -> list[SearchHistory]: ...
+    ) -> list[HistoryEntry]:
+        """Страница истории поиска от новых запросов к старым, начиная сразу после `after`."""
 
+    @abc.abstractmethod
     async def get_stats(
         self,
         user_id: int,
-        page_number: int,
+        after: StatsCursor | None = None,
         page_size: int = 10,
-    ) -> list[tuple[int, str]]: ...
+    ) -> list[FilmStat]:
+        """Страница статистики показов от самых просматриваемых фильмов, начиная сразу после `after`."""
+
+    @abc.abstractmethod
+    def stream_search_history(
+        self,
+        user_id: int,
+        chunk_size: int = 1000,
+    ) -> tp.AsyncIterator[HistoryEntry]:
+        """Вся история поиска от новых запросов к старым; из базы читается по `chunk_size` строк, а не целиком."""
+
+    @abc.abstractmethod
+    def stream_stats(
+        self,
+        user_id: int,
+        chunk_size: int = 1000,
+    ) -> tp.AsyncIterator[FilmStat]:
+        """Вся статистика показов от самых просматриваемых фильмов; из базы читается по `chunk_size` строк."""
+
+    @abc.abstractmethod
+    async def get_top_films(
+        self,
+        period: TopPeriod,
+        limit: int = 10,
+    ) -> list[FilmStat]:
+        """Фильмы, которые чаще всего показывали всем пользователям за текущий день, неделю или всё время."""
+
+    async def start(self) -> None:
+        """Подготавливает репозиторий к работе, например, прогревает кэши."""
+
+    async def close(self) -> None:
+        """Дописывает отложенные изменения и освобождает ресурсы репозитория."""
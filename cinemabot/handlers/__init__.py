@@ -1,8 +1,10 @@
+from cinemabot.handlers.export import router as export_router
 from cinemabot.handlers.find import router as find_router
 from cinemabot.handlers.help import router as help_router
 from cinemabot.handlers.history import router as history_router
 from cinemabot.handlers.start import router as start_router
 from cinemabot.handlers.stats import router as stats_router
+from cinemabot.handlers.top import router as top_router
 
 
 __all__ = [
@@ -11,4 +13,6 @@ __all__ = [
     "stats_router",
     "find_router",
     "history_router",
+    "top_router",
+    "export_router",
 ]
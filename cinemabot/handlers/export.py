@@ -0,0 +1,69 @@
+import pathlib
+import tempfile
+import typing as tp
+
+import aiogram
+from aiogram import filters, types
+
+from cinemabot import dependencies
+from cinemabot.domain.models import FilmStat, HistoryEntry
+from cinemabot.handlers.utils.export import EXPORT_FORMATS, write_rows
+
+
+router = aiogram.Router()
+
+# сколько строк читается из базы за раз: память не растёт с размером истории
+EXPORT_CHUNK_SIZE = 1000
+
+
+async def _history_rows(entries: tp.AsyncIterator[HistoryEntry]) -> tp.AsyncIterator[dict[str, tp.Any]]:
+    async for entry in entries:
+        yield {"created_at": entry.created_at.isoformat(), "request_text": entry.request_text}
+
+
+async def _stats_rows(stats: tp.AsyncIterator[FilmStat]) -> tp.AsyncIterator[dict[str, tp.Any]]:
+    async for stat in stats:
+        yield {"kinopoisk_id": stat.kinopoisk_id, "name_ru": stat.name_ru, "views": stat.views}
+
+
+async def _export(bot: aiogram.Bot, chat_id: int, user_id: int, export_format: str) -> None:
+    storage = dependencies.get_storage_repository()
+    # строки создаются только перед записью файла: генератор, который так и не начали читать, некому закрыть
+    exports: list[tuple[str, str, tp.Callable[[], tp.AsyncIterator[dict[str, tp.Any]]], list[str]]] = [
+        ("history", "История поиска", lambda: _history_rows(storage.stream_search_history(user_id, EXPORT_CHUNK_SIZE)), ["created_at", "request_text"]),
+        ("stats", "Статистика показов фильмов", lambda: _stats_rows(storage.stream_stats(user_id, EXPORT_CHUNK_SIZE)), ["kinopoisk_id", "name_ru", "views"]),
+    ]
+    sent = False
+    try:
+        with tempfile.TemporaryDirectory(prefix="cinemabot-export-") as directory:
+            for name, caption, make_rows, fieldnames in exports:
+                path = pathlib.Path(directory) / f"{name}.{export_format}"
+                if await write_rows(path, make_rows(), export_format, fieldnames):
+                    await bot.send_document(chat_id=chat_id, document=types.FSInputFile(path), caption=caption)
+                    sent = True
+    except Exception:
+        await bot.send_message(chat_id=chat_id, text="Не получилось подготовить выгрузку, попробуйте позже")
+        raise
+    if not sent:
+        await bot.send_message(chat_id=chat_id, text="Выгружать пока нечего. Попробуйте поискать что-нибудь командой `/find`", parse_mode="markdown")
+
+
+@router.message(filters.Command("export"))
+async def export_command_executor(message: types.Message, command: filters.CommandObject) -> None:
+    export_format = (command.args or EXPORT_FORMATS[0]).strip().lower()
+    if export_format not in EXPORT_FORMATS:
+        await message.answer(
+            f"Не знаю такой формат. Доступные форматы: {', '.join(f'`{name}`' for name in EXPORT_FORMATS)}, например `/export csv`",
+            parse_mode="markdown",
+        )
+        return
+
+    exporter = dependencies.get_exporter()
+    scheduled = await exporter.schedule(
+        message.from_user.id,
+        lambda: _export(message.bot, message.chat.id, message.from_user.id, export_format),
+    )
+    if not scheduled:
+        await message.answer("Выгрузка уже готовится, файлы придут в этот чат")
+        return
+    await message.answer("Готовлю выгрузку истории поиска и статистики, файлы придут в этот чат")
@@ -1,3 +1,4 @@
+import dataclasses
 from typing import Any
 
 import aiogram
@@ -14,8 +15,9 @@ from cinemabot.handlers.utils.process_film_info import (
     process_base_film_info,
     process_detail_film_info,
 )
+from cinemabot.handlers.utils.search_cursor import SearchCursor
 from cinemabot.handlers.utils.state import get_state_safe
-from cinemabot.infrastructure.clients import kinopoisk
+from cinemabot.infrastructure.clients import kinopoisk, rate_limit
 from cinemabot.state import UserState
 
 
@@ -27,15 +29,43 @@ async def get_search_result(film_name: str) -> dict[str, Any]:
     return await client.search_film_with_keyword(film_name)
 
 
-async def get_film_detail(film_kinopoisk_id: int) -> dict[str, Any]:
+async def get_film_detail(film_kinopoisk_id: int, priority: rate_limit.Priority = rate_limit.Priority.INTERACTIVE) -> dict[str, Any]:
     client = dependencies.get_kinopoisk_client()
-    return await client.get_film_details(film_kinopoisk_id)
+    return await client.get_film_details(film_kinopoisk_id, priority=priority)
 
 
 async def get_poster_size(film_info: dict[str, Any]) -> dict[str, Any]:
+    # размер постера уже показанного фильма сохранён в базе, в сеть идём только за новыми фильмами
+    storage = dependencies.get_storage_repository()
+    poster_size = await storage.get_film_poster_size(film_info["filmId"])
+    if poster_size is None:
+        client = dependencies.get_kinopoisk_client()
+        poster_size = await client.get_image_size(film_info["posterUrl"])
+    # ответ поиска может лежать в кэше, поэтому не изменяем его на месте
+    return {**film_info, "poster_size": poster_size}
+
+
+def prefetch_next_card(user_id: int, cursor: SearchCursor, films: list[dict[str, Any]]) -> None:
+    """
+    Пока пользователь смотрит текущую карточку, подгружает размер постера следующей и описание текущей.
+
+    Если до конца страницы поиска осталось немного фильмов, подгружает и следующую страницу. Она запускается первой:
+    холодный запрос страницы пользователь ждёт дольше всего, а бюджет могут занимать подгрузки предыдущих карточек.
+    """
+    settings = dependencies.get_settings()
+    if not settings.prefetch.enabled:
+        return
+    prefetcher = dependencies.get_prefetcher()
     client = dependencies.get_kinopoisk_client()
-    film_info.update({"poster_size": await client.get_image_size(film_info["posterUrl"])})
-    return film_info
+    if cursor.has_next_page and len(films) - cursor.index <= settings.prefetch.next_page_threshold:
+        page_cursor = dataclasses.replace(cursor)
+        prefetcher.schedule(user_id, lambda: page_cursor.prefetch_next_page(client))
+    if cursor.index + 1 < len(films):
+        next_film = films[cursor.index + 1]
+        prefetcher.schedule(user_id, lambda: get_poster_size(next_film))
+    if settings.prefetch.details and cursor.film_id is not None:
+        current_film_id = cursor.film_id
+        prefetcher.schedule(user_id, lambda: get_film_detail(current_film_id, priority=rate_limit.Priority.BACKGROUND))
 
 
 @router.message(filters.Command("find"))
@@ -49,6 +79,9 @@ async def find_command_executor(message: types.Message, state: FSMContext) -> No
         )
         return
 
+    # подгрузка для предыдущего поиска больше не нужна
+    dependencies.get_prefetcher().cancel(message.from_user.id)
+
     storage = dependencies.get_storage_repository()
     await storage.add_request_to_history(
         user_id=message.from_user.id,
@@ -60,13 +93,17 @@ async def find_command_executor(message: types.Message, state: FSMContext) -> No
     except kinopoisk.FilmNotFoundError:
         await message.answer(f"К сожалению нам не удалось найти фильм с названием '{film_name}'")
         return
+    except rate_limit.RateLimitExceededError:
+        await message.answer("Сейчас слишком много запросов, попробуйте повторить поиск чуть позже")
+        return
 
     await state.set_state(UserState.find_state.state)
     state_data = await get_state_safe(state)
     film_info = film_info_from_client["films"][0]
+    cursor = SearchCursor(keyword=film_name, pages_count=film_info_from_client.get("pagesCount") or 1, film_id=film_info["filmId"])
     film_info = await get_poster_size(film_info)
     base_film_info = process_base_film_info(film_info)
-    state_data.update({"find_result": film_info_from_client, "find_last_viewed": base_film_info})
+    state_data["find"] = cursor.to_state()
     await state.set_data(state_data)
 
     await storage.increase_number_of_film_view(
@@ -74,6 +111,7 @@ async def find_command_executor(message: types.Message, state: FSMContext) -> No
         film_kinopoisk_id=base_film_info["kinopoisk_id"],
         film_name_ru=base_film_info["name_ru"],  # if film does not exist in database yet
         film_name_eng=base_film_info["name_eng"],
+        poster_size=base_film_info["poster_size"],
     )
 
     await message.answer_photo(
@@ -84,6 +122,7 @@ async def find_command_executor(message: types.Message, state: FSMContext) -> No
         parse_mode="markdown",
         reply_markup=construct_keyboard_markup_for_find(),
     )
+    prefetch_next_card(message.from_user.id, cursor, film_info_from_client["films"])
 
 
 @router.callback_query(
@@ -92,16 +131,16 @@ async def find_command_executor(message: types.Message, state: FSMContext) -> No
 )
 async def next_movie_in_find(callback_query: types.CallbackQuery, state: FSMContext) -> None:
     state_data = await get_state_safe(state)
-    kinopoisk_id = state_data["find_last_viewed"]["kinopoisk_id"]
-
-    prev_res = state_data["find_result"]
+    cursor = SearchCursor.from_state(state_data["find"])
+    client = dependencies.get_kinopoisk_client()
 
-    next_film: dict[str, Any] | None = None
-    for index, film in enumerate(prev_res["films"]):
-        if film["filmId"] == kinopoisk_id:
-            if index != len(prev_res["films"]) - 1:
-                next_film = prev_res["films"][index + 1]
-            break
+    try:
+        next_film = await cursor.advance(client)
+    except rate_limit.RateLimitExceededError:
+        await callback_query.message.answer("Сейчас слишком много запросов, попробуйте чуть позже")
+        return
+    except kinopoisk.FilmNotFoundError:
+        next_film = None
 
     if next_film is None:
         await callback_query.message.answer(
@@ -109,10 +148,11 @@ async def next_movie_in_find(callback_query: types.CallbackQuery, state: FSMCont
             "Можете начать новый поиск по команде `/find`",
             parse_mode="markdown",
         )
+        return
 
     next_film = await get_poster_size(next_film)
-    base_film_info: dict[str, Any] = process_base_film_info(next_film)  # type: ignore
-    state_data.update({"find_last_viewed": base_film_info})
+    base_film_info = process_base_film_info(next_film)
+    state_data["find"] = cursor.to_state()
     await state.set_data(state_data)
 
     storage = dependencies.get_storage_repository()
@@ -121,6 +161,7 @@ async def next_movie_in_find(callback_query: types.CallbackQuery, state: FSMCont
         film_kinopoisk_id=base_film_info["kinopoisk_id"],
         film_name_ru=base_film_info["name_ru"],  # if film does not exist in database yet
         film_name_eng=base_film_info["name_eng"],
+        poster_size=base_film_info["poster_size"],
     )
 
     await callback_query.message.answer_photo(
@@ -131,6 +172,7 @@ async def next_movie_in_find(callback_query: types.CallbackQuery, state: FSMCont
         parse_mode="markdown",
         reply_markup=construct_keyboard_markup_for_find(),
     )
+    prefetch_next_card(callback_query.message.chat.id, cursor, await cursor.films(client))
 
 
 @router.callback_query(
@@ -139,17 +181,25 @@ async def next_movie_in_find(callback_query: types.CallbackQuery, state: FSMCont
 )
 async def movie_description_in_find(callback_query: types.CallbackQuery, state: FSMContext) -> None:
     state_data = await get_state_safe(state)
-    kinopoisk_id = state_data["find_last_viewed"]["kinopoisk_id"]
+    cursor = SearchCursor.from_state(state_data["find"])
 
     try:
-        film_details_from_api = await get_film_detail(kinopoisk_id)
-        film_details_from_api["poster_size"] = state_data["find_last_viewed"]["poster_size"]
-        film_details = process_detail_film_info(film_details_from_api)
+        film_id = cursor.film_id
+        if film_id is None:
+            # состояние сохранено до появления film_id: ищем фильм по позиции в результатах поиска
+            film_info = await cursor.current(dependencies.get_kinopoisk_client())
+            film_id = film_info["filmId"] if film_info is not None else None
+        if film_id is None:
+            raise kinopoisk.FilmNotFoundError
+        film_details_from_api = await get_film_detail(film_id)
+        # размер постера сохранён в базе при показе карточки
+        poster_size = await dependencies.get_storage_repository().get_film_poster_size(film_id)
+        film_details = process_detail_film_info({**film_details_from_api, "poster_size": poster_size})
     except kinopoisk.FilmNotFoundError:
-        await callback_query.message.answer(
-            "Извините, сервис временно недоступен",
-            parse_mode="markdown",
-        )
+        await callback_query.message.answer("К сожалению не удалось загрузить описание этого фильма")
+        return
+    except rate_limit.RateLimitExceededError:
+        await callback_query.message.answer("Сейчас слишком много запросов, попробуйте чуть позже")
         return
 
     await callback_query.message.edit_caption(
@@ -168,6 +218,7 @@ async def cancel_find(callback_query: types.CallbackQuery, state: FSMContext) ->
     state_data["find"] = None
     await state.set_data(state_data)
     await state.set_state(None)
+    dependencies.get_prefetcher().cancel(callback_query.message.chat.id)
 
     await callback_query.message.answer("Процесс поиска окончен.")
 
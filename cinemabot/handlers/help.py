@@ -17,6 +17,9 @@ async def help_command_executor(message: types.Message) -> None:
         "/stats": "    Посмотреть статистику показа фильмов. "
         "Вы увидите список, состоящий из элементов `(количество_показов_вам) название_фильма`. "
         "Он упорядочен по убыванию количества показов",
+        "/top": "      Посмотреть фильмы, которые чаще всего показывали всем пользователям сегодня, за неделю и за всё время",
+        "/export": "   Выгрузить всю историю поиска и статистику показов файлами. "
+        "По умолчанию в формате CSV, `/export jsonl` - в формате JSON Lines",
         "/help": "      Посмотреть список команд с их описанием. *(Вы здесь)*",
     }
 
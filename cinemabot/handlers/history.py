@@ -3,16 +3,16 @@ from aiogram import filters, types
 from aiogram.fsm.context import FSMContext
 
 from cinemabot import dependencies
+from cinemabot.domain.models import HistoryCursor, HistoryEntry
 from cinemabot.handlers.utils import get_state_safe
 from cinemabot.handlers.utils.keyboard_markup import construct_keyboard_markup_for_history
-from cinemabot.infrastructure.database.schemas import SearchHistory
 from cinemabot.state import UserState
 
 
 router = aiogram.Router()
 
 
-def construct_replay_text_in_history(search_history: list[SearchHistory]) -> str:
+def construct_replay_text_in_history(search_history: list[HistoryEntry]) -> str:
     if not search_history:
         return "Ничего не найдено. Попробуйте поискать что-нибудь командой `/find`"
     res = [f"- ({request.created_at.date()}) `{request.request_text}`" for request in search_history]
@@ -24,16 +24,14 @@ def construct_replay_text_in_history(search_history: list[SearchHistory]) -> str
 async def history_command_executor(message: types.Message, state: FSMContext) -> None:
     await state.set_state(UserState.history_state.state)
 
+    storage = dependencies.get_storage_repository()
+    search_history = await storage.get_search_history(user_id=message.from_user.id)
+
+    # в state хранятся курсоры начала всех открытых страниц (чтобы вернуться назад) и курсор следующей страницы
     state_data = await get_state_safe(state)
-    state_data.update({"history": {"page_number": 1}})
+    state_data.update({"history": {"cursors": [None], "next": search_history[-1].cursor.to_state() if search_history else None}})
     await state.set_data(state_data)
 
-    storage = dependencies.get_storage_repository()
-    search_history = await storage.get_search_history(
-        user_id=message.from_user.id,
-        page_number=1,
-    )
-
     await message.answer(
         text=construct_replay_text_in_history(search_history),
         parse_mode="markdown",
@@ -47,26 +45,29 @@ async def history_command_executor(message: types.Message, state: FSMContext) ->
 
 async def _get_history_page(callback_query: types.CallbackQuery, state: FSMContext, is_next_page: bool) -> None:
     state_data = await get_state_safe(state)
-    page_number = state_data.get("history", {}).get("page_number", 1)
+    history_state = state_data.get("history", {})
+    cursors = history_state.get("cursors", [None])
 
     if is_next_page:
-        page_number += 1
-    else:
-        page_number -= 1
-
-    state_data.update({"history": {"page_number": page_number}})
-    await state.set_data(state_data)
+        cursors.append(history_state.get("next"))
+    elif len(cursors) > 1:
+        cursors.pop()
 
+    after = HistoryCursor.from_state(cursors[-1]) if cursors[-1] is not None else None
     storage = dependencies.get_storage_repository()
     search_history = await storage.get_search_history(
         user_id=callback_query.message.chat.id,
-        page_number=page_number,
+        after=after,
     )
+
+    state_data.update({"history": {"cursors": cursors, "next": search_history[-1].cursor.to_state() if search_history else None}})
+    await state.set_data(state_data)
+
     await callback_query.message.edit_text(
         text=construct_replay_text_in_history(search_history),
         parse_mode="markdown",
         reply_markup=construct_keyboard_markup_for_history(
-            page_number,
+            len(cursors),
             not search_history,
             len(search_history) == 10,
         ),
@@ -0,0 +1,28 @@
+import typing as tp
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from cinemabot.infrastructure.database.session_provider import AsyncPostgresSessionProvider
+
+
+class UnitOfWorkMiddleware(BaseMiddleware):
+    """
+    Обрабатывает каждое обновление в одной единице работы с базой.
+
+    Все вызовы репозитория из обработчика используют одну сессию (и не больше одного соединения из пула).
+    Каждый вызов фиксируется сразу и возвращает соединение в пул: пока обработчик ждёт Telegram или API Кинопоиска,
+    соединение не простаивает в открытой транзакции.
+    """
+
+    def __init__(self, session_provider: AsyncPostgresSessionProvider) -> None:
+        self._session_provider = session_provider
+
+    async def __call__(
+        self,
+        handler: tp.Callable[[TelegramObject, dict[str, tp.Any]], tp.Awaitable[tp.Any]],
+        event: TelegramObject,
+        data: dict[str, tp.Any],
+    ) -> tp.Any:
+        async with self._session_provider.unit_of_work():
+            return await handler(event, data)
@@ -3,6 +3,7 @@ from aiogram import filters, types
 from aiogram.fsm.context import FSMContext
 
 from cinemabot import dependencies
+from cinemabot.domain.models import FilmStat, StatsCursor
 from cinemabot.handlers.utils import get_state_safe
 from cinemabot.handlers.utils.keyboard_markup import construct_keyboard_markup_for_stats
 from cinemabot.state import UserState
@@ -11,10 +12,10 @@ from cinemabot.state import UserState
 router = aiogram.Router()
 
 
-def _construct_replay_text_in_stats(stats: list[tuple[int, str]]) -> str:
+def _construct_replay_text_in_stats(stats: list[FilmStat]) -> str:
     if not stats:
         return "Больше статистики нет. Попробуйте поискать что-нибудь командой `/find`"
-    res = [f"- ({stat[0]}) `{stat[1]}`" for stat in stats]
+    res = [f"- ({stat.views}) `{stat.name_ru}`" for stat in stats]
 
     title = "*Статистика показов фильмов:*\n\n"
     return title + "\n".join(res)
@@ -24,16 +25,14 @@ def _construct_replay_text_in_stats(stats: list[tuple[int, str]]) -> str:
 async def stats_command_executor(message: types.Message, state: FSMContext) -> None:
     await state.set_state(UserState.stats_state.state)
 
+    storage = dependencies.get_storage_repository()
+    statistic = await storage.get_stats(user_id=message.from_user.id)
+
+    # в state хранятся курсоры начала всех открытых страниц (чтобы вернуться назад) и курсор следующей страницы
     state_data = await get_state_safe(state)
-    state_data.update({"stats": {"page_number": 1}})
+    state_data.update({"stats": {"cursors": [None], "next": statistic[-1].cursor.to_state() if statistic else None}})
     await state.set_data(state_data)
 
-    storage = dependencies.get_storage_repository()
-    statistic = await storage.get_stats(
-        user_id=message.from_user.id,
-        page_number=1,
-    )
-
     await message.answer(
         text=_construct_replay_text_in_stats(statistic),
         parse_mode="markdown",
@@ -47,27 +46,29 @@ async def stats_command_executor(message: types.Message, state: FSMContext) -> N
 
 async def _get_stats_page(callback_query: types.CallbackQuery, state: FSMContext, is_next_page: bool) -> None:
     state_data = await get_state_safe(state)
-    page_number = state_data.get("stats", {}).get("page_number", 1)
+    stats_state = state_data.get("stats", {})
+    cursors = stats_state.get("cursors", [None])
 
     if is_next_page:
-        page_number += 1
-    else:
-        page_number -= 1
-
-    state_data.update({"stats": {"page_number": page_number}})
-    await state.set_data(state_data)
+        cursors.append(stats_state.get("next"))
+    elif len(cursors) > 1:
+        cursors.pop()
 
+    after = StatsCursor.from_state(cursors[-1]) if cursors[-1] is not None else None
     storage = dependencies.get_storage_repository()
-
     statistic = await storage.get_stats(
         user_id=callback_query.message.chat.id,
-        page_number=page_number,
+        after=after,
     )
+
+    state_data.update({"stats": {"cursors": cursors, "next": statistic[-1].cursor.to_state() if statistic else None}})
+    await state.set_data(state_data)
+
     await callback_query.message.edit_text(
         text=_construct_replay_text_in_stats(statistic),
         parse_mode="markdown",
         reply_markup=construct_keyboard_markup_for_stats(
-            page_number,
+            len(cursors),
             not statistic,
             len(statistic) == 10,
         ),
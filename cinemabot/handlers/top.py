@@ -0,0 +1,54 @@
+import aiogram
+from aiogram import filters, types
+
+from cinemabot import dependencies
+from cinemabot.domain.models import FilmStat, TopPeriod
+from cinemabot.handlers.utils.keyboard_markup import construct_keyboard_markup_for_top
+
+
+router = aiogram.Router()
+
+TOP_SIZE = 10
+TOP_TITLE = {
+    TopPeriod.day: "*Популярное сегодня:*\n\n",
+    TopPeriod.week: "*Популярное за неделю:*\n\n",
+    TopPeriod.all: "*Популярное за всё время:*\n\n",
+}
+
+
+def _construct_replay_text_in_top(period: TopPeriod, top: list[FilmStat]) -> str:
+    if not top:
+        return TOP_TITLE[period] + "Пока ничего не смотрели. Попробуйте поискать что-нибудь командой `/find`"
+    res = [f"{place}. `{film.name_ru}` ({film.views})" for place, film in enumerate(top, start=1)]
+    return TOP_TITLE[period] + "\n".join(res)
+
+
+async def _get_top_text(period: TopPeriod) -> str:
+    # топ одинаковый для всех пользователей, поэтому готовый текст кэшируется на несколько секунд,
+    # и частые /top стоят одного запроса к базе на период за это время
+    cache = dependencies.get_top_cache()
+    text = await cache.get(period.value)
+    if text is None:
+        storage = dependencies.get_storage_repository()
+        text = _construct_replay_text_in_top(period, await storage.get_top_films(period, limit=TOP_SIZE))
+        await cache.set(period.value, text)
+    return text
+
+
+@router.message(filters.Command("top"))
+async def top_command_executor(message: types.Message) -> None:
+    await message.answer(
+        text=await _get_top_text(TopPeriod.day),
+        parse_mode="markdown",
+        reply_markup=construct_keyboard_markup_for_top(TopPeriod.day),
+    )
+
+
+@router.callback_query(aiogram.F.data.startswith("top_command_period_"))
+async def top_period(callback_query: types.CallbackQuery) -> None:
+    period = TopPeriod(callback_query.data.removeprefix("top_command_period_"))
+    await callback_query.message.edit_text(
+        text=await _get_top_text(period),
+        parse_mode="markdown",
+        reply_markup=construct_keyboard_markup_for_top(period),
+    )
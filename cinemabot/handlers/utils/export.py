@@ -0,0 +1,130 @@
+import asyncio
+import csv
+import datetime as dt
+import json
+import logging
+import pathlib
+import typing as tp
+import uuid
+
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError, WatchError
+
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("csv", "jsonl")
+
+
+async def write_rows(path: pathlib.Path, rows: tp.AsyncIterator[dict[str, tp.Any]], export_format: str, fieldnames: list[str]) -> int:
+    """Записывает строки в файл по мере чтения из базы и возвращает их количество."""
+    count = 0
+    with path.open("w", encoding="utf-8", newline="") as file:
+        if export_format == "csv":
+            writer = csv.DictWriter(file, fieldnames=fieldnames)
+            writer.writeheader()
+            async for row in rows:
+                writer.writerow(row)
+                count += 1
+        else:
+            async for row in rows:
+                file.write(json.dumps(row, ensure_ascii=False) + "\n")
+                count += 1
+    return count
+
+
+class Exporter:
+    """
+    Фоновые выгрузки всей истории поиска и статистики пользователей в файлы.
+
+    Выгрузка идёт в фоне, чтобы не держать обработку апдейта, пока строки читаются из базы и файл загружается в Telegram.
+    У каждого пользователя одновременно идёт не больше одной выгрузки: повторная команда во время неё отклоняется.
+    Проверка работает в пределах процесса, чтобы она действовала на все реплики бота, используйте `RedisExporter`.
+    """
+
+    def __init__(self) -> None:
+        self._tasks: dict[int, asyncio.Task[None]] = {}
+
+    async def schedule(self, user_id: int, export: tp.Callable[[], tp.Awaitable[tp.Any]]) -> bool:
+        """Запускает выгрузку в фоне. Возвращает False, если у пользователя уже идёт выгрузка."""
+        if user_id in self._tasks or not await self._lock(user_id):
+            return False
+        task = asyncio.create_task(self._run(user_id, export))
+        self._tasks[user_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(user_id, None))
+        return True
+
+    async def close(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, user_id: int, export: tp.Callable[[], tp.Awaitable[tp.Any]]) -> None:
+        try:
+            await export()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Export failed")
+        finally:
+            await self._unlock(user_id)
+
+    async def _lock(self, user_id: int) -> bool:
+        return True
+
+    async def _unlock(self, user_id: int) -> None:
+        pass
+
+
+class RedisExporter(Exporter):
+    """
+    `Exporter`, который не даёт запустить вторую выгрузку пользователя и в других процессах бота.
+
+    На время выгрузки в Redis ставится блокировка `SET NX EX`. Блокировка живёт не дольше `lock_ttl`,
+    чтобы упавший процесс не запретил пользователю выгрузки навсегда. Если Redis недоступен,
+    проверяются только выгрузки этого процесса.
+    """
+
+    def __init__(self, client: aioredis.Redis, prefix: str, lock_ttl: dt.timedelta) -> None:
+        super().__init__()
+        self._client = client
+        self._prefix = prefix
+        self._lock_ttl = lock_ttl
+        # значение блокировки каждого пользователя: снимаем только свою, а не поставленную после её истечения
+        self._tokens: dict[int, str] = {}
+
+    async def _lock(self, user_id: int) -> bool:
+        token = uuid.uuid4().hex
+        try:
+            locked = await self._client.set(self._make_key(user_id), token, nx=True, ex=int(self._lock_ttl.total_seconds()))
+        except RedisError:
+            logger.warning("Failed to lock export in redis, checking only exports of this process", exc_info=True)
+            return True
+        if not locked:
+            return False
+        self._tokens[user_id] = token
+        return True
+
+    async def _unlock(self, user_id: int) -> None:
+        token = self._tokens.pop(user_id, None)
+        if token is None:
+            return
+        key = self._make_key(user_id)
+        try:
+            async with self._client.pipeline(transaction=True) as pipeline:
+                await pipeline.watch(key)
+                value = await pipeline.get(key)
+                if value is None or value.decode() != token:
+                    return
+                pipeline.multi()
+                pipeline.delete(key)
+                await pipeline.execute()
+        except WatchError:
+            # блокировка истекла и её поставил кто-то другой
+            pass
+        except RedisError:
+            logger.warning("Failed to unlock export in redis, it expires by itself", exc_info=True)
+
+    def _make_key(self, user_id: int) -> str:
+        return f"{self._prefix}:{user_id}"
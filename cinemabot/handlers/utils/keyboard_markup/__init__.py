@@ -1,6 +1,7 @@
 from .find import construct_keyboard_markup_for_detail_view, construct_keyboard_markup_for_find
 from .history import construct_keyboard_markup_for_history
 from .stats import construct_keyboard_markup_for_stats
+from .top import construct_keyboard_markup_for_top
 
 
 __all__ = [
@@ -8,4 +9,5 @@ __all__ = [
     "construct_keyboard_markup_for_find",
     "construct_keyboard_markup_for_history",
     "construct_keyboard_markup_for_stats",
+    "construct_keyboard_markup_for_top",
 ]
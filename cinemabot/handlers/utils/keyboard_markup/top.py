@@ -0,0 +1,20 @@
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from cinemabot.domain.models import TopPeriod
+
+
+TOP_PERIOD_BUTTON_TEXT = {
+    TopPeriod.day: "Сегодня",
+    TopPeriod.week: "За неделю",
+    TopPeriod.all: "За всё время",
+}
+
+
+def construct_keyboard_markup_for_top(current_period: TopPeriod) -> InlineKeyboardMarkup:
+    # Кнопки только для других периодов: повторное нажатие на текущий не меняло бы сообщение
+    buttons = [
+        InlineKeyboardButton(text=text, callback_data=f"top_command_period_{period.value}")
+        for period, text in TOP_PERIOD_BUTTON_TEXT.items()
+        if period is not current_period
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
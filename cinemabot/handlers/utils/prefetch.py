@@ -0,0 +1,58 @@
+import asyncio
+import collections
+import logging
+import typing as tp
+
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """
+    Фоновая подгрузка данных, которые скорее всего понадобятся пользователю следующими.
+
+    У каждого пользователя не больше `max_tasks_per_user` одновременных задач: всё, что сверх бюджета, просто не подгружается.
+    Результат задач не используется напрямую — они прогревают кэши клиента, из которых потом читают обработчики.
+    """
+
+    def __init__(self, max_tasks_per_user: int) -> None:
+        self.max_tasks_per_user = max_tasks_per_user
+        self._tasks: collections.defaultdict[int, set[asyncio.Task[tp.Any]]] = collections.defaultdict(set)
+
+    def schedule(self, user_id: int, prefetch: tp.Callable[[], tp.Awaitable[tp.Any]]) -> bool:
+        """Запускает подгрузку в фоне. Возвращает False, если бюджет пользователя исчерпан."""
+        user_tasks = self._tasks[user_id]
+        if len(user_tasks) >= self.max_tasks_per_user:
+            return False
+        task = asyncio.create_task(self._run(prefetch))
+        user_tasks.add(task)
+        task.add_done_callback(lambda done_task: self._forget(user_id, done_task))
+        return True
+
+    def cancel(self, user_id: int) -> None:
+        """Отменяет подгрузку для пользователя, например, если он начал новый поиск."""
+        for task in self._tasks.get(user_id, ()):
+            task.cancel()
+
+    async def close(self) -> None:
+        tasks = [task for user_tasks in self._tasks.values() for task in user_tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, prefetch: tp.Callable[[], tp.Awaitable[tp.Any]]) -> None:
+        try:
+            await prefetch()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # ошибка подгрузки не важна: обработчик повторит запрос сам, когда данные действительно понадобятся
+            logger.debug("Prefetch failed", exc_info=True)
+
+    def _forget(self, user_id: int, task: asyncio.Task[tp.Any]) -> None:
+        user_tasks = self._tasks.get(user_id)
+        if user_tasks is None:
+            return
+        user_tasks.discard(task)
+        if not user_tasks:
+            del self._tasks[user_id]
@@ -2,7 +2,8 @@ from typing import Any
 
 
 def pick_poster_url(film_info: dict[str, Any]) -> str:
-    if film_info["poster_size"] >= 200_000:
+    # если размер неизвестен, безопаснее отдать превью — большие постеры Telegram может не принять
+    if film_info["poster_size"] is None or film_info["poster_size"] >= 200_000:
         return film_info["posterUrlPreview"]
     return film_info["posterUrl"]
 
@@ -0,0 +1,72 @@
+import dataclasses
+from typing import Any
+
+from cinemabot.infrastructure.clients.kinopoisk import KinopoiskClient
+from cinemabot.infrastructure.clients.rate_limit import Priority
+
+
+@dataclasses.dataclass
+class SearchCursor:
+    """
+    Позиция пользователя в результатах поиска по ключевому слову.
+
+    В state хранится только сам курсор: ключ запроса, позиция в результатах и id показанного фильма. Страницы результатов
+    запрашиваются у клиента по мере необходимости и лежат один раз в его общем кэше поиска, а не копируются в state
+    каждого пользователя. Кэш поиска живёт меньше state и может быть у другой реплики, а повторный поиск может вернуть
+    другие результаты, поэтому показанный фильм определяется по `film_id`, а не по позиции.
+    """
+
+    keyword: str
+    page: int = 1
+    index: int = 0
+    pages_count: int = 1
+    film_id: int | None = None
+
+    def to_state(self) -> list[str | int | None]:
+        return [self.keyword, self.page, self.index, self.pages_count, self.film_id]
+
+    @classmethod
+    def from_state(cls, state_data: list[str | int | None]) -> "SearchCursor":
+        # в состояниях, сохранённых до появления film_id, его нет
+        keyword, page, index, pages_count, film_id = [*state_data, None][:5]
+        return cls(
+            keyword=str(keyword),
+            page=int(page),  # type: ignore[arg-type]
+            index=int(index),  # type: ignore[arg-type]
+            pages_count=int(pages_count),  # type: ignore[arg-type]
+            film_id=None if film_id is None else int(film_id),
+        )
+
+    @property
+    def has_next_page(self) -> bool:
+        return self.page < self.pages_count
+
+    async def films(self, client: KinopoiskClient) -> list[dict[str, Any]]:
+        """Фильмы на текущей странице."""
+        search_result = await client.search_film_with_keyword(self.keyword, page=self.page)
+        return search_result["films"]
+
+    async def current(self, client: KinopoiskClient) -> dict[str, Any] | None:
+        """Фильм на текущей позиции или None, если страница стала короче, чем была при показе."""
+        films = await self.films(client)
+        return films[self.index] if self.index < len(films) else None
+
+    async def advance(self, client: KinopoiskClient) -> dict[str, Any] | None:
+        """Сдвигает курсор на следующий фильм и возвращает его, или None, если фильмы закончились."""
+        films = await self.films(client)
+        if self.index + 1 < len(films):
+            self.index += 1
+            film = films[self.index]
+        else:
+            if not self.has_next_page:
+                return None
+            self.page += 1
+            self.index = 0
+            film = await self.current(client)
+            if film is None:
+                return None
+        self.film_id = film["filmId"]
+        return film
+
+    async def prefetch_next_page(self, client: KinopoiskClient) -> None:
+        await client.search_film_with_keyword(self.keyword, page=self.page + 1, priority=Priority.BACKGROUND)
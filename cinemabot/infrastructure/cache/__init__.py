@@ -0,0 +1,14 @@
+from .base import AbstractCache, CacheStats
+from .memory import LRUDict, MemoryCache
+from .redis import RedisCache
+from .swr import StaleWhileRevalidateCache
+
+
+__all__ = [
+    "AbstractCache",
+    "CacheStats",
+    "LRUDict",
+    "MemoryCache",
+    "RedisCache",
+    "StaleWhileRevalidateCache",
+]
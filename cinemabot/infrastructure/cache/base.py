@@ -0,0 +1,84 @@
+import abc
+import dataclasses
+import typing as tp
+
+
+@dataclasses.dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return self.hits / total
+
+
+class AbstractCache(abc.ABC):
+    """
+    Асинхронный key-value кэш с ограниченным временем жизни записей.
+
+    Значения должны сериализоваться в JSON, чтобы backend можно было заменить на Redis без изменения кода клиентов.
+
+    Для значений, которые собираются из базы и потом правятся на месте, у ключа есть ревизия: `update` и `bump_revision`
+    её увеличивают, а `set_if_revision` записывает значение, только если ревизия не изменилась с начала его чтения.
+    Так заполнение кэша не затирает изменения, сделанные в это время другими задачами или репликами.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+    async def get(self, key: str) -> tp.Any | None:
+        value = await self._get(key)
+        if value is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return value
+
+    async def set(self, key: str, value: tp.Any, ttl: float | None = None) -> None:
+        await self._set(key, value, self.ttl if ttl is None else ttl)
+
+    async def delete(self, key: str) -> None:
+        await self._delete(key)
+
+    async def update(self, key: str, update: tp.Callable[[tp.Any], tp.Any | None]) -> None:
+        """Атомарно заменяет значение ключа на `update(value)` (None - удалить) и увеличивает ревизию ключа; отсутствующий ключ не создаётся."""
+        await self._update(key, update, self.ttl)
+
+    async def bump_revision(self, key: str) -> int | None:
+        """Увеличивает ревизию ключа и возвращает новую, None - если ревизию не удалось получить."""
+        return await self._bump_revision(key)
+
+    async def revision(self, key: str) -> int | None:
+        return await self._revision(key)
+
+    async def set_if_revision(self, key: str, value: tp.Any, revision: int | None) -> bool:
+        """Записывает значение, если ревизия ключа всё ещё `revision`. Возвращает, записано ли оно."""
+        if revision is None:
+            return False
+        return await self._set_if_revision(key, value, revision, self.ttl)
+
+    @abc.abstractmethod
+    async def _get(self, key: str) -> tp.Any | None: ...
+
+    @abc.abstractmethod
+    async def _set(self, key: str, value: tp.Any, ttl: float) -> None: ...
+
+    @abc.abstractmethod
+    async def _delete(self, key: str) -> None: ...
+
+    @abc.abstractmethod
+    async def _update(self, key: str, update: tp.Callable[[tp.Any], tp.Any | None], ttl: float) -> None: ...
+
+    @abc.abstractmethod
+    async def _bump_revision(self, key: str) -> int | None: ...
+
+    @abc.abstractmethod
+    async def _revision(self, key: str) -> int | None: ...
+
+    @abc.abstractmethod
+    async def _set_if_revision(self, key: str, value: tp.Any, revision: int, ttl: float) -> bool: ...
@@ -0,0 +1,99 @@
+import collections
+import time
+import typing as tp
+
+from .base import AbstractCache
+
+
+K = tp.TypeVar("K")
+V = tp.TypeVar("V")
+
+
+class LRUDict(tp.Generic[K, V]):
+    """Синхронный словарь ограниченного размера: при переполнении вытесняются давно не использованные ключи."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._data: collections.OrderedDict[K, V] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._data
+
+    def get(self, key: K) -> V | None:
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def put(self, key: K, value: V) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+
+class MemoryCache(AbstractCache):
+    """Кэш в памяти процесса: записи живут не дольше `ttl` секунд, при переполнении вытесняются самые старые по LRU."""
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        super().__init__(ttl=ttl)
+        self.max_size = max_size
+        self._data: collections.OrderedDict[str, tuple[float, tp.Any]] = collections.OrderedDict()
+        # ревизии берутся из одного счётчика: вытесненная и заведённая заново ревизия не совпадёт со старой
+        self._revisions: LRUDict[str, int] = LRUDict(max_size=max_size)
+        self._last_revision = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    async def _get(self, key: str) -> tp.Any | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def _set(self, key: str, value: tp.Any, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    async def _delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    async def _update(self, key: str, update: tp.Callable[[tp.Any], tp.Any | None], ttl: float) -> None:
+        # между чтением и записью нет await, поэтому в одном event loop обновление атомарно
+        self._next_revision(key)
+        value = await self._get(key)
+        if value is None:
+            return
+        new_value = update(value)
+        if new_value is None:
+            await self._delete(key)
+        else:
+            await self._set(key, new_value, ttl)
+
+    async def _bump_revision(self, key: str) -> int | None:
+        return self._next_revision(key)
+
+    async def _revision(self, key: str) -> int | None:
+        return self._revisions.get(key) or 0
+
+    async def _set_if_revision(self, key: str, value: tp.Any, revision: int, ttl: float) -> bool:
+        if (self._revisions.get(key) or 0) != revision:
+            return False
+        await self._set(key, value, ttl)
+        return True
+
+    def _next_revision(self, key: str) -> int:
+        self._last_revision += 1
+        self._revisions.put(key, self._last_revision)
+        return self._last_revision
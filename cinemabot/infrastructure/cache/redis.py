@@ -0,0 +1,122 @@
+import json
+import logging
+import typing as tp
+
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError, WatchError
+
+from .base import AbstractCache
+
+
+logger = logging.getLogger(__name__)
+
+# сколько раз повторять обновление, которому помешала запись с другой реплики
+_UPDATE_ATTEMPTS = 5
+
+
+class RedisCache(AbstractCache):
+    """
+    Кэш в Redis, общий для всех реплик бота.
+
+    Ограничение размера задаётся на стороне Redis (`maxmemory` + `maxmemory-policy allkeys-lru`).
+    Недоступность Redis не должна ломать обработку запросов, поэтому ошибки считаются промахом кэша.
+    Обновления на месте и запись с проверкой ревизии сделаны через WATCH/MULTI, ревизия ключа хранится рядом с ним.
+    """
+
+    def __init__(self, client: aioredis.Redis, ttl: float, prefix: str) -> None:
+        super().__init__(ttl=ttl)
+        self._client = client
+        self._prefix = prefix
+
+    def _make_key(self, key: str) -> str:
+        return f"{self._prefix}:{key}"
+
+    async def _get(self, key: str) -> tp.Any | None:
+        try:
+            raw_value = await self._client.get(self._make_key(key))
+        except RedisError:
+            logger.warning("Failed to read key %s from redis cache", key, exc_info=True)
+            return None
+        if raw_value is None:
+            return None
+        return json.loads(raw_value)
+
+    async def _set(self, key: str, value: tp.Any, ttl: float) -> None:
+        try:
+            await self._client.set(self._make_key(key), json.dumps(value), px=int(ttl * 1000))
+        except RedisError:
+            logger.warning("Failed to write key %s to redis cache", key, exc_info=True)
+
+    async def _delete(self, key: str) -> None:
+        try:
+            await self._client.delete(self._make_key(key))
+        except RedisError:
+            logger.warning("Failed to delete key %s from redis cache", key, exc_info=True)
+
+    def _make_revision_key(self, key: str) -> str:
+        return f"{self._prefix}:{key}:revision"
+
+    async def _update(self, key: str, update: tp.Callable[[tp.Any], tp.Any | None], ttl: float) -> None:
+        redis_key, revision_key = self._make_key(key), self._make_revision_key(key)
+        try:
+            async with self._client.pipeline(transaction=True) as pipeline:
+                for _ in range(_UPDATE_ATTEMPTS):
+                    try:
+                        await pipeline.watch(redis_key)
+                        raw_value = await pipeline.get(redis_key)
+                        pipeline.multi()
+                        pipeline.incr(revision_key)
+                        pipeline.pexpire(revision_key, int(ttl * 1000))
+                        new_value = None if raw_value is None else update(json.loads(raw_value))
+                        if new_value is not None:
+                            pipeline.set(redis_key, json.dumps(new_value), px=int(ttl * 1000))
+                        elif raw_value is not None:
+                            pipeline.delete(redis_key)
+                        await pipeline.execute()
+                        return
+                    except WatchError:
+                        continue
+                # ключ всё время меняют другие реплики: проще удалить значение, чем обновить его
+                pipeline.multi()
+                pipeline.incr(revision_key)
+                pipeline.delete(redis_key)
+                await pipeline.execute()
+        except RedisError:
+            logger.warning("Failed to update key %s in redis cache", key, exc_info=True)
+
+    async def _bump_revision(self, key: str) -> int | None:
+        revision_key = self._make_revision_key(key)
+        try:
+            async with self._client.pipeline(transaction=True) as pipeline:
+                pipeline.incr(revision_key)
+                pipeline.pexpire(revision_key, int(self.ttl * 1000))
+                revision, _ = await pipeline.execute()
+        except RedisError:
+            logger.warning("Failed to bump revision of key %s in redis cache", key, exc_info=True)
+            return None
+        return int(revision)
+
+    async def _revision(self, key: str) -> int | None:
+        try:
+            revision = await self._client.get(self._make_revision_key(key))
+        except RedisError:
+            logger.warning("Failed to read revision of key %s from redis cache", key, exc_info=True)
+            return None
+        return int(revision or 0)
+
+    async def _set_if_revision(self, key: str, value: tp.Any, revision: int, ttl: float) -> bool:
+        revision_key = self._make_revision_key(key)
+        try:
+            async with self._client.pipeline(transaction=True) as pipeline:
+                await pipeline.watch(revision_key)
+                if int(await pipeline.get(revision_key) or 0) != revision:
+                    return False
+                pipeline.multi()
+                pipeline.set(self._make_key(key), json.dumps(value), px=int(ttl * 1000))
+                await pipeline.execute()
+        except WatchError:
+            return False
+        except RedisError:
+            logger.warning("Failed to write key %s to redis cache", key, exc_info=True)
+            return False
+        return True
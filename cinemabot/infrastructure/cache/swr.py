@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import time
+import typing as tp
+
+from .base import AbstractCache
+
+
+logger = logging.getLogger(__name__)
+
+
+class StaleWhileRevalidateCache:
+    """
+    Кэш с отложенным обновлением (stale-while-revalidate).
+
+    Пока запись младше `soft_ttl`, она отдаётся как есть. Более старая запись тоже отдаётся сразу,
+    но параллельно запускается её обновление в фоне. Удаляются записи только по истечении `ttl` нижележащего кэша.
+    Для фонового обновления можно передать отдельную функцию `refresh`, например, с низким приоритетом запросов к API:
+    его результата никто не ждёт.
+    """
+
+    def __init__(self, cache: AbstractCache, soft_ttl: float) -> None:
+        self.cache = cache
+        self.soft_ttl = soft_ttl
+        self._refresh_tasks: dict[str, asyncio.Task[None]] = {}
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: tp.Callable[[], tp.Awaitable[tp.Any]],
+        refresh: tp.Callable[[], tp.Awaitable[tp.Any]] | None = None,
+    ) -> tp.Any:
+        entry = await self.cache.get(key)
+        if entry is None:
+            value = await fetch()
+            await self._store(key, value)
+            return value
+        if time.time() - entry["stored_at"] >= self.soft_ttl:
+            self._schedule_refresh(key, refresh or fetch)
+        return entry["value"]
+
+    async def close(self) -> None:
+        """Отменяет фоновые обновления, которые ещё не успели завершиться."""
+        tasks = list(self._refresh_tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _store(self, key: str, value: tp.Any) -> None:
+        # время сохранения записываем в саму запись, чтобы оно было общим для всех реплик при использовании Redis
+        await self.cache.set(key, {"stored_at": time.time(), "value": value})
+
+    def _schedule_refresh(self, key: str, fetch: tp.Callable[[], tp.Awaitable[tp.Any]]) -> None:
+        if key in self._refresh_tasks:
+            return
+        task = asyncio.create_task(self._refresh(key, fetch))
+        self._refresh_tasks[key] = task
+        task.add_done_callback(lambda _: self._refresh_tasks.pop(key, None))
+
+    async def _refresh(self, key: str, fetch: tp.Callable[[], tp.Awaitable[tp.Any]]) -> None:
+        try:
+            value = await fetch()
+        except Exception:
+            logger.warning("Failed to refresh stale cache entry %s", key, exc_info=True)
+            return
+        await self._store(key, value)
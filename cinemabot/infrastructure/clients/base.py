@@ -1,21 +1,65 @@
-from asyncio import run
 from typing import Any
 
-from aiohttp import ClientSession
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
 
 
 class BaseAiohttpClient:
-    def __init__(self, base_url: str, header_tokens: dict[str, str], cookies: dict[str, str] | None = None) -> None:
-        self.session: ClientSession = ClientSession()
+    """
+    Базовый HTTP-клиент поверх одной aiohttp-сессии.
+
+    Сессия создаётся в `start()` внутри работающего event loop и закрывается в `close()`,
+    их нужно вызывать при старте и остановке приложения.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        header_tokens: dict[str, str],
+        cookies: dict[str, str] | None = None,
+        connection_limit: int = 100,
+        connection_limit_per_host: int = 0,
+        keepalive_timeout: float = 30,
+        dns_cache_ttl: int | None = 10,
+        connect_timeout: float | None = None,
+        read_timeout: float | None = None,
+    ) -> None:
+        self._session: ClientSession | None = None
         self.base_url = base_url
         self.header_tokens: dict[str, str] = header_tokens
         self.cookies = cookies
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = ClientTimeout(connect=connect_timeout, sock_read=read_timeout)
+
+    @property
+    def session(self) -> ClientSession:
+        if self._session is None:
+            msg = f"{type(self).__name__} is not started, call `await client.start()` first"
+            raise RuntimeError(msg)
+        return self._session
+
+    async def start(self) -> None:
+        if self._session is not None:
+            return
+        connector = TCPConnector(
+            limit=self.connection_limit,
+            limit_per_host=self.connection_limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=self.dns_cache_ttl is not None,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+        self._session = ClientSession(connector=connector, timeout=self.timeout, cookies=self.cookies)
+
+    async def close(self) -> None:
+        if self._session is None:
+            return
+        session, self._session = self._session, None
+        await session.close()
 
     def make_headers(self, headers: dict[str, Any] | None = None) -> dict[str, Any]:
         if headers is None:
             headers = {}
         headers.update(self.header_tokens)
         return headers
-
-    def __del__(self) -> None:
-        run(self.session.close())
@@ -1,34 +1,120 @@
+import re
 from http import HTTPStatus
-from typing import Any
+from typing import Any, Awaitable
 from urllib.parse import urljoin
 
 from .base import BaseAiohttpClient
+from .rate_limit import Priority, RateLimiter, RateLimitExceededError
+from .single_flight import SingleFlight, SingleFlightStats
+from cinemabot.infrastructure.cache import AbstractCache, StaleWhileRevalidateCache
 
 
 class FilmNotFoundError(Exception):
     pass
 
 
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_keyword(keyword: str) -> str:
+    """Приводит поисковый запрос к виду, в котором одинаковые по смыслу запросы совпадают: `Ёлки  2` -> `елки 2`."""
+    return _WHITESPACE_RE.sub(" ", keyword).strip().casefold().replace("ё", "е")
+
+
 class KinopoiskClient(BaseAiohttpClient):
     def __init__(
         self,
         base_url: str,
         api_key: str,
+        search_cache: AbstractCache | None = None,
+        details_cache: StaleWhileRevalidateCache | None = None,
+        image_size_cache: AbstractCache | None = None,
+        not_found_cache: AbstractCache | None = None,
+        rate_limiter: RateLimiter | None = None,
+        **connection_options: Any,
     ) -> None:
-        super().__init__(base_url=base_url, header_tokens={"X-API-KEY": api_key})
+        super().__init__(base_url=base_url, header_tokens={"X-API-KEY": api_key}, **connection_options)
+        self.search_cache = search_cache
+        self.details_cache = details_cache
+        self.image_size_cache = image_size_cache
+        self.not_found_cache = not_found_cache
+        self.rate_limiter = rate_limiter
+        self._single_flight = SingleFlight()
+
+    async def close(self) -> None:
+        if self.details_cache is not None:
+            await self.details_cache.close()
+        await super().close()
+
+    @property
+    def coalescing_stats(self) -> dict[str, SingleFlightStats]:
+        """Сколько запросов к API было выполнено и сколько присоединились к уже выполняющимся, по методам клиента."""
+        return dict(self._single_flight.stats)
+
+    async def search_film_with_keyword(
+        self,
+        keyword: str,
+        page: int = 1,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> dict[str, Any]:
+        cache_key = f"{page}:{normalize_keyword(keyword)}"
+        if self.search_cache is not None:
+            cached_response = await self.search_cache.get(cache_key)
+            if cached_response is not None:
+                return cached_response
+        if self.not_found_cache is not None and await self.not_found_cache.get(cache_key) is not None:
+            raise FilmNotFoundError
+
+        return await self._single_flight.do(
+            "search_film_with_keyword",
+            cache_key,
+            lambda: self._fetch_search_result(keyword, page, cache_key, priority),
+            priority=priority,
+            # интерактивный вызов, попавший на фоновую подгрузку той же страницы, не должен получить её отказ лимитера
+            retry_on=(RateLimitExceededError,),
+        )
 
-    async def search_film_with_keyword(self, keyword: str) -> dict[str, Any]:
+    async def _fetch_search_result(self, keyword: str, page: int, cache_key: str, priority: Priority) -> dict[str, Any]:
+        await self._acquire(priority)
         async with self.session.get(
             urljoin(self.base_url, "api/v2.1/films/search-by-keyword"),
-            params={"keyword": keyword},
+            params={"keyword": keyword, "page": page},
             headers=self.make_headers(),
         ) as response:
             response_data = await response.json()
-            if response.status != HTTPStatus.OK or not response_data["films"]:
+            if response.status != HTTPStatus.OK:
                 raise FilmNotFoundError
+        if not response_data["films"]:
+            # опечатки и мусорные запросы повторяются часто, запоминаем их отдельно от найденных фильмов
+            if self.not_found_cache is not None:
+                await self.not_found_cache.set(cache_key, True)
+            raise FilmNotFoundError
+
+        if self.search_cache is not None:
+            await self.search_cache.set(cache_key, response_data)
         return response_data
 
-    async def get_film_details(self, film_kinopoisk_id: int) -> dict[str, Any]:
+    async def get_film_details(self, film_kinopoisk_id: int, priority: Priority = Priority.INTERACTIVE) -> dict[str, Any]:
+        def fetch(priority: Priority) -> Awaitable[dict[str, Any]]:
+            return self._single_flight.do(
+                "get_film_details",
+                str(film_kinopoisk_id),
+                lambda: self._fetch_film_details(film_kinopoisk_id, priority),
+                priority=priority,
+                retry_on=(RateLimitExceededError,),
+            )
+
+        if self.details_cache is None:
+            return await fetch(priority)
+        return await self.details_cache.get_or_fetch(
+            str(film_kinopoisk_id),
+            lambda: fetch(priority),
+            # устаревшее описание уже отдано, обновление никто не ждёт: оно не должно тратить интерактивные токены
+            refresh=lambda: fetch(Priority.BACKGROUND),
+        )
+
+    async def _fetch_film_details(self, film_kinopoisk_id: int, priority: Priority) -> dict[str, Any]:
+        await self._acquire(priority)
         async with self.session.get(
             urljoin(self.base_url, f"api/v2.2/films/{film_kinopoisk_id}"),
             headers=self.make_headers(),
@@ -38,6 +124,39 @@ class KinopoiskClient(BaseAiohttpClient):
                 raise FilmNotFoundError
         return response_data
 
-    async def get_image_size(self, url: str) -> int:
-        async with self.session.get(url) as response:
-            return int(response.headers["Content-Length"])
+    async def _acquire(self, priority: Priority) -> None:
+        # в кэш-only режиме и при превышении лимитов сюда не доходим: RateLimitExceededError поднимается раньше запроса в сеть
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire(priority)
+
+    async def get_image_size(self, url: str) -> int | None:
+        """Возвращает размер картинки в байтах или None, если сервер его не сообщил."""
+        if self.image_size_cache is not None:
+            cached_size = await self.image_size_cache.get(url)
+            if cached_size is not None:
+                return cached_size
+
+        return await self._single_flight.do("get_image_size", url, lambda: self._fetch_image_size(url))
+
+    async def _fetch_image_size(self, url: str) -> int | None:
+        image_size = await self._probe_image_size(url)
+        if image_size is not None and self.image_size_cache is not None:
+            await self.image_size_cache.set(url, image_size)
+        return image_size
+
+    async def _probe_image_size(self, url: str) -> int | None:
+        # для размера достаточно заголовков, само изображение не скачиваем
+        async with self.session.head(url, allow_redirects=True) as response:
+            content_length = response.headers.get("Content-Length")
+            if response.status == HTTPStatus.OK and content_length is not None:
+                return int(content_length)
+
+        # не все CDN отвечают на HEAD, поэтому запрашиваем только первый байт
+        async with self.session.get(url, headers={"Range": "bytes=0-0"}) as response:
+            content_range = response.headers.get("Content-Range")  # bytes 0-0/123456
+            if response.status == HTTPStatus.PARTIAL_CONTENT and content_range is not None:
+                total_size = content_range.rpartition("/")[2]
+                return int(total_size) if total_size.isdigit() else None
+            # Range проигнорирован: тело не читаем, соединение закроется при выходе из контекста
+            content_length = response.headers.get("Content-Length")
+            return int(content_length) if content_length is not None else None
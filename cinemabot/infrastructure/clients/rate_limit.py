@@ -0,0 +1,143 @@
+import asyncio
+import datetime as dt
+import enum
+import logging
+
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(enum.IntEnum):
+    INTERACTIVE = 0  # запрос, ответа на который ждёт пользователь
+    BACKGROUND = 1  # подгрузка и прогрев кэшей, без которых можно обойтись
+
+
+class RateLimitExceededError(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Token bucket с двумя классами приоритета.
+
+    Фоновые запросы получают токен, только если после этого в ведре останется `background_reserve` токенов
+    и никто из интерактивных запросов не ждёт. Так при нагрузке фоновые запросы отваливаются первыми,
+    а пользовательские продолжают обслуживаться с ограниченной задержкой.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        background_reserve: float,
+        interactive_max_wait: float,
+        background_max_wait: float,
+    ) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.background_reserve = background_reserve
+        self.max_wait = {
+            Priority.INTERACTIVE: interactive_max_wait,
+            Priority.BACKGROUND: background_max_wait,
+        }
+        self._tokens = capacity
+        self._updated_at: float | None = None
+        self._interactive_waiters = 0
+
+    async def acquire(self, priority: Priority) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait[priority]
+        reserve = self.background_reserve if priority is Priority.BACKGROUND else 0.0
+        if priority is Priority.INTERACTIVE:
+            self._interactive_waiters += 1
+        try:
+            while True:
+                self._refill(loop.time())
+                can_take = priority is Priority.INTERACTIVE or not self._interactive_waiters
+                if can_take and self._tokens - reserve >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(1 + reserve - self._tokens, 0.1) / self.rate
+                if loop.time() + wait > deadline:
+                    raise RateLimitExceededError
+                await asyncio.sleep(wait)
+        finally:
+            if priority is Priority.INTERACTIVE:
+                self._interactive_waiters -= 1
+
+    def _refill(self, now: float) -> None:
+        if self._updated_at is not None:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+
+class DailyQuota:
+    """
+    Счётчик запросов за текущие сутки (UTC).
+
+    Когда израсходовано `degrade_threshold` от лимита, квота считается почти исчерпанной и клиент переходит в режим "только кэш".
+    Счётчик хранится в памяти процесса, для сохранения между перезапусками и репликами используйте `RedisDailyQuota`.
+    """
+
+    def __init__(self, limit: int, degrade_threshold: float) -> None:
+        self.limit = limit
+        self.degrade_threshold = degrade_threshold
+        self._day = self._today()
+        self._used = 0
+
+    @property
+    def is_degraded(self) -> bool:
+        if self._day != self._today():
+            return False
+        return self._used >= self.limit * self.degrade_threshold
+
+    async def consume(self) -> None:
+        today = self._today()
+        if self._day != today:
+            self._day = today
+            self._used = 0
+        self._used = await self._increment(today)
+
+    async def _increment(self, day: dt.date) -> int:
+        return self._used + 1
+
+    @staticmethod
+    def _today() -> dt.date:
+        return dt.datetime.now(dt.timezone.utc).date()
+
+
+class RedisDailyQuota(DailyQuota):
+    def __init__(self, client: aioredis.Redis, prefix: str, limit: int, degrade_threshold: float) -> None:
+        super().__init__(limit=limit, degrade_threshold=degrade_threshold)
+        self._client = client
+        self._prefix = prefix
+
+    async def _increment(self, day: dt.date) -> int:
+        key = f"{self._prefix}:{day.isoformat()}"
+        try:
+            async with self._client.pipeline(transaction=True) as pipeline:
+                pipeline.incr(key)
+                pipeline.expire(key, int(dt.timedelta(days=2).total_seconds()))
+                used, _ = await pipeline.execute()
+        except RedisError:
+            logger.warning("Failed to update daily quota counter in redis", exc_info=True)
+            return self._used + 1
+        return int(used)
+
+
+class RateLimiter:
+    """Ограничивает запросы к API по частоте (`bucket`) и по суточной квоте (`quota`)."""
+
+    def __init__(self, bucket: TokenBucket, quota: DailyQuota | None = None) -> None:
+        self.bucket = bucket
+        self.quota = quota
+
+    async def acquire(self, priority: Priority) -> None:
+        if self.quota is not None and self.quota.is_degraded:
+            raise RateLimitExceededError
+        await self.bucket.acquire(priority)
+        if self.quota is not None:
+            await self.quota.consume()
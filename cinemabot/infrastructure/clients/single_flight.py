@@ -0,0 +1,74 @@
+import asyncio
+import collections
+import dataclasses
+import typing as tp
+
+
+T = tp.TypeVar("T")
+
+
+@dataclasses.dataclass
+class SingleFlightStats:
+    executed: int = 0
+    coalesced: int = 0
+
+
+@dataclasses.dataclass
+class _Flight:
+    task: asyncio.Task[tp.Any]
+    priority: int
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные одинаковые запросы.
+
+    Пока запрос по ключу выполняется, остальные вызовы с тем же ключом ждут его результат, а не отправляют свой.
+    Запрос выполняется в отдельной задаче, поэтому отмена одного из ожидающих не отменяет его для остальных.
+
+    У запроса есть `priority` (меньше - срочнее). Если вызов присоединился к менее срочному запросу и тот упал
+    с исключением из `retry_on` (например, фоновому запросу не хватило токенов за его короткое ожидание),
+    вызов повторяет запрос уже со своим приоритетом, а не получает чужую ошибку.
+    """
+
+    def __init__(self) -> None:
+        self._in_flight: dict[tuple[str, str], _Flight] = {}
+        self.stats: collections.defaultdict[str, SingleFlightStats] = collections.defaultdict(SingleFlightStats)
+
+    async def do(
+        self,
+        method: str,
+        key: str,
+        fetch: tp.Callable[[], tp.Awaitable[T]],
+        priority: int = 0,
+        retry_on: tuple[type[Exception], ...] = (),
+    ) -> T:
+        in_flight_key = (method, key)
+        flight = self._in_flight.get(in_flight_key)
+        if flight is None:
+            return await self._execute(method, in_flight_key, fetch, priority)
+        self.stats[method].coalesced += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except retry_on:
+            if priority >= flight.priority:
+                raise
+        current = self._in_flight.get(in_flight_key)
+        if current is not None and current.priority <= priority:
+            return await asyncio.shield(current.task)
+        return await self._execute(method, in_flight_key, fetch, priority)
+
+    async def _execute(self, method: str, in_flight_key: tuple[str, str], fetch: tp.Callable[[], tp.Awaitable[T]], priority: int) -> T:
+        self.stats[method].executed += 1
+        # более срочный запрос заменяет в списке упавший менее срочный, если тот ещё не успел удалиться
+        flight = _Flight(task=asyncio.ensure_future(fetch()), priority=priority)
+        self._in_flight[in_flight_key] = flight
+        flight.task.add_done_callback(lambda _: self._forget(in_flight_key, flight))
+        return await asyncio.shield(flight.task)
+
+    def _forget(self, in_flight_key: tuple[str, str], flight: _Flight) -> None:
+        if self._in_flight.get(in_flight_key) is flight:
+            del self._in_flight[in_flight_key]
+        if not flight.task.cancelled():
+            # помечаем исключение обработанным, даже если все ожидающие уже отменены
+            flight.task.exception()
@@ -0,0 +1,242 @@
+import bisect
+import collections
+import contextlib
+import contextvars
+import dataclasses
+import functools
+import inspect
+import logging
+import time
+import typing as tp
+
+import sqlalchemy as sa
+from sqlalchemy.ext import asyncio as sa_async
+
+
+logger = logging.getLogger(__name__)
+
+T = tp.TypeVar("T")
+
+# upper bounds of histogram buckets
+LATENCY_BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+ROWS_BOUNDS = (0, 1, 10, 100, 1000, 10_000)
+SATURATION_BOUNDS = (0.25, 0.5, 0.75, 0.9, 1.0)
+
+# statements made outside of tagged methods, e.g. health checks and migrations
+UNTAGGED = "other"
+_SLOW_QUERY_MAX_LENGTH = 1000
+
+_current_method: contextvars.ContextVar[str | None] = contextvars.ContextVar("current_method", default=None)
+
+
+@contextlib.contextmanager
+def tagged(method: str) -> tp.Iterator[None]:
+    """Attribute checkouts and statements made inside the block to `method`; the outermost tag wins."""
+    if _current_method.get() is not None:
+        yield
+        return
+    token = _current_method.set(method)
+    try:
+        yield
+    finally:
+        _current_method.reset(token)
+
+
+def tag_methods(cls: type[T]) -> type[T]:
+    """Tag public coroutine and async generator methods of the class with their names, see `tagged`."""
+    for name, function in list(vars(cls).items()):
+        if name.startswith("_"):
+            continue
+        if inspect.iscoroutinefunction(function):
+            setattr(cls, name, _tag_coroutine_function(name, function))
+        elif inspect.isasyncgenfunction(function):
+            setattr(cls, name, _tag_async_generator_function(name, function))
+    return cls
+
+
+def _tag_coroutine_function(name: str, function: tp.Callable[..., tp.Awaitable[T]]) -> tp.Callable[..., tp.Awaitable[T]]:
+    @functools.wraps(function)
+    async def wrapper(*args: tp.Any, **kwargs: tp.Any) -> T:
+        with tagged(name):
+            return await function(*args, **kwargs)
+
+    return wrapper
+
+
+def _tag_async_generator_function(name: str, function: tp.Callable[..., tp.AsyncIterator[T]]) -> tp.Callable[..., tp.AsyncIterator[T]]:
+    @functools.wraps(function)
+    async def wrapper(*args: tp.Any, **kwargs: tp.Any) -> tp.AsyncIterator[T]:
+        iterator = function(*args, **kwargs)
+        try:
+            while True:
+                # the tag is set only while the generator runs, it must not leak into the caller between items
+                with tagged(name):
+                    try:
+                        item = await anext(iterator)
+                    except StopAsyncIteration:
+                        return
+                yield item
+        finally:
+            await iterator.aclose()  # type: ignore[attr-defined]
+
+    return wrapper
+
+
+@dataclasses.dataclass
+class Histogram:
+    """Counts of observed values per bucket, buckets are given by their upper bounds like in Prometheus."""
+
+    bounds: tuple[float, ...]
+    counts: list[int] = dataclasses.field(init=False)
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def __post_init__(self) -> None:
+        # the last bucket is for values above the last bound
+        self.counts = [0] * (len(self.bounds) + 1)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket the quantile falls into (the maximum for the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+@dataclasses.dataclass
+class MethodMetrics:
+    checkout_wait: Histogram = dataclasses.field(default_factory=lambda: Histogram(LATENCY_BOUNDS))
+    # share of the pool in use right after a checkout; near 1 means that updates queue for connections
+    pool_saturation: Histogram = dataclasses.field(default_factory=lambda: Histogram(SATURATION_BOUNDS))
+    statement_latency: Histogram = dataclasses.field(default_factory=lambda: Histogram(LATENCY_BOUNDS))
+    rows: Histogram = dataclasses.field(default_factory=lambda: Histogram(ROWS_BOUNDS))
+    slow_queries: int = 0
+
+
+class InstrumentedPool(sa.pool.AsyncAdaptedQueuePool):
+    """A queue pool that measures how long a checkout waits for a free (or a new) connection."""
+
+    def _do_get(self) -> sa.pool.ConnectionPoolEntry:
+        started_at = time.perf_counter()
+        record = super()._do_get()
+        # picked up by the checkout listener of `DatabaseMetrics`
+        record.info["checkout_wait"] = time.perf_counter() - started_at
+        return record
+
+
+class DatabaseMetrics:
+    """
+    Histograms of pool checkouts and statements of SQLAlchemy engines, per tagged repository method.
+
+    Checkout wait and pool saturation show whether `min_pool_size`/`max_pool_size` are enough for the load,
+    statement latency and rows show which method is slow. Queries slower than `slow_query_threshold`
+    seconds are logged with parameter values replaced by their types.
+    """
+
+    def __init__(self, slow_query_threshold: float) -> None:
+        self.slow_query_threshold = slow_query_threshold
+        self.methods: collections.defaultdict[str, MethodMetrics] = collections.defaultdict(MethodMetrics)
+
+    def instrument(self, engine: sa_async.AsyncEngine, pool_capacity: int) -> None:
+        """Listen to the events of the engine and its pool; the pool must be an `InstrumentedPool`."""
+
+        def on_checkout(dbapi_connection: tp.Any, record: sa.pool.ConnectionPoolEntry, proxy: tp.Any) -> None:
+            # pool events run in a greenlet that shares the context of the calling task, so the tag is visible here
+            metrics = self.methods[_current_method.get() or UNTAGGED]
+            metrics.checkout_wait.observe(record.info.pop("checkout_wait", 0.0))
+            metrics.pool_saturation.observe(engine.sync_engine.pool.checkedout() / pool_capacity)  # type: ignore[attr-defined]
+
+        sa.event.listen(engine.sync_engine.pool, "checkout", on_checkout)
+        sa.event.listen(engine.sync_engine, "before_cursor_execute", self._before_cursor_execute)
+        sa.event.listen(engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def report(self) -> str:
+        lines = []
+        for method, metrics in sorted(self.methods.items()):
+            latency, wait = metrics.statement_latency, metrics.checkout_wait
+            lines.append(
+                f"{method:>32}: statements={latency.count:<6} "
+                f"p50={latency.quantile(0.5) * 1000:7.1f}ms p95={latency.quantile(0.95) * 1000:7.1f}ms max={latency.max * 1000:7.1f}ms "
+                f"rows p95={metrics.rows.quantile(0.95):<6.0f} "
+                f"checkouts={wait.count:<6} wait p95={wait.quantile(0.95) * 1000:7.1f}ms max={wait.max * 1000:7.1f}ms "
+                f"saturation p95={metrics.pool_saturation.quantile(0.95):4.0%} slow={metrics.slow_queries}",
+            )
+        return "\n".join(lines)
+
+    @staticmethod
+    def _before_cursor_execute(connection: sa.Connection, *_: tp.Any) -> None:
+        # statements on a connection don't overlap, and a failed one is simply overwritten by the next
+        connection.info["statement_started_at"] = time.perf_counter()
+
+    def _after_cursor_execute(
+        self,
+        connection: sa.Connection,
+        cursor: tp.Any,
+        statement: str,
+        parameters: tp.Any,
+        context: tp.Any,
+        executemany: bool,
+    ) -> None:
+        elapsed = time.perf_counter() - connection.info.pop("statement_started_at")
+        method = _current_method.get() or UNTAGGED
+        metrics = self.methods[method]
+        metrics.statement_latency.observe(elapsed)
+        rows = _rows(cursor, context)
+        if rows is not None:
+            metrics.rows.observe(rows)
+        if self.slow_query_threshold and elapsed >= self.slow_query_threshold:
+            metrics.slow_queries += 1
+            logger.warning(
+                "Slow query in %s: %.1fms, %s rows\n%s\nparameters: %s",
+                method,
+                elapsed * 1000,
+                "?" if rows is None else rows,
+                _truncate(statement),
+                _truncate(redact(parameters, executemany)),
+            )
+
+
+def _rows(cursor: tp.Any, context: tp.Any) -> int | None:
+    """Rows affected by a DML statement or fetched by a query, None when unknown (server-side cursors)."""
+    if getattr(context, "_is_server_side", False):
+        return None
+    if cursor.rowcount >= 0:
+        return cursor.rowcount
+    # the asyncpg adapter fetches the whole result of a query on execute and keeps it in the cursor
+    buffered = getattr(cursor, "_rows", None)
+    return len(buffered) if buffered is not None else None
+
+
+def _truncate(text: str) -> str:
+    # multi-row inserts of large batches have thousands of parameters
+    return text if len(text) <= _SLOW_QUERY_MAX_LENGTH else text[:_SLOW_QUERY_MAX_LENGTH] + "..."
+
+
+def _placeholder(value: tp.Any) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, (list, tuple)):
+        return f"<{type(value).__name__}[{len(value)}]>"
+    return f"<{type(value).__name__}>"
+
+
+def redact(parameters: tp.Any, executemany: bool = False) -> str:
+    """Parameters of a statement with values replaced by their types, safe to be logged."""
+    if executemany:
+        return f"{len(parameters)} sets of {redact(parameters[0])}" if parameters else "[]"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key!r}: {_placeholder(value)}" for key, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(_placeholder(value) for value in parameters) + ")"
+    return _placeholder(parameters)
@@ -1,6 +1,7 @@
 from alembic import context
 from sqlalchemy import engine_from_config, pool
 
+from cinemabot.infrastructure.database.partition_names import is_partition_name
 from cinemabot.infrastructure.database.schemas import sa_metadata
 
 
@@ -8,6 +9,12 @@ config = context.config
 target_metadata = sa_metadata
 
 
+def include_object(object, name, type_, reflected, compare_to) -> bool:  # noqa: ANN001
+    """Skip partitions of search_history: they are managed by `cinemabot.infrastructure.database.partitions`."""
+    table_name = name if type_ == "table" else getattr(getattr(object, "table", None), "name", None)
+    return not (reflected and compare_to is None and table_name is not None and is_partition_name(table_name))
+
+
 def run_migrations_offline() -> None:
     """
     Run migrations in 'offline' mode.
@@ -25,6 +32,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -51,6 +59,7 @@ def run_migrations_online() -> None:
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
+            include_object=include_object,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,108 @@
+"""partition search history
+
+Revision ID: 3c8e51a0f7b2
+Revises: 9b3f2c7d1e84
+Create Date: 2026-10-18 19:05:12.774120
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3c8e51a0f7b2"
+down_revision: Union[str, None] = "9b3f2c7d1e84"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Monthly partitions are named search_history_yYYYYmMM, see `cinemabot.infrastructure.database.partition_names`.
+# Partitions are created for every month with data and for the next 3 months; later ones are created by that command.
+CREATE_PARTITIONS = """
+DO $$
+DECLARE
+    first_created_at timestamptz := coalesce((SELECT min(created_at) FROM search_history_unpartitioned), now());
+    -- months are UTC months, whatever TimeZone the session has
+    month date := date_trunc('month', first_created_at AT TIME ZONE 'UTC');
+BEGIN
+    WHILE month <= date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months' LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF search_history FOR VALUES FROM (%L) TO (%L)',
+            'search_history_y' || to_char(month, 'YYYY') || 'm' || to_char(month, 'MM'),
+            month::timestamp AT TIME ZONE 'UTC',
+            (month + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+        );
+        month := month + interval '1 month';
+    END LOOP;
+END $$
+"""
+
+
+def upgrade() -> None:
+    op.rename_table("search_history", "search_history_unpartitioned")
+    op.drop_index("ix_search_history_user_id_created_at_id", table_name="search_history_unpartitioned")
+    op.execute("ALTER TABLE search_history_unpartitioned RENAME CONSTRAINT pk_search_history TO pk_search_history_unpartitioned")
+    op.execute("ALTER TABLE search_history_unpartitioned RENAME CONSTRAINT fk_search_history_user_id_user TO fk_search_history_unpartitioned_user_id_user")
+
+    # the partition key has to be a part of the primary key
+    op.create_table(
+        "search_history",
+        sa.Column("user_id", sa.BIGINT(), nullable=False),
+        sa.Column("request_text", sa.TEXT(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("id", sa.UUID(), server_default=sa.text("gen_random_uuid()"), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"], name=op.f("fk_search_history_user_id_user"), onupdate="CASCADE", ondelete="RESTRICT"),
+        sa.PrimaryKeyConstraint("id", "created_at", name=op.f("pk_search_history")),
+        postgresql_partition_by="RANGE (created_at)",
+    )
+    op.execute(sa.text(CREATE_PARTITIONS))
+    # rows outside of created partitions (e.g. if the maintenance command didn't run in time) are not lost
+    op.execute("CREATE TABLE search_history_default PARTITION OF search_history DEFAULT")
+
+    op.execute(
+        "INSERT INTO search_history (user_id, request_text, created_at, updated_at, id) "
+        "SELECT user_id, request_text, created_at, updated_at, id FROM search_history_unpartitioned",
+    )
+    op.drop_table("search_history_unpartitioned")
+    op.create_index(
+        "ix_search_history_user_id_created_at_id",
+        "search_history",
+        ["user_id", sa.text("created_at DESC"), sa.text("id DESC")],
+        unique=False,
+        postgresql_include=["request_text"],
+    )
+
+
+def downgrade() -> None:
+    op.rename_table("search_history", "search_history_partitioned")
+    op.drop_index("ix_search_history_user_id_created_at_id", table_name="search_history_partitioned")
+    op.execute("ALTER TABLE search_history_partitioned RENAME CONSTRAINT pk_search_history TO pk_search_history_partitioned")
+    op.execute("ALTER TABLE search_history_partitioned RENAME CONSTRAINT fk_search_history_user_id_user TO fk_search_history_partitioned_user_id_user")
+
+    op.create_table(
+        "search_history",
+        sa.Column("user_id", sa.BIGINT(), nullable=False),
+        sa.Column("request_text", sa.TEXT(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("id", sa.UUID(), server_default=sa.text("gen_random_uuid()"), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"], name=op.f("fk_search_history_user_id_user"), onupdate="CASCADE", ondelete="RESTRICT"),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_search_history")),
+    )
+    op.execute(
+        "INSERT INTO search_history (user_id, request_text, created_at, updated_at, id) "
+        "SELECT user_id, request_text, created_at, updated_at, id FROM search_history_partitioned",
+    )
+    # partitions are dropped together with the partitioned table
+    op.drop_table("search_history_partitioned")
+    op.create_index(
+        "ix_search_history_user_id_created_at_id",
+        "search_history",
+        ["user_id", sa.text("created_at DESC"), sa.text("id DESC")],
+        unique=False,
+        postgresql_include=["request_text"],
+    )
@@ -0,0 +1,41 @@
+"""
+Имена месячных секций таблицы `search_history`.
+
+Модуль не импортирует приложение: его использует `migrations/env.py`, которому не нужны настройки и зависимости бота.
+"""
+
+import dataclasses
+import datetime as dt
+import re
+
+
+TABLE_NAME = "search_history"
+# секции и таблица для строк вне их диапазонов; alembic не должен считать их лишними таблицами
+PARTITION_NAME_PATTERN = re.compile(rf"^{TABLE_NAME}_(y(?P<year>\d{{4}})m(?P<month>\d{{2}})|default)$")
+
+
+@dataclasses.dataclass(frozen=True, order=True)
+class Month:
+    year: int
+    month: int
+
+    @classmethod
+    def current(cls) -> "Month":
+        today = dt.datetime.now(dt.timezone.utc)
+        return cls(today.year, today.month)
+
+    def shift(self, months: int) -> "Month":
+        index = self.year * 12 + self.month - 1 + months
+        return Month(index // 12, index % 12 + 1)
+
+    @property
+    def partition_name(self) -> str:
+        return f"{TABLE_NAME}_y{self.year:04d}m{self.month:02d}"
+
+    @property
+    def starts_at(self) -> dt.datetime:
+        return dt.datetime(self.year, self.month, 1, tzinfo=dt.timezone.utc)
+
+
+def is_partition_name(table_name: str) -> bool:
+    return PARTITION_NAME_PATTERN.match(table_name) is not None
@@ -0,0 +1,146 @@
+"""
+Обслуживание секций таблицы `search_history`, разбитой по месяцам `created_at`.
+
+Создаёт секции на `PARTITIONS__MONTHS_AHEAD` месяцев вперёд и убирает из таблицы секции старше
+`PARTITIONS__RETENTION_MONTHS` месяцев: если задан `PARTITIONS__ARCHIVE_DIR`, секция выгружается туда в CSV,
+сжатый gzip, и удаляется, иначе только отсоединяется и остаётся в базе отдельной таблицей.
+Запускать по расписанию, например, раз в сутки:
+
+    python -m cinemabot.infrastructure.database.partitions run
+"""
+
+import argparse
+import gzip
+import logging
+import pathlib
+
+import sqlalchemy as sa
+
+from cinemabot.infrastructure.database.partition_names import PARTITION_NAME_PATTERN, TABLE_NAME, Month
+from cinemabot.infrastructure.settings import PartitionSettings, Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def attached_partitions(connection: sa.Connection) -> list[Month]:
+    query = sa.text(
+        """
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :table_name
+        """,
+    )
+    months = []
+    for name in connection.scalars(query, {"table_name": TABLE_NAME}):
+        match = PARTITION_NAME_PATTERN.match(name)
+        if match is not None and match["year"] is not None:
+            months.append(Month(int(match["year"]), int(match["month"])))
+    return sorted(months)
+
+
+def create_partitions(connection: sa.Connection, months_ahead: int) -> list[Month]:
+    """Создаёт недостающие секции с текущего месяца до `months_ahead` месяцев вперёд."""
+    existing = set(attached_partitions(connection))
+    created = []
+    current = Month.current()
+    for month in (current.shift(offset) for offset in range(months_ahead + 1)):
+        if month in existing:
+            continue
+        bounds = {"starts_at": month.starts_at, "ends_at": month.shift(1).starts_at}
+        # строки этого месяца могли попасть в секцию по умолчанию, пока секции не было: их нужно перенести,
+        # иначе Postgres не даст подключить секцию
+        connection.execute(sa.text(f"CREATE TABLE {month.partition_name} (LIKE {TABLE_NAME} INCLUDING DEFAULTS)"))
+        connection.execute(
+            sa.text(
+                f"WITH moved AS (DELETE FROM {TABLE_NAME}_default WHERE created_at >= :starts_at AND created_at < :ends_at RETURNING *) "
+                f"INSERT INTO {month.partition_name} SELECT * FROM moved",
+            ),
+            bounds,
+        )
+        connection.execute(
+            sa.text(
+                f"ALTER TABLE {TABLE_NAME} ATTACH PARTITION {month.partition_name} "
+                f"FOR VALUES FROM ('{bounds['starts_at'].isoformat()}') TO ('{bounds['ends_at'].isoformat()}')",
+            ),
+        )
+        created.append(month)
+        logger.info("Created partition %s", month.partition_name)
+    return created
+
+
+def expired_partitions(connection: sa.Connection, retention_months: int) -> list[Month]:
+    # секция текущего месяца и `retention_months` предыдущих хранятся
+    oldest_kept = Month.current().shift(-retention_months)
+    return [month for month in attached_partitions(connection) if month < oldest_kept]
+
+
+def detach_partition(connection: sa.Connection, month: Month) -> None:
+    connection.execute(sa.text(f"ALTER TABLE {TABLE_NAME} DETACH PARTITION {month.partition_name}"))
+    logger.info("Detached partition %s", month.partition_name)
+
+
+def archive_partition(connection: sa.Connection, month: Month, archive_dir: pathlib.Path) -> pathlib.Path:
+    """Выгружает отсоединённую секцию в `archive_dir/<секция>.csv.gz` и удаляет её."""
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    path = archive_dir / f"{month.partition_name}.csv.gz"
+    # пишем во временный файл, чтобы недописанный архив не выглядел готовым
+    tmp_path = path.with_suffix(".tmp")
+    cursor = connection.connection.dbapi_connection.cursor()  # type: ignore[union-attr]
+    with gzip.open(tmp_path, "wb") as file:
+        cursor.copy_expert(f"COPY {month.partition_name} TO STDOUT WITH (FORMAT csv, HEADER)", file)
+    tmp_path.rename(path)
+    connection.execute(sa.text(f"DROP TABLE {month.partition_name}"))
+    logger.info("Archived partition %s to %s", month.partition_name, path)
+    return path
+
+
+def remove_expired_partitions(connection: sa.Connection, settings: PartitionSettings) -> list[Month]:
+    if settings.retention_months is None:
+        return []
+    with connection.begin():
+        expired = expired_partitions(connection, settings.retention_months)
+    for month in expired:
+        # каждая секция в своей транзакции: сбой на одной не откатывает уже обработанные
+        with connection.begin():
+            detach_partition(connection, month)
+            if settings.archive_dir is not None:
+                archive_partition(connection, month, settings.archive_dir)
+    return expired
+
+
+def create_engine(settings: Settings) -> sa.Engine:
+    dsn = settings.postgres.dsn.get_secret_value().replace("postgresql+asyncpg", "postgresql")
+    return sa.create_engine(dsn, poolclass=sa.NullPool)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "command",
+        choices=["create", "expire", "run"],
+        help="create - создать будущие секции, expire - убрать старые, run - и то и другое",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    # настройки читаются напрямую, без `cinemabot.dependencies`: команде не нужны бот, кэши и клиенты
+    settings = Settings()
+    engine = create_engine(settings)
+    try:
+        with engine.connect() as connection:
+            if args.command in ("create", "run"):
+                with connection.begin():
+                    create_partitions(connection, settings.partitions.months_ahead)
+            if args.command in ("expire", "run"):
+                remove_expired_partitions(connection, settings.partitions)
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import asyncio
+import contextlib
+import contextvars
+import dataclasses
+import logging
+import typing as tp
+
+
+logger = logging.getLogger(__name__)
+
+T = tp.TypeVar("T")
+
+_primary_reads: contextvars.ContextVar[bool] = contextvars.ContextVar("primary_reads", default=False)
+
+
+@contextlib.contextmanager
+def primary_reads() -> tp.Iterator[None]:
+    """
+    Send reads made inside the block to the primary.
+
+    Replicas lag behind the primary, so a result that is going to be cached and then updated incrementally
+    (see `CachedPagesStorageRepository`) must be read from the primary, or a just written row may be missing for good.
+    """
+    token = _primary_reads.set(True)
+    try:
+        yield
+    finally:
+        _primary_reads.reset(token)
+
+
+@dataclasses.dataclass(eq=False)
+class Replica(tp.Generic[T]):
+    name: str
+    target: T
+    healthy: bool = True
+
+
+class ReplicaSet(tp.Generic[T]):
+    """
+    Read replicas of the primary database: an SQLAlchemy engine or an asyncpg pool per replica.
+
+    A read goes to the healthy replica with the fewest connections in use, ties are broken round-robin so that
+    idle replicas share the load. Replicas are pinged in the background; a replica that fails a ping or a connection
+    is skipped until its next successful ping. When no replica is healthy, `choose` returns None and reads go
+    to the primary.
+    """
+
+    def __init__(
+        self,
+        replicas: list[Replica[T]],
+        in_use: tp.Callable[[T], int],
+        ping: tp.Callable[[T], tp.Awaitable[tp.Any]],
+        health_check_interval: float,
+        health_check_timeout: float,
+    ) -> None:
+        self.replicas = replicas
+        self._in_use = in_use
+        self._ping = ping
+        self._health_check_interval = health_check_interval
+        self._health_check_timeout = health_check_timeout
+        self._next = 0
+        self._health_check_task: asyncio.Task[None] | None = None
+
+    def __bool__(self) -> bool:
+        return bool(self.replicas)
+
+    def choose(self) -> Replica[T] | None:
+        if _primary_reads.get():
+            return None
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        self._next = (self._next + 1) % len(healthy)
+        # min() keeps the first of equal replicas, so the rotation decides between equally loaded ones
+        rotated = healthy[self._next :] + healthy[: self._next]
+        return min(rotated, key=lambda replica: self._in_use(replica.target))
+
+    def mark_unhealthy(self, replica: Replica[T], reason: BaseException) -> None:
+        if replica.healthy:
+            logger.warning("Replica %s is unavailable, reading from other replicas or the primary: %r", replica.name, reason)
+        replica.healthy = False
+
+    async def check(self) -> None:
+        await asyncio.gather(*(self._check(replica) for replica in self.replicas))
+
+    async def start(self) -> None:
+        """Check replicas once and keep checking them in the background."""
+        if not self.replicas or self._health_check_task is not None:
+            return
+        await self.check()
+        self._health_check_task = asyncio.create_task(self._run_health_checks())
+
+    async def close(self) -> None:
+        if self._health_check_task is not None:
+            self._health_check_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._health_check_task
+            self._health_check_task = None
+
+    async def _check(self, replica: Replica[T]) -> None:
+        try:
+            await asyncio.wait_for(self._ping(replica.target), timeout=self._health_check_timeout)
+        except Exception as exc:
+            self.mark_unhealthy(replica, exc)
+            return
+        if not replica.healthy:
+            logger.info("Replica %s is available again", replica.name)
+            replica.healthy = True
+
+    async def _run_health_checks(self) -> None:
+        while True:
+            await asyncio.sleep(self._health_check_interval)
+            await self.check()
@@ -48,8 +48,22 @@ class User(BaseTableSchema):
     id: Mapped[int] = mapped_column(postgresql.BIGINT, primary_key=True)
 
 
-class SearchHistory(BaseTableSchema, UUIdMixin):
+class SearchHistory(BaseTableSchema):
     __tablename__ = "search_history"
+    # таблица разбита на секции по месяцам, см. `cinemabot.infrastructure.database.partitions`;
+    # ключ секционирования обязан входить в первичный ключ
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        postgresql.UUID(as_uuid=True),
+        primary_key=True,
+        server_default=sa.func.gen_random_uuid(),
+    )
+    created_at: Mapped[dt.datetime] = mapped_column(
+        sa.DateTime(timezone=True),
+        primary_key=True,
+        default=dt.datetime.now,
+    )
 
     user_id: Mapped[int] = mapped_column(
         sa.ForeignKey(
@@ -57,7 +71,6 @@ class SearchHistory(BaseTableSchema, UUIdMixin):
             ondelete="RESTRICT",
             onupdate="CASCADE",
         ),
-        index=True,
     )
     request_text: Mapped[str] = mapped_column(postgresql.TEXT)
 
@@ -70,11 +83,20 @@ class Film(BaseTableSchema, UUIdMixin):
 
     name_ru: Mapped[str] = mapped_column(postgresql.TEXT)
     name_eng: Mapped[str] = mapped_column(postgresql.TEXT)
-    kinopoisk_id: Mapped[int] = mapped_column(postgresql.INTEGER, index=True)
+    kinopoisk_id: Mapped[int] = mapped_column(postgresql.INTEGER, unique=True)
+    poster_size: Mapped[int | None] = mapped_column(
+        postgresql.INTEGER,
+        nullable=True,
+        doc="Size of poster image in bytes (used to choose between full poster and preview)",
+    )
 
 
 class UserFilmView(BaseTableSchema, UUIdMixin):
     __tablename__ = "user_film_view"
+    __table_args__ = (
+        # also serves lookups by user_id, so there is no separate index for it
+        sa.UniqueConstraint("user_id", "film_id", name="uq_user_film_view_user_id_film_id"),
+    )
 
     user_id: Mapped[int] = mapped_column(
         sa.ForeignKey(
@@ -82,7 +104,6 @@ class UserFilmView(BaseTableSchema, UUIdMixin):
             ondelete="RESTRICT",
             onupdate="CASCADE",
         ),
-        index=True,
     )
     film_id: Mapped[uuid.UUID] = mapped_column(
         sa.ForeignKey(
@@ -98,9 +119,55 @@ class UserFilmView(BaseTableSchema, UUIdMixin):
     )
 
 
+class FilmPopularity(BaseTableSchema):
+    """Показы фильма всем пользователям за день, неделю (`bucket` - начало периода) и всё время."""
+
+    __tablename__ = "film_popularity"
+
+    period: Mapped[str] = mapped_column(postgresql.TEXT, primary_key=True)
+    bucket: Mapped[dt.date] = mapped_column(sa.Date, primary_key=True)
+    film_id: Mapped[uuid.UUID] = mapped_column(
+        sa.ForeignKey(
+            "film.id",
+            ondelete="RESTRICT",
+            onupdate="CASCADE",
+        ),
+        primary_key=True,
+    )
+    views: Mapped[int] = mapped_column(
+        postgresql.INTEGER,
+        server_default=sa.text("0"),
+    )
+
+
+# индексы под постраничный вывод /history и /stats: страница читается из индекса подряд, без сортировки и пропуска строк
+sa.Index(
+    "ix_search_history_user_id_created_at_id",
+    SearchHistory.user_id,
+    SearchHistory.created_at.desc(),
+    SearchHistory.id.desc(),
+    postgresql_include=["request_text"],
+)
+sa.Index(
+    "ix_user_film_view_user_id_views_film_id",
+    UserFilmView.user_id,
+    UserFilmView.views.desc(),
+    UserFilmView.film_id.desc(),
+)
+# топ за период читается из индекса подряд, сколько бы фильмов ни смотрели
+sa.Index(
+    "ix_film_popularity_period_bucket_views_film_id",
+    FilmPopularity.period,
+    FilmPopularity.bucket,
+    FilmPopularity.views.desc(),
+    FilmPopularity.film_id.desc(),
+)
+
+
 __all__ = [
     "User",
     "Film",
     "UserFilmView",
     "SearchHistory",
+    "FilmPopularity",
 ]
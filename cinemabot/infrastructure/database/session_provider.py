@@ -1,55 +1,297 @@
+import asyncio
+import contextvars
+import dataclasses
+import logging
 import typing as tp
 import uuid
 from contextlib import asynccontextmanager
 
+import sqlalchemy as sa
 from sqlalchemy.ext import asyncio as sa_async
 
+from cinemabot.infrastructure.database.instrumentation import DatabaseMetrics, InstrumentedPool
+from cinemabot.infrastructure.database.replicas import Replica, ReplicaSet
 from cinemabot.infrastructure.settings import PostgresSettings
 
 
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class UnitOfWorkStats:
+    units: int = 0
+    # pool checkouts: a unit checks a connection out for every transaction
+    connections: int = 0
+    # connections held at the same time by one unit; more than one means nested sessions
+    max_connections_per_unit: int = 0
+
+    @property
+    def connections_per_unit(self) -> float:
+        return self.connections / self.units if self.units else 0.0
+
+
+@dataclasses.dataclass
+class UnitOfWork:
+    """
+    A session shared by all repository calls made by the task that opened it.
+
+    Every outermost `session()` block is a short transaction committed when the block exits, so the pool connection
+    is returned between repository calls and isn't held idle in transaction while the handler waits for the network.
+    """
+
+    session: sa_async.AsyncSession
+    owner: asyncio.Task[tp.Any] | None
+    connections: int = 0
+    held_connections: int = 0
+    max_held_connections: int = 0
+    # nesting level of `session()` blocks, the outermost one commits
+    depth: int = 0
+    # once the unit has written something, its reads go to the primary too, so they see those writes
+    has_writes: bool = False
+    _on_commit: list[tp.Callable[[], None]] = dataclasses.field(default_factory=list)
+    _after_commit: list[tp.Callable[[], tp.Awaitable[None]]] = dataclasses.field(default_factory=list)
+
+
+_current_unit_of_work: contextvars.ContextVar[UnitOfWork | None] = contextvars.ContextVar("current_unit_of_work", default=None)
+
+
+def _statement_cache_options(connection_settings: PostgresSettings) -> dict[str, tp.Any]:
+    if connection_settings.pgbouncer:
+        # with transaction pooling the next transaction may run on another server connection,
+        # so statements can't be prepared once and reused: every query is parsed and planned again
+        return {
+            "execution_options": {"prepare": False},
+            "connect_args": {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+            },
+        }
+    # direct connection: asyncpg prepares each distinct query once per connection and reuses the plan
+    return {
+        "connect_args": {
+            "statement_cache_size": connection_settings.statement_cache_size,
+            "prepared_statement_cache_size": connection_settings.statement_cache_size,
+        },
+    }
+
+
+def _create_engine(connection_settings: PostgresSettings, metrics: DatabaseMetrics, connect_timeout: float | None = None) -> sa_async.AsyncEngine:
+    options = _statement_cache_options(connection_settings)
+    if connect_timeout is not None:
+        options["connect_args"]["timeout"] = connect_timeout
+    engine = sa_async.create_async_engine(
+        connection_settings.dsn.get_secret_value(),
+        echo=False,
+        poolclass=InstrumentedPool,
+        pool_size=connection_settings.min_pool_size,
+        max_overflow=connection_settings.max_pool_size - connection_settings.min_pool_size,
+        **options,
+    )
+    metrics.instrument(engine, pool_capacity=connection_settings.max_pool_size)
+    return engine
+
+
+async def _ping(engine: sa_async.AsyncEngine) -> None:
+    async with engine.connect() as connection:
+        await connection.execute(sa.text("SELECT 1"))
+
+
+# errors after which a replica is considered down (as opposed to errors of a particular query)
+_CONNECTION_ERRORS = (OSError, asyncio.TimeoutError, sa.exc.OperationalError, sa.exc.InterfaceError)
+
+
 class AsyncPostgresSessionProvider:
     def __init__(
         self,
         connection_settings: PostgresSettings,
     ) -> None:
-        self._engine = sa_async.create_async_engine(
-            connection_settings.dsn.get_secret_value(),
-            echo=False,
-            pool_size=connection_settings.min_pool_size,
-            max_overflow=connection_settings.max_pool_size - connection_settings.min_pool_size,
-            execution_options={"prepare": False},
-            connect_args={  # for connection through pgbouncer
-                "statement_cache_size": 0,
-                "prepared_statement_cache_size": 0,
-                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
-            },
+        # pool checkouts and statements of the primary and the replicas, see `instrumentation.tag_methods`
+        self.metrics = DatabaseMetrics(slow_query_threshold=connection_settings.slow_query_ms / 1000)
+        self._engine = _create_engine(connection_settings, self.metrics)
+        self._replicas: ReplicaSet[sa_async.AsyncEngine] = ReplicaSet(
+            [
+                # replica connections are opened on the request path, so a replica that doesn't answer
+                # is given up on as quickly as on a ping and the read goes elsewhere
+                Replica(
+                    name=f"{replica.host}:{replica.port}",
+                    target=_create_engine(replica, self.metrics, connect_timeout=connection_settings.replica_health_check_timeout),
+                )
+                for replica in connection_settings.replicas
+            ],
+            in_use=lambda engine: engine.sync_engine.pool.checkedout(),  # type: ignore[attr-defined]
+            ping=_ping,
+            health_check_interval=connection_settings.replica_health_check_interval,
+            health_check_timeout=connection_settings.replica_health_check_timeout,
         )
         self._session_factory = sa_async.async_sessionmaker(
             bind=self._engine,
             expire_on_commit=False,
             class_=sa_async.AsyncSession,
         )
+        self.stats = UnitOfWorkStats()
+        sa.event.listen(self._engine.sync_engine.pool, "checkout", self._on_checkout)
+        sa.event.listen(self._engine.sync_engine.pool, "checkin", self._on_checkin)
 
     @asynccontextmanager
-    async def session(self) -> tp.AsyncGenerator[sa_async.AsyncSession, None]:
+    async def session(self, read_only: bool = False) -> tp.AsyncGenerator[sa_async.AsyncSession, None]:
         """
-        Create and manage a new AsyncSession.
+        Return the session of the current unit of work, or open a new unit of work for the duration of the block.
+
+        Nested calls made by the same task share one session (and so one pool connection) and are committed
+        together by the outermost block, which also returns the connection to the pool. Tasks spawned from it
+        inherit the context variable but get their own unit of work, because an AsyncSession must not be used
+        concurrently.
+
+        With `read_only=True` the block gets a separate session on a replica, if there are healthy ones and
+        the current unit of work hasn't written anything yet. Replicas lag behind the primary, so use it only
+        for reads that may miss the latest writes of other units of work. Blocks without `read_only` count
+        as writes of the unit.
 
         Usage:
             async with repository.session() as session:
                 # use session for database operations
                 result = await session.execute(...)
         """
-        session = self._session_factory()
-        try:
+        unit_of_work = self._get_current()
+        if read_only and (unit_of_work is None or not unit_of_work.has_writes):
+            replica_session = await self._replica_session()
+            if replica_session is not None:
+                async with replica_session:
+                    yield replica_session
+                return
+        if unit_of_work is not None:
+            async with self._transaction(unit_of_work, read_only) as session:
+                yield session
+            return
+        async with self.unit_of_work() as unit_of_work, self._transaction(unit_of_work, read_only) as session:
             yield session
-            await session.commit()
-        except Exception:
-            await session.rollback()
+
+    @asynccontextmanager
+    async def unit_of_work(self) -> tp.AsyncGenerator[UnitOfWork, None]:
+        """
+        Bind a session to the current task, e.g. for a whole Telegram update.
+
+        The session checks a connection out of the pool only on its first query, so units of work that don't touch
+        the database are free. Work done outside of `session()` blocks is committed when the block exits and
+        rolled back if it raises.
+        """
+        if self._get_current() is not None:
+            raise RuntimeError("Unit of work is already started in this task")
+        unit_of_work = UnitOfWork(session=self._session_factory(), owner=asyncio.current_task())
+        token = _current_unit_of_work.set(unit_of_work)
+        try:
+            yield unit_of_work
+        except BaseException:
+            _current_unit_of_work.reset(token)
+            await self._rollback(unit_of_work)
+            await self._close(unit_of_work)
             raise
+        _current_unit_of_work.reset(token)
+        try:
+            await self._commit(unit_of_work)
         finally:
-            await session.close()
+            await self._close(unit_of_work)
+
+    def on_commit(self, callback: tp.Callable[[], None]) -> None:
+        """Run `callback` after the current transaction is committed (immediately if there is none)."""
+        unit_of_work = self._get_current()
+        if unit_of_work is None or not unit_of_work.depth:
+            callback()
+        else:
+            unit_of_work._on_commit.append(callback)
+
+    async def after_commit(self, callback: tp.Callable[[], tp.Awaitable[None]]) -> None:
+        """Like `on_commit`, for coroutine callbacks, e.g. invalidation of external caches."""
+        unit_of_work = self._get_current()
+        if unit_of_work is None or not unit_of_work.depth:
+            await callback()
+        else:
+            unit_of_work._after_commit.append(callback)
+
+    async def start(self) -> None:
+        """Start health checks of replicas."""
+        await self._replicas.start()
 
     async def close(self) -> None:
-        """Close the engine and release all connections."""
+        """Close the engines and release all connections."""
+        if self.metrics.methods:
+            logger.info("Database metrics by repository method:\n%s", self.metrics.report())
+        await self._replicas.close()
+        for replica in self._replicas.replicas:
+            await replica.target.dispose()
         await self._engine.dispose()
+
+    async def _replica_session(self) -> sa_async.AsyncSession | None:
+        """A session with a connection to a healthy replica, or None to read from the primary."""
+        while (replica := self._replicas.choose()) is not None:
+            session = sa_async.AsyncSession(bind=replica.target, expire_on_commit=False)
+            try:
+                # the connection is checked out right away, so a replica that went down is noticed before the block runs
+                await session.connection()
+            except _CONNECTION_ERRORS as exc:
+                await session.close()
+                self._replicas.mark_unhealthy(replica, exc)
+                continue
+            return session
+        return None
+
+    @staticmethod
+    def _get_current() -> UnitOfWork | None:
+        unit_of_work = _current_unit_of_work.get()
+        if unit_of_work is None or unit_of_work.owner is not asyncio.current_task():
+            return None
+        return unit_of_work
+
+    @asynccontextmanager
+    async def _transaction(self, unit_of_work: UnitOfWork, read_only: bool) -> tp.AsyncGenerator[sa_async.AsyncSession, None]:
+        unit_of_work.has_writes = unit_of_work.has_writes or not read_only
+        unit_of_work.depth += 1
+        try:
+            yield unit_of_work.session
+        except BaseException:
+            unit_of_work.depth -= 1
+            if not unit_of_work.depth:
+                await self._rollback(unit_of_work)
+            raise
+        unit_of_work.depth -= 1
+        if not unit_of_work.depth:
+            await self._commit(unit_of_work)
+
+    @staticmethod
+    async def _commit(unit_of_work: UnitOfWork) -> None:
+        # commit releases the connection, the next block of the unit checks one out again
+        await unit_of_work.session.commit()
+        on_commit, unit_of_work._on_commit = unit_of_work._on_commit, []
+        after_commit, unit_of_work._after_commit = unit_of_work._after_commit, []
+        for callback in on_commit:
+            callback()
+        for async_callback in after_commit:
+            await async_callback()
+
+    @staticmethod
+    async def _rollback(unit_of_work: UnitOfWork) -> None:
+        unit_of_work._on_commit.clear()
+        unit_of_work._after_commit.clear()
+        await unit_of_work.session.rollback()
+
+    async def _close(self, unit_of_work: UnitOfWork) -> None:
+        await unit_of_work.session.close()
+        self.stats.units += 1
+        self.stats.connections += unit_of_work.connections
+        self.stats.max_connections_per_unit = max(self.stats.max_connections_per_unit, unit_of_work.max_held_connections)
+        if unit_of_work.max_held_connections > 1:
+            logger.warning("Unit of work held %d connections at once", unit_of_work.max_held_connections)
+
+    def _on_checkout(self, *_: tp.Any) -> None:
+        # the pool event runs in a greenlet that shares the context of the calling task
+        unit_of_work = _current_unit_of_work.get()
+        if unit_of_work is not None:
+            unit_of_work.connections += 1
+            unit_of_work.held_connections += 1
+            unit_of_work.max_held_connections = max(unit_of_work.max_held_connections, unit_of_work.held_connections)
+
+    def _on_checkin(self, *_: tp.Any) -> None:
+        unit_of_work = _current_unit_of_work.get()
+        if unit_of_work is not None and unit_of_work.held_connections:
+            unit_of_work.held_connections -= 1
@@ -0,0 +1,463 @@
+import asyncio
+import datetime as dt
+import typing as tp
+import uuid
+
+import asyncpg
+
+from cinemabot.domain.models import (
+    FilmRecord,
+    FilmStat,
+    FilmViewIncrement,
+    HistoryCursor,
+    HistoryEntry,
+    HistoryRecord,
+    PopularityIncrement,
+    StatsCursor,
+    TopPeriod,
+    UserFilmViewRecord,
+    UserRecord,
+)
+from cinemabot.domain.repository.storage import AbstractStorageRepository
+from cinemabot.infrastructure.database.replicas import Replica, ReplicaSet
+from cinemabot.infrastructure.repository.id_cache import IdCache
+from cinemabot.infrastructure.settings import PostgresSettings
+
+
+# Batches are passed as arrays and expanded with unnest(), so the SQL text doesn't depend on the batch size
+# and every statement is prepared once per connection (when the statement cache is enabled).
+_CREATE_USERS_CTE = """
+new_users AS (
+    INSERT INTO "user" (id, created_at, updated_at)
+    SELECT user_id, now(), now() FROM unnest($1::bigint[]) AS user_id ORDER BY user_id
+    ON CONFLICT (id) DO NOTHING
+)"""
+
+_CREATE_USER_QUERY = 'INSERT INTO "user" (id, created_at, updated_at) VALUES ($1, now(), now())'
+_GET_OR_CREATE_USER_QUERY = _CREATE_USER_QUERY + " ON CONFLICT (id) DO NOTHING"
+
+_FILM_COLUMNS = "id, kinopoisk_id, name_ru, name_eng, poster_size"
+_FILM_QUERY = f"SELECT {_FILM_COLUMNS} FROM film WHERE kinopoisk_id = $1"
+_UPSERT_FILM_QUERY = f"""
+INSERT INTO film (kinopoisk_id, name_ru, name_eng, poster_size, created_at, updated_at)
+VALUES ($1, $2, $3, $4, now(), now())
+ON CONFLICT (kinopoisk_id) DO UPDATE SET poster_size = coalesce(film.poster_size, excluded.poster_size)
+RETURNING {_FILM_COLUMNS}
+"""
+_FILM_POSTER_SIZE_QUERY = "SELECT id, poster_size FROM film WHERE kinopoisk_id = $1 LIMIT 1"
+
+_USER_FILM_VIEW_QUERY = "SELECT user_id, film_id, views FROM user_film_view WHERE user_id = $1 AND film_id = $2"
+_CREATE_USER_FILM_VIEW_QUERY = """
+INSERT INTO user_film_view (user_id, film_id, views, created_at, updated_at) VALUES ($1, $2, 0, now(), now())
+ON CONFLICT (user_id, film_id) DO NOTHING
+"""
+
+_INSERT_HISTORY_QUERY = """
+INSERT INTO search_history (id, user_id, request_text, created_at, updated_at)
+SELECT id, user_id, request_text, created_at, created_at
+FROM unnest($2::uuid[], $3::bigint[], $4::text[], $5::timestamptz[]) AS h(id, user_id, request_text, created_at)
+"""
+
+_UPSERT_VIEWS = """
+INSERT INTO user_film_view (user_id, film_id, views, created_at, updated_at)
+{select}
+ORDER BY 1, 2
+ON CONFLICT (user_id, film_id) DO UPDATE SET views = user_film_view.views + excluded.views, updated_at = now()
+"""
+# films known to exist: their ids come from the in-memory cache
+_INCREASE_VIEWS_QUERY = _UPSERT_VIEWS.format(
+    select="SELECT user_id, film_id, views, now(), now() FROM unnest($2::bigint[], $3::uuid[], $4::int[]) AS i(user_id, film_id, views)",
+)
+_UPSERT_FILMS_CTE = """
+film_rows AS (
+    INSERT INTO film (kinopoisk_id, name_ru, name_eng, poster_size, created_at, updated_at)
+    SELECT kinopoisk_id, name_ru, name_eng, poster_size, now(), now()
+    FROM unnest($2::int[], $3::text[], $4::text[], $5::int[]) AS f(kinopoisk_id, name_ru, name_eng, poster_size)
+    ORDER BY kinopoisk_id
+    ON CONFLICT (kinopoisk_id) DO UPDATE SET poster_size = coalesce(film.poster_size, excluded.poster_size)
+    RETURNING id, kinopoisk_id, poster_size
+)"""
+_UPSERT_FILM_VIEWS_CTE = "film_views AS ({})".format(
+    _UPSERT_VIEWS.format(
+        select="SELECT i.user_id, film_rows.id, i.views, now(), now() "
+        "FROM unnest($6::bigint[], $7::int[], $8::int[]) AS i(user_id, kinopoisk_id, views) "
+        "JOIN film_rows ON film_rows.kinopoisk_id = i.kinopoisk_id",
+    ),
+)
+_INCREASE_VIEWS_WITH_FILMS_QUERY = "SELECT id, kinopoisk_id, poster_size FROM film_rows"
+# global counters for /top are updated by the same statement as the per-user ones
+_UPSERT_POPULARITY = """
+film_popularity_rows AS (
+    INSERT INTO film_popularity (period, bucket, film_id, views, created_at, updated_at)
+    {select}
+    ORDER BY 1, 2, 3
+    ON CONFLICT (period, bucket, film_id) DO UPDATE SET views = film_popularity.views + excluded.views, updated_at = now()
+)"""
+_INCREASE_POPULARITY_CTE = _UPSERT_POPULARITY.format(
+    select="SELECT period, bucket, film_id, views, now(), now() "
+    "FROM unnest($5::text[], $6::date[], $7::uuid[], $8::int[]) AS p(period, bucket, film_id, views)",
+)
+_INCREASE_POPULARITY_WITH_FILMS_CTE = _UPSERT_POPULARITY.format(
+    select="SELECT p.period, p.bucket, film_rows.id, p.views, now(), now() "
+    "FROM unnest($9::text[], $10::date[], $11::int[], $12::int[]) AS p(period, bucket, kinopoisk_id, views) "
+    "JOIN film_rows ON film_rows.kinopoisk_id = p.kinopoisk_id",
+)
+
+_SEARCH_HISTORY_QUERY = """
+SELECT id, request_text, created_at FROM search_history
+WHERE user_id = $1 {after}
+ORDER BY created_at DESC, id DESC
+LIMIT $2
+"""
+_STATS_QUERY = """
+SELECT user_film_view.film_id, film.kinopoisk_id, film.name_ru, user_film_view.views
+FROM user_film_view JOIN film ON film.id = user_film_view.film_id
+WHERE user_film_view.user_id = $1 {after}
+ORDER BY user_film_view.views DESC, user_film_view.film_id DESC
+LIMIT $2
+"""
+_STREAM_SEARCH_HISTORY_QUERY = "SELECT id, request_text, created_at FROM search_history WHERE user_id = $1 ORDER BY created_at DESC, id DESC"
+_STREAM_STATS_QUERY = """
+SELECT user_film_view.film_id, film.kinopoisk_id, film.name_ru, user_film_view.views
+FROM user_film_view JOIN film ON film.id = user_film_view.film_id
+WHERE user_film_view.user_id = $1
+ORDER BY user_film_view.views DESC, user_film_view.film_id DESC
+"""
+_TOP_FILMS_QUERY = """
+SELECT film_popularity.film_id, film.kinopoisk_id, film.name_ru, film_popularity.views
+FROM film_popularity JOIN film ON film.id = film_popularity.film_id
+WHERE film_popularity.period = $1 AND film_popularity.bucket = $2
+ORDER BY film_popularity.views DESC, film_popularity.film_id DESC
+LIMIT $3
+"""
+
+
+# errors after which a replica is considered down (as opposed to errors of a particular query)
+_CONNECTION_ERRORS = (OSError, asyncio.TimeoutError, asyncpg.InterfaceError, asyncpg.PostgresConnectionError, asyncpg.CannotConnectNowError)
+
+
+async def _create_pool(settings: PostgresSettings, min_size: int, connect_timeout: float = 60) -> asyncpg.Pool:
+    return await asyncpg.create_pool(
+        host=settings.host,
+        port=settings.port,
+        user=settings.user,
+        password=settings.password.get_secret_value(),
+        database=settings.database,
+        min_size=min_size,
+        max_size=settings.max_pool_size,
+        # pgbouncer in transaction pooling mode can't keep prepared statements between transactions
+        statement_cache_size=0 if settings.pgbouncer else settings.statement_cache_size,
+        timeout=connect_timeout,
+    )
+
+
+def _with_users(query: str, *ctes: str, create_users: bool) -> str:
+    """Prepend CTEs to `query`; the users CTE always takes `$1`, so it is replaced by a no-op one when not needed."""
+    if not create_users:
+        ctes = ("skipped_users AS (SELECT $1::bigint[])", *ctes)
+    else:
+        ctes = (_CREATE_USERS_CTE, *ctes)
+    return "WITH " + ",\n".join(ctes) + "\n" + query
+
+
+class AsyncpgStorageRepository(AbstractStorageRepository):
+    """
+    Storage on a plain asyncpg pool: hand-written SQL and rows returned as lightweight tuples, without the ORM.
+
+    It mirrors `StorageRepository` query for query (same keyset pagination, batch upserts and in-memory id caches),
+    but every call is a single statement on an autocommit connection borrowed from the pool just for that statement.
+    History, stats and top reads go to replicas when they are configured (see `PostgresSettings.replica_dsns`).
+    """
+
+    def __init__(
+        self,
+        connection_settings: PostgresSettings,
+        known_users_max_size: int = 100_000,
+        films_max_size: int = 50_000,
+        warm_up: bool = True,
+    ) -> None:
+        self._connection_settings = connection_settings
+        self._warm_up = warm_up
+        self._ids = IdCache(known_users_max_size=known_users_max_size, films_max_size=films_max_size)
+        self._pool: asyncpg.Pool | None = None
+        self._replicas: ReplicaSet[asyncpg.Pool] = ReplicaSet(
+            [],
+            in_use=lambda pool: pool.get_size() - pool.get_idle_size(),
+            ping=lambda pool: pool.fetchval("SELECT 1"),
+            health_check_interval=connection_settings.replica_health_check_interval,
+            health_check_timeout=connection_settings.replica_health_check_timeout,
+        )
+
+    @property
+    def pool(self) -> asyncpg.Pool:
+        if self._pool is None:
+            raise RuntimeError("Repository is not started, call `start()` first")
+        return self._pool
+
+    async def start(self) -> None:
+        if self._pool is None:
+            self._pool = await _create_pool(self._connection_settings, min_size=self._connection_settings.min_pool_size)
+            # replica pools open connections on demand: a replica that is down must not stop the bot from starting;
+            # they are opened on the request path, so a replica that doesn't answer is given up on as quickly as on a ping
+            self._replicas.replicas = [
+                Replica(
+                    name=f"{replica.host}:{replica.port}",
+                    target=await _create_pool(replica, min_size=0, connect_timeout=self._connection_settings.replica_health_check_timeout),
+                )
+                for replica in self._connection_settings.replicas
+            ]
+            await self._replicas.start()
+        if not self._warm_up:
+            return
+        async with self.pool.acquire() as connection:
+            user_rows = await connection.fetch('SELECT id FROM "user" ORDER BY created_at DESC LIMIT $1', self._ids.known_users.max_size)
+            self._ids.remember_users(row[0] for row in reversed(user_rows))
+            film_rows = await connection.fetch(
+                "SELECT kinopoisk_id, id, poster_size FROM film ORDER BY created_at DESC LIMIT $1",
+                self._ids.films.max_size,
+            )
+            for kinopoisk_id, film_id, poster_size in reversed(film_rows):
+                self._ids.remember_film(kinopoisk_id, film_id, poster_size)
+
+    async def close(self) -> None:
+        await self._replicas.close()
+        for replica in self._replicas.replicas:
+            await replica.target.close()
+        self._replicas.replicas = []
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def _fetch_read_only(self, query: str, *args: tp.Any) -> list[asyncpg.Record]:
+        """Run a read on a healthy replica, on the primary if there are none or the chosen one turns out to be down."""
+        while (replica := self._replicas.choose()) is not None:
+            try:
+                return await replica.target.fetch(query, *args)
+            except _CONNECTION_ERRORS as exc:
+                self._replicas.mark_unhealthy(replica, exc)
+        return await self.pool.fetch(query, *args)
+
+    async def _stream_read_only(self, query: str, *args: tp.Any, chunk_size: int) -> tp.AsyncIterator[asyncpg.Record]:
+        """Read rows with a server-side cursor, `chunk_size` rows per round trip, on a replica if there is a healthy one."""
+        pool, connection = None, None
+        while connection is None and (replica := self._replicas.choose()) is not None:
+            try:
+                pool, connection = replica.target, await replica.target.acquire()
+            except _CONNECTION_ERRORS as exc:
+                self._replicas.mark_unhealthy(replica, exc)
+        if connection is None:
+            pool, connection = self.pool, await self.pool.acquire()
+        try:
+            # cursors live only inside a transaction
+            async with connection.transaction():
+                async for row in connection.cursor(query, *args, prefetch=chunk_size):
+                    yield row
+        finally:
+            await pool.release(connection)
+
+    async def create_user(
+        self,
+        user_id: int,
+        get_or_create: bool = False,
+    ) -> UserRecord:
+        if get_or_create and self._ids.is_known_user(user_id):
+            return UserRecord(id=user_id)
+        await self.pool.execute(_GET_OR_CREATE_USER_QUERY if get_or_create else _CREATE_USER_QUERY, user_id)
+        self._ids.remember_users([user_id])
+        return UserRecord(id=user_id)
+
+    async def get_or_create_film(
+        self,
+        film_kinopoisk_id: int,
+        film_name_ru: str | None,
+        film_name_eng: str | None,
+        poster_size: int | None = None,
+    ) -> FilmRecord:
+        async with self.pool.acquire() as connection:
+            film_row = await connection.fetchrow(_FILM_QUERY, film_kinopoisk_id)
+            if film_row is None or (film_row["poster_size"] is None and poster_size is not None):
+                film_row = await connection.fetchrow(_UPSERT_FILM_QUERY, film_kinopoisk_id, film_name_ru or "", film_name_eng or "", poster_size)
+        film = FilmRecord(*film_row)
+        self._ids.remember_film(film.kinopoisk_id, film.id, film.poster_size)
+        return film
+
+    async def get_film_poster_size(
+        self,
+        film_kinopoisk_id: int,
+    ) -> int | None:
+        cached_film = self._ids.film(film_kinopoisk_id)
+        if cached_film is not None:
+            return cached_film.poster_size
+        film_row = await self.pool.fetchrow(_FILM_POSTER_SIZE_QUERY, film_kinopoisk_id)
+        if film_row is None:
+            return None
+        self._ids.remember_film(film_kinopoisk_id, film_row["id"], film_row["poster_size"])
+        return film_row["poster_size"]
+
+    async def get_or_create_user_film_view(
+        self,
+        user_id: int,
+        film_id: uuid.UUID,
+    ) -> UserFilmViewRecord:
+        async with self.pool.acquire() as connection:
+            view_row = await connection.fetchrow(_USER_FILM_VIEW_QUERY, user_id, film_id)
+            if view_row is None:
+                await connection.execute(_CREATE_USER_FILM_VIEW_QUERY, user_id, film_id)
+                view_row = await connection.fetchrow(_USER_FILM_VIEW_QUERY, user_id, film_id)
+        return UserFilmViewRecord(*view_row)
+
+    async def add_request_to_history(
+        self,
+        user_id: int,
+        request_text: str,
+    ) -> None:
+        query = "INSERT INTO search_history (user_id, request_text, created_at, updated_at) VALUES ($1, $2, now(), now())"
+        if not self._ids.is_known_user(user_id):
+            query = f"WITH new_users AS (INSERT INTO \"user\" (id, created_at, updated_at) VALUES ($1, now(), now()) ON CONFLICT (id) DO NOTHING)\n{query}"
+        await self.pool.execute(query, user_id, request_text)
+        self._ids.remember_users([user_id])
+
+    async def add_requests_to_history(
+        self,
+        records: list[HistoryRecord],
+    ) -> None:
+        if not records:
+            return
+        user_ids = {record.user_id for record in records}
+        unknown_user_ids = self._ids.unknown_users(user_ids)
+        await self.pool.execute(
+            _with_users(_INSERT_HISTORY_QUERY, create_users=bool(unknown_user_ids)),
+            list(unknown_user_ids),
+            [record.id for record in records],
+            [record.user_id for record in records],
+            [record.request_text for record in records],
+            [record.created_at for record in records],
+        )
+        self._ids.remember_users(user_ids)
+
+    async def increase_number_of_film_view(
+        self,
+        user_id: int,
+        film_kinopoisk_id: int,
+        film_name_ru: str,
+        film_name_eng: str,
+        poster_size: int | None = None,
+    ) -> None:
+        increment = FilmViewIncrement(
+            user_id=user_id,
+            film_kinopoisk_id=film_kinopoisk_id,
+            film_name_ru=film_name_ru,
+            film_name_eng=film_name_eng,
+            poster_size=poster_size,
+        )
+        await self.increase_number_of_film_views([increment])
+
+    async def increase_number_of_film_views(
+        self,
+        increments: list[FilmViewIncrement],
+    ) -> None:
+        # the same single-statement upsert as in StorageRepository: no lost increments, rows locked in a stable order
+        if not increments:
+            return
+        user_ids = {increment.user_id for increment in increments}
+        unknown_user_ids = list(self._ids.unknown_users(user_ids))
+        films = {increment.film_kinopoisk_id: increment for increment in increments}
+        popularity = PopularityIncrement.from_views(increments, dt.datetime.now(dt.timezone.utc))
+
+        if not any(self._ids.film_needs_upsert(film) for film in films.values()):
+            await self.pool.execute(
+                _with_users(_INCREASE_VIEWS_QUERY, _INCREASE_POPULARITY_CTE, create_users=bool(unknown_user_ids)),
+                unknown_user_ids,
+                [increment.user_id for increment in increments],
+                [self._ids.film(increment.film_kinopoisk_id).id for increment in increments],  # type: ignore[union-attr]
+                [increment.views for increment in increments],
+                [row.period.value for row in popularity],
+                [row.bucket for row in popularity],
+                [self._ids.film(row.film_kinopoisk_id).id for row in popularity],  # type: ignore[union-attr]
+                [row.views for row in popularity],
+            )
+        else:
+            film_rows = await self.pool.fetch(
+                _with_users(
+                    _INCREASE_VIEWS_WITH_FILMS_QUERY,
+                    _UPSERT_FILMS_CTE,
+                    _UPSERT_FILM_VIEWS_CTE,
+                    _INCREASE_POPULARITY_WITH_FILMS_CTE,
+                    create_users=bool(unknown_user_ids),
+                ),
+                unknown_user_ids,
+                [film.film_kinopoisk_id for film in films.values()],
+                [film.film_name_ru or "" for film in films.values()],
+                [film.film_name_eng or "" for film in films.values()],
+                [film.poster_size for film in films.values()],
+                [increment.user_id for increment in increments],
+                [increment.film_kinopoisk_id for increment in increments],
+                [increment.views for increment in increments],
+                [row.period.value for row in popularity],
+                [row.bucket for row in popularity],
+                [row.film_kinopoisk_id for row in popularity],
+                [row.views for row in popularity],
+            )
+            for film_id, kinopoisk_id, poster_size in film_rows:
+                self._ids.remember_film(kinopoisk_id, film_id, poster_size)
+        self._ids.remember_users(user_ids)
+
+    async def get_search_history(
+        self,
+        user_id: int,
+        after: HistoryCursor | None = None,
+        page_size: int = 10,
+    ) -> list[HistoryEntry]:
+        if after is None:
+            history_rows = await self._fetch_read_only(_SEARCH_HISTORY_QUERY.format(after=""), user_id, page_size)
+        else:
+            history_rows = await self._fetch_read_only(
+                _SEARCH_HISTORY_QUERY.format(after="AND (created_at, id) < ($3, $4)"),
+                user_id,
+                page_size,
+                after.created_at,
+                after.id,
+            )
+        return [HistoryEntry(*row) for row in history_rows]
+
+    async def get_stats(
+        self,
+        user_id: int,
+        after: StatsCursor | None = None,
+        page_size: int = 10,
+    ) -> list[FilmStat]:
+        if after is None:
+            stat_rows = await self._fetch_read_only(_STATS_QUERY.format(after=""), user_id, page_size)
+        else:
+            stat_rows = await self._fetch_read_only(
+                _STATS_QUERY.format(after="AND (user_film_view.views, user_film_view.film_id) < ($3, $4)"),
+                user_id,
+                page_size,
+                after.views,
+                after.film_id,
+            )
+        return [FilmStat(*row) for row in stat_rows]
+
+    async def stream_search_history(
+        self,
+        user_id: int,
+        chunk_size: int = 1000,
+    ) -> tp.AsyncIterator[HistoryEntry]:
+        async for row in self._stream_read_only(_STREAM_SEARCH_HISTORY_QUERY, user_id, chunk_size=chunk_size):
+            yield HistoryEntry(*row)
+
+    async def stream_stats(
+        self,
+        user_id: int,
+        chunk_size: int = 1000,
+    ) -> tp.AsyncIterator[FilmStat]:
+        async for row in self._stream_read_only(_STREAM_STATS_QUERY, user_id, chunk_size=chunk_size):
+            yield FilmStat(*row)
+
+    async def get_top_films(
+        self,
+        period: TopPeriod,
+        limit: int = 10,
+    ) -> list[FilmStat]:
+        top_rows = await self._fetch_read_only(_TOP_FILMS_QUERY, period.value, period.bucket(dt.datetime.now(dt.timezone.utc)), limit)
+        return [FilmStat(*row) for row in top_rows]
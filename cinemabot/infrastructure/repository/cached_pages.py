@@ -0,0 +1,239 @@
+import collections
+import datetime as dt
+import functools
+import typing as tp
+import uuid
+
+from cinemabot.domain.models import (
+    FilmRecord,
+    FilmStat,
+    FilmViewIncrement,
+    HistoryCursor,
+    HistoryEntry,
+    HistoryRecord,
+    StatsCursor,
+    TopPeriod,
+    UserFilmViewRecord,
+    UserRecord,
+)
+from cinemabot.domain.repository.storage import AbstractStorageRepository
+from cinemabot.infrastructure.cache import AbstractCache
+from cinemabot.infrastructure.database.replicas import primary_reads
+from cinemabot.infrastructure.database.session_provider import AsyncPostgresSessionProvider
+
+
+T = tp.TypeVar("T", HistoryEntry, FilmStat)
+
+
+def _encode_history(entries: list[HistoryEntry]) -> list[list[str]]:
+    return [[str(entry.id), entry.request_text, entry.created_at.isoformat()] for entry in entries]
+
+
+def _decode_history(data: list[list[str]]) -> list[HistoryEntry]:
+    return [HistoryEntry(id=uuid.UUID(id_), request_text=text, created_at=dt.datetime.fromisoformat(created_at)) for id_, text, created_at in data]
+
+
+def _encode_stats(stats: list[FilmStat]) -> list[list[tp.Any]]:
+    return [[str(stat.film_id), stat.kinopoisk_id, stat.name_ru, stat.views] for stat in stats]
+
+
+def _decode_stats(data: list[list[tp.Any]]) -> list[FilmStat]:
+    return [FilmStat(film_id=uuid.UUID(film_id), kinopoisk_id=kinopoisk_id, name_ru=name_ru, views=views) for film_id, kinopoisk_id, name_ru, views in data]
+
+
+def _page(entries: list[T], complete: bool, after: HistoryCursor | StatsCursor | None, page_size: int) -> list[T] | None:
+    """Страница из закэшированного начала списка или None, если её там нет целиком."""
+    start = 0
+    if after is not None:
+        cursors = [entry.cursor for entry in entries]
+        if after not in cursors:
+            return None
+        start = cursors.index(after) + 1
+    page = entries[start : start + page_size]
+    if len(page) < page_size and not complete:
+        return None
+    return page
+
+
+class CachedPagesStorageRepository(AbstractStorageRepository):
+    """
+    Репозиторий, который держит в кэше начало истории поиска и статистики показов каждого пользователя.
+
+    В кэше лежат первые `cached_entries` записей (одна-две страницы), поэтому повторное открытие `/history` и `/stats`
+    не обращается к базе. При записи закэшированные списки пользователя обновляются на месте: новые запросы встают
+    в историю, счётчики уже показанных в статистике фильмов увеличиваются. Если фильма в закэшированной статистике нет,
+    его место в ней неизвестно, и запись этого пользователя удаляется - остальные записи кэша не трогаются.
+
+    Списки правятся атомарно (`AbstractCache.update`) и только после коммита, если передан `session_provider`:
+    откаченная запись не попадает в кэш. Перед записью увеличивается ревизия ключа, поэтому список, прочитанный
+    из базы до записи (в том числе другой репликой), не кладётся в кэш поверх неё. В закэшированном списке хранится
+    ревизия, с которой его начали читать: список, начатый уже после записи, может её содержать, и такой список
+    не правится, а удаляется, чтобы не учесть запись дважды.
+    """
+
+    def __init__(
+        self,
+        repository: AbstractStorageRepository,
+        history_cache: AbstractCache,
+        stats_cache: AbstractCache,
+        cached_entries: int,
+        session_provider: AsyncPostgresSessionProvider | None = None,
+    ) -> None:
+        self._repository = repository
+        self._session_provider = session_provider
+        self._history_cache = history_cache
+        self._stats_cache = stats_cache
+        self.cached_entries = cached_entries
+
+    async def create_user(self, user_id: int, get_or_create: bool = False) -> UserRecord:
+        return await self._repository.create_user(user_id, get_or_create)
+
+    async def get_or_create_film(
+        self,
+        film_kinopoisk_id: int,
+        film_name_ru: str,
+        film_name_eng: str,
+        poster_size: int | None = None,
+    ) -> FilmRecord:
+        return await self._repository.get_or_create_film(film_kinopoisk_id, film_name_ru, film_name_eng, poster_size)
+
+    async def get_film_poster_size(self, film_kinopoisk_id: int) -> int | None:
+        return await self._repository.get_film_poster_size(film_kinopoisk_id)
+
+    async def get_or_create_user_film_view(self, user_id: int, film_id: uuid.UUID) -> UserFilmViewRecord:
+        return await self._repository.get_or_create_user_film_view(user_id, film_id)
+
+    async def add_request_to_history(self, user_id: int, request_text: str) -> None:
+        await self.add_requests_to_history([HistoryRecord.new(user_id=user_id, request_text=request_text)])
+
+    async def add_requests_to_history(self, records: list[HistoryRecord]) -> None:
+        by_user: collections.defaultdict[int, list[HistoryRecord]] = collections.defaultdict(list)
+        for record in records:
+            by_user[record.user_id].append(record)
+        revisions = {user_id: await self._history_cache.bump_revision(str(user_id)) for user_id in by_user}
+        await self._repository.add_requests_to_history(records)
+
+        async def update() -> None:
+            for user_id, user_records in by_user.items():
+                new_entries = [HistoryEntry(id=record.id, request_text=record.request_text, created_at=record.created_at) for record in user_records]
+                await self._history_cache.update(str(user_id), functools.partial(self._add_history, write_revision=revisions[user_id], new_entries=new_entries))
+
+        await self._after_commit(update)
+
+    async def increase_number_of_film_view(
+        self,
+        user_id: int,
+        film_kinopoisk_id: int,
+        film_name_ru: str,
+        film_name_eng: str,
+        poster_size: int | None = None,
+    ) -> None:
+        increment = FilmViewIncrement(
+            user_id=user_id,
+            film_kinopoisk_id=film_kinopoisk_id,
+            film_name_ru=film_name_ru,
+            film_name_eng=film_name_eng,
+            poster_size=poster_size,
+        )
+        await self.increase_number_of_film_views([increment])
+
+    async def increase_number_of_film_views(self, increments: list[FilmViewIncrement]) -> None:
+        by_user: collections.defaultdict[int, list[FilmViewIncrement]] = collections.defaultdict(list)
+        for increment in increments:
+            by_user[increment.user_id].append(increment)
+        revisions = {user_id: await self._stats_cache.bump_revision(str(user_id)) for user_id in by_user}
+        await self._repository.increase_number_of_film_views(increments)
+
+        async def update() -> None:
+            for user_id, user_increments in by_user.items():
+                await self._stats_cache.update(str(user_id), functools.partial(self._add_views, write_revision=revisions[user_id], increments=user_increments))
+
+        await self._after_commit(update)
+
+    async def get_search_history(self, user_id: int, after: HistoryCursor | None = None, page_size: int = 10) -> list[HistoryEntry]:
+        cached = await self._history_cache.get(str(user_id))
+        if cached is None and after is None:
+            cached = await self._fill_history(user_id)
+        if cached is not None:
+            page = _page(_decode_history(cached["entries"]), cached["complete"], after, page_size)
+            if page is not None:
+                return page
+        return await self._repository.get_search_history(user_id, after, page_size)
+
+    async def get_stats(self, user_id: int, after: StatsCursor | None = None, page_size: int = 10) -> list[FilmStat]:
+        cached = await self._stats_cache.get(str(user_id))
+        if cached is None and after is None:
+            cached = await self._fill_stats(user_id)
+        if cached is not None:
+            page = _page(_decode_stats(cached["entries"]), cached["complete"], after, page_size)
+            if page is not None:
+                return page
+        return await self._repository.get_stats(user_id, after, page_size)
+
+    def stream_search_history(self, user_id: int, chunk_size: int = 1000) -> tp.AsyncIterator[HistoryEntry]:
+        return self._repository.stream_search_history(user_id, chunk_size)
+
+    def stream_stats(self, user_id: int, chunk_size: int = 1000) -> tp.AsyncIterator[FilmStat]:
+        return self._repository.stream_stats(user_id, chunk_size)
+
+    async def get_top_films(self, period: TopPeriod, limit: int = 10) -> list[FilmStat]:
+        return await self._repository.get_top_films(period, limit)
+
+    async def start(self) -> None:
+        await self._repository.start()
+
+    async def close(self) -> None:
+        await self._repository.close()
+
+    async def _fill_history(self, user_id: int) -> dict[str, tp.Any]:
+        revision = await self._history_cache.revision(str(user_id))
+        # на одну запись больше, чтобы понять, вся ли история поместилась в кэш;
+        # читаем с основной базы: реплика может отставать, а пропущенная запись не появилась бы в кэше до его истечения
+        with primary_reads():
+            entries = await self._repository.get_search_history(user_id, page_size=self.cached_entries + 1)
+        cached = self._history_value(revision or 0, entries, complete=True)
+        await self._history_cache.set_if_revision(str(user_id), cached, revision)
+        return cached
+
+    async def _fill_stats(self, user_id: int) -> dict[str, tp.Any]:
+        revision = await self._stats_cache.revision(str(user_id))
+        with primary_reads():
+            stats = await self._repository.get_stats(user_id, page_size=self.cached_entries + 1)
+        cached = self._stats_value(revision or 0, stats, complete=True)
+        await self._stats_cache.set_if_revision(str(user_id), cached, revision)
+        return cached
+
+    def _add_history(self, cached: dict[str, tp.Any], write_revision: int | None, new_entries: list[HistoryEntry]) -> dict[str, tp.Any] | None:
+        # список, начатый после увеличения ревизии, мог уже прочитать эту запись
+        revision = cached.get("revision", 0)
+        if write_revision is None or revision >= write_revision:
+            return None
+        entries = sorted(_decode_history(cached["entries"]) + new_entries, key=lambda entry: entry.cursor, reverse=True)
+        return self._history_value(revision, entries, cached["complete"])
+
+    def _add_views(self, cached: dict[str, tp.Any], write_revision: int | None, increments: list[FilmViewIncrement]) -> dict[str, tp.Any] | None:
+        revision = cached.get("revision", 0)
+        if write_revision is None or revision >= write_revision:
+            return None
+        stats = {stat.kinopoisk_id: stat for stat in _decode_stats(cached["entries"])}
+        if any(increment.film_kinopoisk_id not in stats for increment in increments):
+            return None
+        for increment in increments:
+            stat = stats[increment.film_kinopoisk_id]
+            stats[increment.film_kinopoisk_id] = stat._replace(views=stat.views + increment.views)
+        entries = sorted(stats.values(), key=lambda stat: stat.cursor, reverse=True)
+        return self._stats_value(revision, entries, cached["complete"])
+
+    def _history_value(self, revision: int, entries: list[HistoryEntry], complete: bool) -> dict[str, tp.Any]:
+        complete = complete and len(entries) <= self.cached_entries
+        return {"revision": revision, "complete": complete, "entries": _encode_history(entries[: self.cached_entries])}
+
+    def _stats_value(self, revision: int, stats: list[FilmStat], complete: bool) -> dict[str, tp.Any]:
+        complete = complete and len(stats) <= self.cached_entries
+        return {"revision": revision, "complete": complete, "entries": _encode_stats(stats[: self.cached_entries])}
+
+    async def _after_commit(self, callback: tp.Callable[[], tp.Awaitable[None]]) -> None:
+        if self._session_provider is None:
+            await callback()
+        else:
+            await self._session_provider.after_commit(callback)
@@ -0,0 +1,46 @@
+import typing as tp
+import uuid
+
+from cinemabot.domain.models import FilmViewIncrement
+from cinemabot.infrastructure.cache import LRUDict
+
+
+class CachedFilm(tp.NamedTuple):
+    id: uuid.UUID
+    poster_size: int | None
+
+
+class IdCache:
+    """
+    Bounded in-process caches of rows that are never deleted: ids of users known to exist and kinopoisk_id -> film id.
+
+    They let repositories skip existence checks and id lookups on the hot path. Callers must fill them only
+    with rows that are committed, otherwise a missing row would be taken for an existing one.
+    """
+
+    def __init__(self, known_users_max_size: int, films_max_size: int) -> None:
+        self.known_users: LRUDict[int, bool] = LRUDict(max_size=known_users_max_size)
+        self.films: LRUDict[int, CachedFilm] = LRUDict(max_size=films_max_size)
+
+    def is_known_user(self, user_id: int) -> bool:
+        return bool(self.known_users.get(user_id))
+
+    def unknown_users(self, user_ids: set[int]) -> set[int]:
+        return {user_id for user_id in user_ids if not self.known_users.get(user_id)}
+
+    def remember_users(self, user_ids: tp.Iterable[int]) -> None:
+        for user_id in user_ids:
+            self.known_users.put(user_id, True)
+
+    def film(self, kinopoisk_id: int) -> CachedFilm | None:
+        return self.films.get(kinopoisk_id)
+
+    def remember_film(self, kinopoisk_id: int, film_id: uuid.UUID, poster_size: int | None) -> None:
+        self.films.put(kinopoisk_id, CachedFilm(film_id, poster_size))
+
+    def film_needs_upsert(self, increment: FilmViewIncrement) -> bool:
+        """The film row has to be created, or its poster size is unknown and the increment brings it."""
+        cached_film = self.films.get(increment.film_kinopoisk_id)
+        if cached_film is None:
+            return True
+        return cached_film.poster_size is None and increment.poster_size is not None
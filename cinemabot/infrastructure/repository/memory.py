@@ -0,0 +1,231 @@
+import bisect
+import collections
+import datetime as dt
+import typing as tp
+import uuid
+
+from cinemabot.domain.models import (
+    FilmRecord,
+    FilmStat,
+    FilmViewIncrement,
+    HistoryCursor,
+    HistoryEntry,
+    HistoryRecord,
+    PopularityIncrement,
+    StatsCursor,
+    TopPeriod,
+    UserFilmViewRecord,
+    UserRecord,
+)
+from cinemabot.domain.repository.storage import AbstractStorageRepository
+
+
+K = tp.TypeVar("K", HistoryCursor, StatsCursor)
+
+
+class SortedIndex(tp.Generic[K]):
+    """Ключи в порядке возрастания; страницы отдаются от больших ключей к меньшим, как keyset-запросы к индексам Postgres."""
+
+    def __init__(self) -> None:
+        self._keys: list[K] = []
+
+    def add(self, key: K) -> None:
+        bisect.insort(self._keys, key)
+
+    def remove(self, key: K) -> None:
+        del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def page(self, after: K | None, size: int) -> list[K]:
+        end = len(self._keys) if after is None else bisect.bisect_left(self._keys, after)
+        return self._keys[max(end - size, 0) : end][::-1]
+
+
+class Counters:
+    """Счётчики показов фильмов с индексом по (показы, id фильма) для постраничного вывода."""
+
+    def __init__(self) -> None:
+        self.views: dict[uuid.UUID, int] = {}
+        self.index: SortedIndex[StatsCursor] = SortedIndex()
+
+    def increase(self, film_id: uuid.UUID, views: int) -> int:
+        current = self.views.get(film_id)
+        if current is not None:
+            self.index.remove(StatsCursor(views=current, film_id=film_id))
+        self.views[film_id] = (current or 0) + views
+        self.index.add(StatsCursor(views=self.views[film_id], film_id=film_id))
+        return self.views[film_id]
+
+
+class MemoryStorageRepository(AbstractStorageRepository):
+    """
+    Хранилище в памяти процесса: словари вместо таблиц и отсортированные списки вместо индексов.
+
+    Ведёт себя так же, как репозитории на Postgres (тот же порядок и те же курсоры страниц), но ничего не сохраняет
+    между запусками. Нужно, чтобы профилировать обработчики и гонять бенчмарки без внешних сервисов.
+    Методы не ждут ничего внутри, поэтому в одном event loop каждый из них выполняется атомарно.
+    """
+
+    def __init__(self) -> None:
+        self._users: set[int] = set()
+        self._films: dict[uuid.UUID, FilmRecord] = {}
+        self._film_ids: dict[int, uuid.UUID] = {}
+        self._history: collections.defaultdict[int, dict[HistoryCursor, str]] = collections.defaultdict(dict)
+        self._history_index: collections.defaultdict[int, SortedIndex[HistoryCursor]] = collections.defaultdict(SortedIndex)
+        self._stats: collections.defaultdict[int, Counters] = collections.defaultdict(Counters)
+        self._popularity: collections.defaultdict[tuple[TopPeriod, dt.date], Counters] = collections.defaultdict(Counters)
+
+    async def create_user(
+        self,
+        user_id: int,
+        get_or_create: bool = False,
+    ) -> UserRecord:
+        if user_id in self._users and not get_or_create:
+            raise ValueError(f"User {user_id} already exists")
+        self._users.add(user_id)
+        return UserRecord(id=user_id)
+
+    async def get_or_create_film(
+        self,
+        film_kinopoisk_id: int,
+        film_name_ru: str | None,
+        film_name_eng: str | None,
+        poster_size: int | None = None,
+    ) -> FilmRecord:
+        return self._upsert_film(film_kinopoisk_id, film_name_ru, film_name_eng, poster_size)
+
+    async def get_film_poster_size(
+        self,
+        film_kinopoisk_id: int,
+    ) -> int | None:
+        film_id = self._film_ids.get(film_kinopoisk_id)
+        return self._films[film_id].poster_size if film_id is not None else None
+
+    async def get_or_create_user_film_view(
+        self,
+        user_id: int,
+        film_id: uuid.UUID,
+    ) -> UserFilmViewRecord:
+        self._users.add(user_id)
+        views = self._stats[user_id].increase(film_id, 0)
+        return UserFilmViewRecord(user_id=user_id, film_id=film_id, views=views)
+
+    async def add_request_to_history(
+        self,
+        user_id: int,
+        request_text: str,
+    ) -> None:
+        await self.add_requests_to_history([HistoryRecord.new(user_id=user_id, request_text=request_text)])
+
+    async def add_requests_to_history(
+        self,
+        records: list[HistoryRecord],
+    ) -> None:
+        for record in records:
+            self._users.add(record.user_id)
+            cursor = HistoryCursor(created_at=record.created_at, id=record.id)
+            self._history[record.user_id][cursor] = record.request_text
+            self._history_index[record.user_id].add(cursor)
+
+    async def increase_number_of_film_view(
+        self,
+        user_id: int,
+        film_kinopoisk_id: int,
+        film_name_ru: str,
+        film_name_eng: str,
+        poster_size: int | None = None,
+    ) -> None:
+        increment = FilmViewIncrement(
+            user_id=user_id,
+            film_kinopoisk_id=film_kinopoisk_id,
+            film_name_ru=film_name_ru,
+            film_name_eng=film_name_eng,
+            poster_size=poster_size,
+        )
+        await self.increase_number_of_film_views([increment])
+
+    async def increase_number_of_film_views(
+        self,
+        increments: list[FilmViewIncrement],
+    ) -> None:
+        for increment in increments:
+            film = self._upsert_film(increment.film_kinopoisk_id, increment.film_name_ru, increment.film_name_eng, increment.poster_size)
+            self._users.add(increment.user_id)
+            self._stats[increment.user_id].increase(film.id, increment.views)
+        for row in PopularityIncrement.from_views(increments, dt.datetime.now(dt.timezone.utc)):
+            self._popularity[(row.period, row.bucket)].increase(self._film_ids[row.film_kinopoisk_id], row.views)
+
+    async def get_search_history(
+        self,
+        user_id: int,
+        after: HistoryCursor | None = None,
+        page_size: int = 10,
+    ) -> list[HistoryEntry]:
+        if user_id not in self._history:
+            return []
+        history = self._history[user_id]
+        return [
+            HistoryEntry(id=cursor.id, request_text=history[cursor], created_at=cursor.created_at)
+            for cursor in self._history_index[user_id].page(after, page_size)
+        ]
+
+    async def get_stats(
+        self,
+        user_id: int,
+        after: StatsCursor | None = None,
+        page_size: int = 10,
+    ) -> list[FilmStat]:
+        if user_id not in self._stats:
+            return []
+        return self._film_stats(self._stats[user_id].index.page(after, page_size))
+
+    async def stream_search_history(
+        self,
+        user_id: int,
+        chunk_size: int = 1000,
+    ) -> tp.AsyncIterator[HistoryEntry]:
+        # по страницам, как и в базе: записи, добавленные во время чтения, не ломают обход
+        after = None
+        while entries := await self.get_search_history(user_id, after, chunk_size):
+            for entry in entries:
+                yield entry
+            after = entries[-1].cursor
+
+    async def stream_stats(
+        self,
+        user_id: int,
+        chunk_size: int = 1000,
+    ) -> tp.AsyncIterator[FilmStat]:
+        after = None
+        while stats := await self.get_stats(user_id, after, chunk_size):
+            for stat in stats:
+                yield stat
+            after = stats[-1].cursor
+
+    async def get_top_films(
+        self,
+        period: TopPeriod,
+        limit: int = 10,
+    ) -> list[FilmStat]:
+        key = (period, period.bucket(dt.datetime.now(dt.timezone.utc)))
+        if key not in self._popularity:
+            return []
+        return self._film_stats(self._popularity[key].index.page(None, limit))
+
+    def _upsert_film(self, kinopoisk_id: int, name_ru: str | None, name_eng: str | None, poster_size: int | None) -> FilmRecord:
+        film_id = self._film_ids.get(kinopoisk_id)
+        if film_id is None:
+            film = FilmRecord(id=uuid.uuid4(), kinopoisk_id=kinopoisk_id, name_ru=name_ru or "", name_eng=name_eng or "", poster_size=poster_size)
+        else:
+            film = self._films[film_id]
+            if film.poster_size is not None or poster_size is None:
+                return film
+            film = film._replace(poster_size=poster_size)
+        self._films[film.id] = film
+        self._film_ids[kinopoisk_id] = film.id
+        return film
+
+    def _film_stats(self, cursors: list[StatsCursor]) -> list[FilmStat]:
+        return [
+            FilmStat(film_id=cursor.film_id, kinopoisk_id=self._films[cursor.film_id].kinopoisk_id, name_ru=self._films[cursor.film_id].name_ru, views=cursor.views)
+            for cursor in cursors
+        ]
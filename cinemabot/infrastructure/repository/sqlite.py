@@ -0,0 +1,336 @@
+import asyncio
+import contextlib
+import datetime as dt
+import typing as tp
+import uuid
+
+import aiosqlite
+
+from cinemabot.domain.models import (
+    FilmRecord,
+    FilmStat,
+    FilmViewIncrement,
+    HistoryCursor,
+    HistoryEntry,
+    HistoryRecord,
+    PopularityIncrement,
+    StatsCursor,
+    TopPeriod,
+    UserFilmViewRecord,
+    UserRecord,
+)
+from cinemabot.domain.repository.storage import AbstractStorageRepository
+
+
+# The same tables and indexes as in Postgres, created on start instead of by migrations. UUIDs are stored as
+# canonical text and timestamps as zero-padded UTC text, so both sort the same way as the Postgres types do.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS "user" (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS film (
+    id TEXT PRIMARY KEY,
+    kinopoisk_id INTEGER NOT NULL UNIQUE,
+    name_ru TEXT NOT NULL,
+    name_eng TEXT NOT NULL,
+    poster_size INTEGER,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS user_film_view (
+    user_id INTEGER NOT NULL REFERENCES "user" (id),
+    film_id TEXT NOT NULL REFERENCES film (id),
+    views INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, film_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_user_film_view_user_id_views_film_id ON user_film_view (user_id, views DESC, film_id DESC);
+CREATE TABLE IF NOT EXISTS search_history (
+    id TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES "user" (id),
+    request_text TEXT NOT NULL,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+);
+CREATE INDEX IF NOT EXISTS ix_search_history_user_id_created_at_id ON search_history (user_id, created_at DESC, id DESC, request_text);
+CREATE TABLE IF NOT EXISTS film_popularity (
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    film_id TEXT NOT NULL REFERENCES film (id),
+    views INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (period, bucket, film_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_film_popularity_period_bucket_views_film_id ON film_popularity (period, bucket, views DESC, film_id DESC);
+"""
+
+_CREATE_USER_QUERY = 'INSERT INTO "user" (id) VALUES (?)'
+_GET_OR_CREATE_USER_QUERY = _CREATE_USER_QUERY + " ON CONFLICT (id) DO NOTHING"
+
+_FILM_COLUMNS = "id, kinopoisk_id, name_ru, name_eng, poster_size"
+_UPSERT_FILM_QUERY = """
+INSERT INTO film (id, kinopoisk_id, name_ru, name_eng, poster_size) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (kinopoisk_id) DO UPDATE SET poster_size = coalesce(film.poster_size, excluded.poster_size), updated_at = CURRENT_TIMESTAMP
+"""
+_FILM_POSTER_SIZE_QUERY = "SELECT poster_size FROM film WHERE kinopoisk_id = ?"
+
+_USER_FILM_VIEW_QUERY = "SELECT views FROM user_film_view WHERE user_id = ? AND film_id = ?"
+_CREATE_USER_FILM_VIEW_QUERY = "INSERT INTO user_film_view (user_id, film_id, views) VALUES (?, ?, 0) ON CONFLICT (user_id, film_id) DO NOTHING"
+
+_INSERT_HISTORY_QUERY = "INSERT INTO search_history (id, user_id, request_text, created_at) VALUES (?, ?, ?, ?)"
+
+_INCREASE_VIEWS_QUERY = """
+INSERT INTO user_film_view (user_id, film_id, views)
+SELECT ?, id, ? FROM film WHERE kinopoisk_id = ?
+ON CONFLICT (user_id, film_id) DO UPDATE SET views = user_film_view.views + excluded.views, updated_at = CURRENT_TIMESTAMP
+"""
+_INCREASE_POPULARITY_QUERY = """
+INSERT INTO film_popularity (period, bucket, film_id, views)
+SELECT ?, ?, id, ? FROM film WHERE kinopoisk_id = ?
+ON CONFLICT (period, bucket, film_id) DO UPDATE SET views = film_popularity.views + excluded.views, updated_at = CURRENT_TIMESTAMP
+"""
+
+_SEARCH_HISTORY_QUERY = """
+SELECT id, request_text, created_at FROM search_history
+WHERE user_id = ? {after}
+ORDER BY created_at DESC, id DESC
+LIMIT ?
+"""
+_STATS_QUERY = """
+SELECT user_film_view.film_id, film.kinopoisk_id, film.name_ru, user_film_view.views
+FROM user_film_view JOIN film ON film.id = user_film_view.film_id
+WHERE user_film_view.user_id = ? {after}
+ORDER BY user_film_view.views DESC, user_film_view.film_id DESC
+LIMIT ?
+"""
+_TOP_FILMS_QUERY = """
+SELECT film_popularity.film_id, film.kinopoisk_id, film.name_ru, film_popularity.views
+FROM film_popularity JOIN film ON film.id = film_popularity.film_id
+WHERE film_popularity.period = ? AND film_popularity.bucket = ?
+ORDER BY film_popularity.views DESC, film_popularity.film_id DESC
+LIMIT ?
+"""
+
+
+def _to_text(value: dt.datetime) -> str:
+    return value.astimezone(dt.timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _from_text(value: str) -> dt.datetime:
+    return dt.datetime.fromisoformat(value).replace(tzinfo=dt.timezone.utc)
+
+
+class SqliteStorageRepository(AbstractStorageRepository):
+    """
+    Storage in a single SQLite file (or in memory with `path=":memory:"`) for local profiling and benchmarks.
+
+    The repository creates its schema on start and runs the same keyset queries as the Postgres repositories
+    over the same indexes. There is one connection, so statements are serialized and a batch is written
+    in one transaction. Requires SQLite 3.35+ (upserts and RETURNING).
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._connection: aiosqlite.Connection | None = None
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        if self._connection is not None:
+            return
+        # autocommit mode: transactions are opened explicitly by `_transaction`
+        self._connection = await aiosqlite.connect(self._path, isolation_level=None)
+        await self._connection.execute("PRAGMA foreign_keys = ON")
+        if self._path != ":memory:":
+            await self._connection.execute("PRAGMA journal_mode = WAL")
+            await self._connection.execute("PRAGMA synchronous = NORMAL")
+        await self._connection.executescript(_SCHEMA)
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    @contextlib.asynccontextmanager
+    async def _transaction(self) -> tp.AsyncIterator[aiosqlite.Connection]:
+        if self._connection is None:
+            raise RuntimeError("SqliteStorageRepository is not started")
+        # the lock keeps statements of concurrent calls out of each other's transactions on the shared connection
+        async with self._lock:
+            await self._connection.execute("BEGIN")
+            try:
+                yield self._connection
+            except BaseException:
+                await self._connection.rollback()
+                raise
+            await self._connection.commit()
+
+    async def create_user(
+        self,
+        user_id: int,
+        get_or_create: bool = False,
+    ) -> UserRecord:
+        async with self._transaction() as connection:
+            await connection.execute(_GET_OR_CREATE_USER_QUERY if get_or_create else _CREATE_USER_QUERY, (user_id,))
+        return UserRecord(id=user_id)
+
+    async def get_or_create_film(
+        self,
+        film_kinopoisk_id: int,
+        film_name_ru: str | None,
+        film_name_eng: str | None,
+        poster_size: int | None = None,
+    ) -> FilmRecord:
+        async with self._transaction() as connection:
+            film_row = await connection.execute_fetchall(
+                _UPSERT_FILM_QUERY + f" RETURNING {_FILM_COLUMNS}",
+                (str(uuid.uuid4()), film_kinopoisk_id, film_name_ru or "", film_name_eng or "", poster_size),
+            )
+        film_id, kinopoisk_id, name_ru, name_eng, film_poster_size = next(iter(film_row))
+        return FilmRecord(id=uuid.UUID(film_id), kinopoisk_id=kinopoisk_id, name_ru=name_ru, name_eng=name_eng, poster_size=film_poster_size)
+
+    async def get_film_poster_size(
+        self,
+        film_kinopoisk_id: int,
+    ) -> int | None:
+        async with self._transaction() as connection:
+            rows = list(await connection.execute_fetchall(_FILM_POSTER_SIZE_QUERY, (film_kinopoisk_id,)))
+        return rows[0][0] if rows else None
+
+    async def get_or_create_user_film_view(
+        self,
+        user_id: int,
+        film_id: uuid.UUID,
+    ) -> UserFilmViewRecord:
+        async with self._transaction() as connection:
+            await connection.execute(_GET_OR_CREATE_USER_QUERY, (user_id,))
+            await connection.execute(_CREATE_USER_FILM_VIEW_QUERY, (user_id, str(film_id)))
+            rows = list(await connection.execute_fetchall(_USER_FILM_VIEW_QUERY, (user_id, str(film_id))))
+        return UserFilmViewRecord(user_id=user_id, film_id=film_id, views=rows[0][0])
+
+    async def add_request_to_history(
+        self,
+        user_id: int,
+        request_text: str,
+    ) -> None:
+        await self.add_requests_to_history([HistoryRecord.new(user_id=user_id, request_text=request_text)])
+
+    async def add_requests_to_history(
+        self,
+        records: list[HistoryRecord],
+    ) -> None:
+        if not records:
+            return
+        async with self._transaction() as connection:
+            await connection.executemany(_GET_OR_CREATE_USER_QUERY, [(user_id,) for user_id in sorted({record.user_id for record in records})])
+            await connection.executemany(
+                _INSERT_HISTORY_QUERY,
+                [(str(record.id), record.user_id, record.request_text, _to_text(record.created_at)) for record in records],
+            )
+
+    async def increase_number_of_film_view(
+        self,
+        user_id: int,
+        film_kinopoisk_id: int,
+        film_name_ru: str,
+        film_name_eng: str,
+        poster_size: int | None = None,
+    ) -> None:
+        increment = FilmViewIncrement(
+            user_id=user_id,
+            film_kinopoisk_id=film_kinopoisk_id,
+            film_name_ru=film_name_ru,
+            film_name_eng=film_name_eng,
+            poster_size=poster_size,
+        )
+        await self.increase_number_of_film_views([increment])
+
+    async def increase_number_of_film_views(
+        self,
+        increments: list[FilmViewIncrement],
+    ) -> None:
+        if not increments:
+            return
+        films = {increment.film_kinopoisk_id: increment for increment in increments}
+        popularity = PopularityIncrement.from_views(increments, dt.datetime.now(dt.timezone.utc))
+        async with self._transaction() as connection:
+            await connection.executemany(_GET_OR_CREATE_USER_QUERY, [(user_id,) for user_id in sorted({increment.user_id for increment in increments})])
+            await connection.executemany(
+                _UPSERT_FILM_QUERY,
+                [(str(uuid.uuid4()), film.film_kinopoisk_id, film.film_name_ru or "", film.film_name_eng or "", film.poster_size) for film in films.values()],
+            )
+            await connection.executemany(
+                _INCREASE_VIEWS_QUERY,
+                [(increment.user_id, increment.views, increment.film_kinopoisk_id) for increment in increments],
+            )
+            await connection.executemany(
+                _INCREASE_POPULARITY_QUERY,
+                [(row.period.value, row.bucket.isoformat(), row.views, row.film_kinopoisk_id) for row in popularity],
+            )
+
+    async def get_search_history(
+        self,
+        user_id: int,
+        after: HistoryCursor | None = None,
+        page_size: int = 10,
+    ) -> list[HistoryEntry]:
+        if after is None:
+            query, params = _SEARCH_HISTORY_QUERY.format(after=""), (user_id, page_size)
+        else:
+            query = _SEARCH_HISTORY_QUERY.format(after="AND (created_at, id) < (?, ?)")
+            params = (user_id, _to_text(after.created_at), str(after.id), page_size)
+        async with self._transaction() as connection:
+            rows = await connection.execute_fetchall(query, params)
+        return [HistoryEntry(id=uuid.UUID(row[0]), request_text=row[1], created_at=_from_text(row[2])) for row in rows]
+
+    async def get_stats(
+        self,
+        user_id: int,
+        after: StatsCursor | None = None,
+        page_size: int = 10,
+    ) -> list[FilmStat]:
+        if after is None:
+            query, params = _STATS_QUERY.format(after=""), (user_id, page_size)
+        else:
+            query = _STATS_QUERY.format(after="AND (user_film_view.views, user_film_view.film_id) < (?, ?)")
+            params = (user_id, after.views, str(after.film_id), page_size)
+        async with self._transaction() as connection:
+            rows = await connection.execute_fetchall(query, params)
+        return [FilmStat(film_id=uuid.UUID(row[0]), kinopoisk_id=row[1], name_ru=row[2], views=row[3]) for row in rows]
+
+    async def stream_search_history(
+        self,
+        user_id: int,
+        chunk_size: int = 1000,
+    ) -> tp.AsyncIterator[HistoryEntry]:
+        # page by page, so that other calls can use the single connection between the chunks
+        after = None
+        while entries := await self.get_search_history(user_id, after, chunk_size):
+            for entry in entries:
+                yield entry
+            after = entries[-1].cursor
+
+    async def stream_stats(
+        self,
+        user_id: int,
+        chunk_size: int = 1000,
+    ) -> tp.AsyncIterator[FilmStat]:
+        after = None
+        while stats := await self.get_stats(user_id, after, chunk_size):
+            for stat in stats:
+                yield stat
+            after = stats[-1].cursor
+
+    async def get_top_films(
+        self,
+        period: TopPeriod,
+        limit: int = 10,
+    ) -> list[FilmStat]:
+        bucket = period.bucket(dt.datetime.now(dt.timezone.utc))
+        async with self._transaction() as connection:
+            rows = await connection.execute_fetchall(_TOP_FILMS_QUERY, (period.value, bucket.isoformat(), limit))
+        return [FilmStat(film_id=uuid.UUID(row[0]), kinopoisk_id=row[1], name_ru=row[2], views=row[3]) for row in rows]
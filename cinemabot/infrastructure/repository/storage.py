@@ -1,83 +1,244 @@
+import datetime as dt
+import typing as tp
+import uuid
+
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 
+from cinemabot.domain.models import (
+    FilmRecord,
+    FilmStat,
+    FilmViewIncrement,
+    HistoryCursor,
+    HistoryEntry,
+    HistoryRecord,
+    PopularityIncrement,
+    StatsCursor,
+    TopPeriod,
+    UserFilmViewRecord,
+    UserRecord,
+)
 from cinemabot.domain.repository.storage import AbstractStorageRepository
 from cinemabot.infrastructure.database import session_provider
-from cinemabot.infrastructure.database.schemas import Film, SearchHistory, User, UserFilmView
+from cinemabot.infrastructure.database.instrumentation import tag_methods
+from cinemabot.infrastructure.database.schemas import Film, FilmPopularity, SearchHistory, User, UserFilmView
+from cinemabot.infrastructure.repository.id_cache import IdCache
+
+
+def _create_users_query(user_ids: set[int]) -> sa.CTE:
+    now = sa.func.now()
+    return (
+        postgresql.insert(User)
+        .values([{"id": user_id, "created_at": now, "updated_at": now} for user_id in sorted(user_ids)])
+        .on_conflict_do_nothing(index_elements=[User.id])
+        .cte("new_users")
+    )
+
+
+# Hot read queries are built once at import and executed with different parameters. A prebuilt statement memoizes its
+# cache key, so SQLAlchemy finds the compiled SQL without rebuilding the statement, and the SQL text stays the same,
+# so asyncpg can reuse the prepared statement when its cache is enabled (see `PostgresSettings.pgbouncer`).
+_USER_QUERY = sa.select(User.id).filter(User.id == sa.bindparam("user_id"))
+_CREATE_USER_QUERY = sa.insert(User).values(id=sa.bindparam("user_id"))
+_FILM_QUERY = sa.select(Film).filter(Film.kinopoisk_id == sa.bindparam("kinopoisk_id"))
+_FILM_POSTER_SIZE_QUERY = sa.select(Film.id, Film.poster_size).filter(Film.kinopoisk_id == sa.bindparam("kinopoisk_id")).limit(1)
+_SEARCH_HISTORY_QUERY = (
+    sa.select(SearchHistory.id, SearchHistory.request_text, SearchHistory.created_at)
+    .filter(SearchHistory.user_id == sa.bindparam("user_id"))
+    .order_by(SearchHistory.created_at.desc(), SearchHistory.id.desc())
+    .limit(sa.bindparam("page_size", type_=sa.Integer))
+)
+_SEARCH_HISTORY_AFTER_QUERY = _SEARCH_HISTORY_QUERY.filter(
+    sa.tuple_(SearchHistory.created_at, SearchHistory.id)
+    < sa.tuple_(
+        sa.bindparam("after_created_at", type_=SearchHistory.created_at.type),
+        sa.bindparam("after_id", type_=SearchHistory.id.type),
+    ),
+)
+_STATS_QUERY = (
+    sa.select(UserFilmView.film_id, Film.kinopoisk_id, Film.name_ru, UserFilmView.views)
+    .join(
+        Film,
+        Film.id == UserFilmView.film_id,
+    )
+    .filter(UserFilmView.user_id == sa.bindparam("user_id"))
+    .order_by(UserFilmView.views.desc(), UserFilmView.film_id.desc())
+    .limit(sa.bindparam("page_size", type_=sa.Integer))
+)
+_STREAM_SEARCH_HISTORY_QUERY = _SEARCH_HISTORY_QUERY.limit(None)
+_STATS_AFTER_QUERY = _STATS_QUERY.filter(
+    sa.tuple_(UserFilmView.views, UserFilmView.film_id)
+    < sa.tuple_(
+        sa.bindparam("after_views", type_=UserFilmView.views.type),
+        sa.bindparam("after_film_id", type_=UserFilmView.film_id.type),
+    ),
+)
+_STREAM_STATS_QUERY = _STATS_QUERY.limit(None)
+_TOP_FILMS_QUERY = (
+    sa.select(FilmPopularity.film_id, Film.kinopoisk_id, Film.name_ru, FilmPopularity.views)
+    .join(
+        Film,
+        Film.id == FilmPopularity.film_id,
+    )
+    .filter(FilmPopularity.period == sa.bindparam("period"), FilmPopularity.bucket == sa.bindparam("bucket"))
+    .order_by(FilmPopularity.views.desc(), FilmPopularity.film_id.desc())
+    .limit(sa.bindparam("limit", type_=sa.Integer))
+)
+
 
+def _upsert_popularity(insert_query: postgresql.Insert) -> sa.CTE:
+    return insert_query.on_conflict_do_update(
+        index_elements=[FilmPopularity.period, FilmPopularity.bucket, FilmPopularity.film_id],
+        set_={"views": FilmPopularity.views + insert_query.excluded.views, "updated_at": sa.func.now()},
+    ).cte("film_popularity_rows")
 
+
+# checkouts and statements are attributed to the repository method that made them, see `DatabaseMetrics`
+@tag_methods
 class StorageRepository(AbstractStorageRepository):
-    def __init__(self, session_provider: session_provider.AsyncPostgresSessionProvider) -> None:
+    def __init__(
+        self,
+        session_provider: session_provider.AsyncPostgresSessionProvider,
+        known_users_max_size: int = 100_000,
+        films_max_size: int = 50_000,
+        warm_up: bool = True,
+    ) -> None:
         self._session_provider = session_provider
+        self._warm_up = warm_up
+        self._ids = IdCache(known_users_max_size=known_users_max_size, films_max_size=films_max_size)
+
+    async def start(self) -> None:
+        """Warm up in-memory caches with recently created users and films."""
+        if not self._warm_up:
+            return
+        async with self._session_provider.session() as session:
+            users_query = sa.select(User.id).order_by(User.created_at.desc()).limit(self._ids.known_users.max_size)
+            self._ids.remember_users(reversed((await session.scalars(users_query)).all()))
+            films_query = (
+                sa.select(Film.kinopoisk_id, Film.id, Film.poster_size)
+                .order_by(Film.created_at.desc())
+                .limit(self._ids.films.max_size)
+            )
+            for kinopoisk_id, film_id, poster_size in reversed((await session.execute(films_query)).all()):
+                self._ids.remember_film(kinopoisk_id, film_id, poster_size)
 
     async def create_user(
         self,
         user_id: int,
         get_or_create: bool = False,
-    ) -> User:
+    ) -> UserRecord:
+        if get_or_create and self._ids.is_known_user(user_id):
+            return UserRecord(id=user_id)
         async with self._session_provider.session() as session:
             if get_or_create:
-                existing_user_query = sa.select(User).filter(User.id == user_id)
-                existing_user = await session.scalar(existing_user_query)
-                if existing_user is not None:
-                    return existing_user
-            create_user_query = sa.insert(User).values(id=user_id).returning(User)
-            await session.execute(create_user_query)
-            return await session.scalar(existing_user_query)
+                existing_user_id = await session.scalar(_USER_QUERY, {"user_id": user_id})
+                if existing_user_id is not None:
+                    self._remember_users({user_id})
+                    return UserRecord(id=existing_user_id)
+            await session.execute(_CREATE_USER_QUERY, {"user_id": user_id})
+        self._remember_users({user_id})
+        return UserRecord(id=user_id)
 
     async def get_or_create_film(
         self,
         film_kinopoisk_id: int,
         film_name_ru: str | None,
         film_name_eng: str | None,
-    ) -> Film:
+        poster_size: int | None = None,
+    ) -> FilmRecord:
         if not film_name_ru:
             film_name_ru = ""
         if not film_name_eng:
             film_name_eng = ""
 
         async with self._session_provider.session() as session:
-            existing_film_query = sa.select(Film).filter(Film.kinopoisk_id == film_kinopoisk_id)
-            existing_film = await session.scalar(existing_film_query)
-            if existing_film is not None:
-                return existing_film
-
-            create_film_query = sa.insert(Film).values(
-                kinopoisk_id=film_kinopoisk_id,
-                name_ru=film_name_ru,
-                name_eng=film_name_eng,
-            )
-            await session.execute(create_film_query)
-            return await session.scalar(existing_film_query)
+            existing_film = await session.scalar(_FILM_QUERY, {"kinopoisk_id": film_kinopoisk_id})
+            if existing_film is None:
+                create_film_query = sa.insert(Film).values(
+                    kinopoisk_id=film_kinopoisk_id,
+                    name_ru=film_name_ru,
+                    name_eng=film_name_eng,
+                    poster_size=poster_size,
+                )
+                await session.execute(create_film_query)
+                existing_film = await session.scalar(_FILM_QUERY, {"kinopoisk_id": film_kinopoisk_id})
+            elif existing_film.poster_size is None and poster_size is not None:
+                existing_film.poster_size = poster_size
+        self._remember_film(film_kinopoisk_id, existing_film.id, existing_film.poster_size)
+        return FilmRecord(
+            id=existing_film.id,
+            kinopoisk_id=existing_film.kinopoisk_id,
+            name_ru=existing_film.name_ru,
+            name_eng=existing_film.name_eng,
+            poster_size=existing_film.poster_size,
+        )
+
+    async def get_film_poster_size(
+        self,
+        film_kinopoisk_id: int,
+    ) -> int | None:
+        cached_film = self._ids.film(film_kinopoisk_id)
+        if cached_film is not None:
+            return cached_film.poster_size
+        async with self._session_provider.session(read_only=True) as session:
+            film_row = (await session.execute(_FILM_POSTER_SIZE_QUERY, {"kinopoisk_id": film_kinopoisk_id})).first()
+        if film_row is None:
+            return None
+        self._remember_film(film_kinopoisk_id, film_row.id, film_row.poster_size)
+        return film_row.poster_size
 
     async def get_or_create_user_film_view(
         self,
         user_id: int,
-        film_id: int,
-    ) -> UserFilmView:
+        film_id: uuid.UUID,
+    ) -> UserFilmViewRecord:
         async with self._session_provider.session() as session:
-            existing_user_film_view_query = sa.select(UserFilmView).filter(
+            existing_user_film_view_query = sa.select(UserFilmView.user_id, UserFilmView.film_id, UserFilmView.views).filter(
                 UserFilmView.film_id == film_id, UserFilmView.user_id == user_id
             )
-            existing_film = await session.scalar(existing_user_film_view_query)
-            if existing_film is not None:
-                return existing_film
-
-            create_user_film_view_query = sa.insert(UserFilmView).values(
-                film_id=film_id,
-                user_id=user_id,
-            )
-            await session.execute(create_user_film_view_query)
-            return await session.scalar(existing_user_film_view_query)
+            existing_user_film_view = (await session.execute(existing_user_film_view_query)).first()
+            if existing_user_film_view is None:
+                create_user_film_view_query = sa.insert(UserFilmView).values(
+                    film_id=film_id,
+                    user_id=user_id,
+                )
+                await session.execute(create_user_film_view_query)
+                existing_user_film_view = (await session.execute(existing_user_film_view_query)).one()
+        return UserFilmViewRecord(*existing_user_film_view)
 
     async def add_request_to_history(
         self,
         user_id: int,
         request_text: str,
     ) -> None:
+        record = HistoryRecord.new(user_id=user_id, request_text=request_text)
+        await self.add_requests_to_history([record])
+
+    async def add_requests_to_history(
+        self,
+        records: list[HistoryRecord],
+    ) -> None:
+        if not records:
+            return
+        user_ids = {record.user_id for record in records}
+        query = postgresql.insert(SearchHistory).values(
+            [
+                {
+                    "id": record.id,
+                    "user_id": record.user_id,
+                    "request_text": record.request_text,
+                    "created_at": record.created_at,
+                    "updated_at": record.created_at,
+                }
+                for record in records
+            ],
+        )
+        unknown_user_ids = self._ids.unknown_users(user_ids)
+        if unknown_user_ids:
+            query = query.add_cte(_create_users_query(unknown_user_ids))
         async with self._session_provider.session() as session:
-            user = await self.create_user(user_id, get_or_create=True)
-            query = sa.insert(SearchHistory).values(user_id=user.id, request_text=request_text)
             await session.execute(query)
+        self._remember_users(user_ids)
 
     async def increase_number_of_film_view(
         self,
@@ -85,53 +246,217 @@ class StorageRepository(AbstractStorageRepository):
         film_kinopoisk_id: int,
         film_name_ru: str,
         film_name_eng: str,
+        poster_size: int | None = None,
     ) -> None:
+        increment = FilmViewIncrement(
+            user_id=user_id,
+            film_kinopoisk_id=film_kinopoisk_id,
+            film_name_ru=film_name_ru,
+            film_name_eng=film_name_eng,
+            poster_size=poster_size,
+        )
+        await self.increase_number_of_film_views([increment])
+
+    async def increase_number_of_film_views(
+        self,
+        increments: list[FilmViewIncrement],
+    ) -> None:
+        # users, films and counters are created or updated by a single statement: one round trip and no lost increments.
+        # rows are sorted so that concurrent batches lock them in the same order and don't deadlock
+        if not increments:
+            return
+        user_ids = {increment.user_id for increment in increments}
+        films = {increment.film_kinopoisk_id: increment for increment in increments}
+        # global counters for /top are updated by the same statement
+        popularity = PopularityIncrement.from_views(increments, dt.datetime.now(dt.timezone.utc))
+        if any(self._ids.film_needs_upsert(film) for film in films.values()):
+            query = self._increase_views_with_films_query(increments, list(films.values()), popularity)
+        else:
+            query = self._increase_views_query(increments, popularity)
+        unknown_user_ids = self._ids.unknown_users(user_ids)
+        if unknown_user_ids:
+            query = query.add_cte(_create_users_query(unknown_user_ids))
+
         async with self._session_provider.session() as session:
-            film = await self.get_or_create_film(film_kinopoisk_id, film_name_ru, film_name_eng)
-            user = await self.create_user(user_id, get_or_create=True)
-            user_film_view = await self.get_or_create_user_film_view(user.id, film.id)
-
-            query = (
-                sa.update(UserFilmView)
-                .filter(UserFilmView.id == user_film_view.id)
-                .values(views=user_film_view.views + 1)
+            result = await session.execute(query)
+            if isinstance(query, sa.Select):
+                for film_id, kinopoisk_id, poster_size in result.all():
+                    self._remember_film(kinopoisk_id, film_id, poster_size)
+        self._remember_users(user_ids)
+
+    def _increase_views_query(self, increments: list[FilmViewIncrement], popularity: list[PopularityIncrement]) -> sa.Insert:
+        """Fast path for films that are known to exist: their ids are taken from the in-memory cache."""
+        now = sa.func.now()
+        insert_views_query = postgresql.insert(UserFilmView).values(
+            sorted(
+                (
+                    {
+                        "user_id": increment.user_id,
+                        "film_id": self._ids.film(increment.film_kinopoisk_id).id,  # type: ignore[union-attr]
+                        "views": increment.views,
+                        "created_at": now,
+                        "updated_at": now,
+                    }
+                    for increment in increments
+                ),
+                key=lambda row: (row["user_id"], row["film_id"]),
+            ),
+        )
+        insert_popularity_query = postgresql.insert(FilmPopularity).values(
+            sorted(
+                (
+                    {
+                        "period": row.period.value,
+                        "bucket": row.bucket,
+                        "film_id": self._ids.film(row.film_kinopoisk_id).id,  # type: ignore[union-attr]
+                        "views": row.views,
+                        "created_at": now,
+                        "updated_at": now,
+                    }
+                    for row in popularity
+                ),
+                key=lambda row: (row["period"], row["bucket"], row["film_id"]),
+            ),
+        )
+        return insert_views_query.on_conflict_do_update(
+            index_elements=[UserFilmView.user_id, UserFilmView.film_id],
+            set_={"views": UserFilmView.views + insert_views_query.excluded.views, "updated_at": now},
+        ).add_cte(_upsert_popularity(insert_popularity_query))
+
+    def _increase_views_with_films_query(
+        self,
+        increments: list[FilmViewIncrement],
+        films: list[FilmViewIncrement],
+        popularity: list[PopularityIncrement],
+    ) -> sa.Select:
+        """Creates missing films and increments the counters; selects film ids to fill the in-memory cache."""
+        now = sa.func.now()
+        create_films_query = postgresql.insert(Film).values(
+            [
+                {
+                    "kinopoisk_id": film.film_kinopoisk_id,
+                    "name_ru": film.film_name_ru or "",
+                    "name_eng": film.film_name_eng or "",
+                    "poster_size": film.poster_size,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for film in sorted(films, key=lambda film: film.film_kinopoisk_id)
+            ],
+        )
+        film_rows = (
+            create_films_query.on_conflict_do_update(
+                index_elements=[Film.kinopoisk_id],
+                set_={"poster_size": sa.func.coalesce(Film.poster_size, create_films_query.excluded.poster_size)},
             )
-            await session.execute(query)
+            .returning(Film.id, Film.kinopoisk_id, Film.poster_size)
+            .cte("film_rows")
+        )
+        # ON CONFLICT DO UPDATE can't touch the same row twice, so increments must be aggregated per (user, film) by the caller
+        increment_rows = sa.values(
+            sa.column("user_id", postgresql.BIGINT),
+            sa.column("kinopoisk_id", postgresql.INTEGER),
+            sa.column("views", postgresql.INTEGER),
+            name="increments",
+        ).data(sorted((increment.user_id, increment.film_kinopoisk_id, increment.views) for increment in increments))
+        insert_views_query = postgresql.insert(UserFilmView).from_select(
+            ["user_id", "film_id", "views", "created_at", "updated_at"],
+            sa.select(increment_rows.c.user_id, film_rows.c.id, increment_rows.c.views, now, now).join(
+                film_rows,
+                film_rows.c.kinopoisk_id == increment_rows.c.kinopoisk_id,
+            ),
+        )
+        update_views_query = insert_views_query.on_conflict_do_update(
+            index_elements=[UserFilmView.user_id, UserFilmView.film_id],
+            set_={"views": UserFilmView.views + insert_views_query.excluded.views, "updated_at": now},
+        ).cte("film_views")
+        popularity_rows = sa.values(
+            sa.column("period", postgresql.TEXT),
+            sa.column("bucket", sa.Date),
+            sa.column("kinopoisk_id", postgresql.INTEGER),
+            sa.column("views", postgresql.INTEGER),
+            name="popularity",
+        ).data([(row.period.value, row.bucket, row.film_kinopoisk_id, row.views) for row in popularity])
+        insert_popularity_query = postgresql.insert(FilmPopularity).from_select(
+            ["period", "bucket", "film_id", "views", "created_at", "updated_at"],
+            sa.select(popularity_rows.c.period, popularity_rows.c.bucket, film_rows.c.id, popularity_rows.c.views, now, now)
+            .join(
+                film_rows,
+                film_rows.c.kinopoisk_id == popularity_rows.c.kinopoisk_id,
+            )
+            .order_by(popularity_rows.c.period, popularity_rows.c.bucket, film_rows.c.id),
+        )
+        return sa.select(film_rows.c.id, film_rows.c.kinopoisk_id, film_rows.c.poster_size).add_cte(
+            update_views_query,
+            _upsert_popularity(insert_popularity_query),
+        )
+
+    # caches are updated only after commit: a rolled back unit of work must not leave ids of rows that don't exist
+    def _remember_users(self, user_ids: set[int]) -> None:
+        self._session_provider.on_commit(lambda: self._ids.remember_users(user_ids))
+
+    def _remember_film(self, kinopoisk_id: int, film_id: uuid.UUID, poster_size: int | None) -> None:
+        self._session_provider.on_commit(lambda: self._ids.remember_film(kinopoisk_id, film_id, poster_size))
 
     async def get_search_history(
         self,
         user_id: int,
-        page_number: int,
+        after: HistoryCursor | None = None,
         page_size: int = 10,
-    ) -> list[SearchHistory]:
-        async with self._session_provider.session() as session:
-            query = (
-                sa.select(SearchHistory)
-                .filter(SearchHistory.user_id == user_id)
-                .limit(page_size)
-                .offset((page_number - 1) * 10)
-                .order_by(SearchHistory.created_at.desc())
-            )
-            history_rows = (await session.execute(query)).fetchall()
-            return [row[0] for row in history_rows]
+    ) -> list[HistoryEntry]:
+        # keyset pagination: the page is read straight from ix_search_history_user_id_created_at_id without skipping rows
+        query, params = _SEARCH_HISTORY_QUERY, {"user_id": user_id, "page_size": page_size}
+        if after is not None:
+            query = _SEARCH_HISTORY_AFTER_QUERY
+            params.update(after_created_at=after.created_at, after_id=after.id)
+        async with self._session_provider.session(read_only=True) as session:
+            history_rows = (await session.execute(query, params)).all()
+        return [HistoryEntry(id=row.id, request_text=row.request_text, created_at=row.created_at) for row in history_rows]
 
     async def get_stats(
         self,
         user_id: int,
-        page_number: int,
+        after: StatsCursor | None = None,
         page_size: int = 10,
-    ) -> list[tuple[int, str]]:
-        async with self._session_provider.session() as session:
-            query = (
-                sa.select(UserFilmView.views, Film.name_ru)
-                .join(
-                    Film,
-                    Film.id == UserFilmView.film_id,
-                )
-                .filter(UserFilmView.user_id == user_id)
-                .order_by(UserFilmView.views.desc())
-                .limit(page_size)
-                .offset((page_number - 1) * 10)
-            )
-            stat_rows = (await session.execute(query)).fetchall()
-            return [(row[0], row[1]) for row in stat_rows]
+    ) -> list[FilmStat]:
+        # keyset pagination over ix_user_film_view_user_id_views_film_id, film names are joined by primary key
+        query, params = _STATS_QUERY, {"user_id": user_id, "page_size": page_size}
+        if after is not None:
+            query = _STATS_AFTER_QUERY
+            params.update(after_views=after.views, after_film_id=after.film_id)
+        async with self._session_provider.session(read_only=True) as session:
+            stat_rows = (await session.execute(query, params)).all()
+        return [FilmStat(film_id=row.film_id, kinopoisk_id=row.kinopoisk_id, name_ru=row.name_ru, views=row.views) for row in stat_rows]
+
+    async def stream_search_history(
+        self,
+        user_id: int,
+        chunk_size: int = 1000,
+    ) -> tp.AsyncIterator[HistoryEntry]:
+        # a server-side cursor: rows are fetched `chunk_size` at a time, so memory doesn't depend on the history size
+        async with self._session_provider.session(read_only=True) as session:
+            history_rows = await session.stream(_STREAM_SEARCH_HISTORY_QUERY, {"user_id": user_id}, execution_options={"yield_per": chunk_size})
+            async for row in history_rows:
+                yield HistoryEntry(id=row.id, request_text=row.request_text, created_at=row.created_at)
+
+    async def stream_stats(
+        self,
+        user_id: int,
+        chunk_size: int = 1000,
+    ) -> tp.AsyncIterator[FilmStat]:
+        async with self._session_provider.session(read_only=True) as session:
+            stat_rows = await session.stream(_STREAM_STATS_QUERY, {"user_id": user_id}, execution_options={"yield_per": chunk_size})
+            async for row in stat_rows:
+                yield FilmStat(film_id=row.film_id, kinopoisk_id=row.kinopoisk_id, name_ru=row.name_ru, views=row.views)
+
+    async def get_top_films(
+        self,
+        period: TopPeriod,
+        limit: int = 10,
+    ) -> list[FilmStat]:
+        # counters are kept per period, so the top is read from ix_film_popularity_period_bucket_views_film_id
+        # without aggregating user_film_view
+        params = {"period": period.value, "bucket": period.bucket(dt.datetime.now(dt.timezone.utc)), "limit": limit}
+        async with self._session_provider.session(read_only=True) as session:
+            top_rows = (await session.execute(_TOP_FILMS_QUERY, params)).all()
+        return [FilmStat(film_id=row.film_id, kinopoisk_id=row.kinopoisk_id, name_ru=row.name_ru, views=row.views) for row in top_rows]
@@ -0,0 +1,232 @@
+import asyncio
+import dataclasses
+import logging
+import typing as tp
+import uuid
+
+from cinemabot.domain.models import (
+    FilmRecord,
+    FilmStat,
+    FilmViewIncrement,
+    HistoryCursor,
+    HistoryEntry,
+    HistoryRecord,
+    StatsCursor,
+    TopPeriod,
+    UserFilmViewRecord,
+    UserRecord,
+)
+from cinemabot.domain.repository.storage import AbstractStorageRepository
+
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindStorageRepository(AbstractStorageRepository):
+    """
+    Репозиторий, который откладывает запись истории поиска и счётчиков показов.
+
+    Записи копятся в памяти (счётчики сразу агрегируются по паре пользователь-фильм) и пишутся в `repository` пачками
+    раз в `flush_interval` секунд или как только накопится `flush_max_items` записей. Если накопилось `max_pending_items`,
+    пишущий ждёт сброса буфера - так память ограничена, а при медленной базе нагрузка упирается в неё, а не растёт без предела.
+    Перед чтением истории и статистики буфер сбрасывается, чтобы пользователь видел свои последние действия.
+
+    Пачка пишется в отдельной задаче, а не в задаче вызвавшего: так она не попадает в единицу работы обновления
+    и не откатывается вместе с ним. Если передан `transaction`, история и счётчики пишутся в одной транзакции
+    и при её ошибке обе части возвращаются в буфер.
+    """
+
+    def __init__(
+        self,
+        repository: AbstractStorageRepository,
+        flush_interval: float,
+        flush_max_items: int,
+        max_pending_items: int,
+        transaction: tp.Callable[[], tp.AsyncContextManager[tp.Any]] | None = None,
+    ) -> None:
+        self._repository = repository
+        self._transaction = transaction
+        self.flush_interval = flush_interval
+        self.flush_max_items = flush_max_items
+        self.max_pending_items = max_pending_items
+        self._history: list[HistoryRecord] = []
+        self._views: dict[tuple[int, int], FilmViewIncrement] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_requested = asyncio.Event()
+        self._flusher: asyncio.Task[None] | None = None
+        self._flushes: set[asyncio.Task[None]] = set()
+
+    @property
+    def pending_items(self) -> int:
+        return len(self._history) + len(self._views)
+
+    async def create_user(self, user_id: int, get_or_create: bool = False) -> UserRecord:
+        return await self._repository.create_user(user_id, get_or_create)
+
+    async def get_or_create_film(
+        self,
+        film_kinopoisk_id: int,
+        film_name_ru: str,
+        film_name_eng: str,
+        poster_size: int | None = None,
+    ) -> FilmRecord:
+        return await self._repository.get_or_create_film(film_kinopoisk_id, film_name_ru, film_name_eng, poster_size)
+
+    async def get_film_poster_size(self, film_kinopoisk_id: int) -> int | None:
+        return await self._repository.get_film_poster_size(film_kinopoisk_id)
+
+    async def get_or_create_user_film_view(self, user_id: int, film_id: uuid.UUID) -> UserFilmViewRecord:
+        return await self._repository.get_or_create_user_film_view(user_id, film_id)
+
+    async def add_request_to_history(self, user_id: int, request_text: str) -> None:
+        record = HistoryRecord.new(user_id=user_id, request_text=request_text)
+        await self.add_requests_to_history([record])
+
+    async def add_requests_to_history(self, records: list[HistoryRecord]) -> None:
+        await self._wait_for_space()
+        self._history.extend(records)
+        self._after_write()
+
+    async def increase_number_of_film_view(
+        self,
+        user_id: int,
+        film_kinopoisk_id: int,
+        film_name_ru: str,
+        film_name_eng: str,
+        poster_size: int | None = None,
+    ) -> None:
+        increment = FilmViewIncrement(
+            user_id=user_id,
+            film_kinopoisk_id=film_kinopoisk_id,
+            film_name_ru=film_name_ru,
+            film_name_eng=film_name_eng,
+            poster_size=poster_size,
+        )
+        await self.increase_number_of_film_views([increment])
+
+    async def increase_number_of_film_views(self, increments: list[FilmViewIncrement]) -> None:
+        await self._wait_for_space()
+        self._merge_views(increments)
+        self._after_write()
+
+    async def get_search_history(self, user_id: int, after: HistoryCursor | None = None, page_size: int = 10) -> list[HistoryEntry]:
+        await self._flush_before_read(bool(self._history))
+        return await self._repository.get_search_history(user_id, after, page_size)
+
+    async def get_stats(self, user_id: int, after: StatsCursor | None = None, page_size: int = 10) -> list[FilmStat]:
+        await self._flush_before_read(bool(self._views))
+        return await self._repository.get_stats(user_id, after, page_size)
+
+    async def stream_search_history(self, user_id: int, chunk_size: int = 1000) -> tp.AsyncIterator[HistoryEntry]:
+        await self._flush_before_read(bool(self._history))
+        async for entry in self._repository.stream_search_history(user_id, chunk_size):
+            yield entry
+
+    async def stream_stats(self, user_id: int, chunk_size: int = 1000) -> tp.AsyncIterator[FilmStat]:
+        await self._flush_before_read(bool(self._views))
+        async for stat in self._repository.stream_stats(user_id, chunk_size):
+            yield stat
+
+    async def get_top_films(self, period: TopPeriod, limit: int = 10) -> list[FilmStat]:
+        # общий топ не сбрасывает буфер: отставание на интервал сброса незаметно на фоне кэша готового топа
+        return await self._repository.get_top_films(period, limit)
+
+    async def flush(self) -> None:
+        # новая задача не видит единицу работы вызвавшего и открывает свою;
+        # отмена вызвавшего не прерывает запись, уже забравшую записи из буфера
+        task = asyncio.create_task(self._flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+        await asyncio.shield(task)
+
+    async def _flush_before_read(self, pending: bool) -> None:
+        # буфер может быть пуст и потому, что его уже забрал сброс, который ещё не записал данные: ждём и его
+        if pending or self._flushes:
+            await self.flush()
+
+    async def _flush(self) -> None:
+        async with self._flush_lock:
+            history, self._history = self._history, []
+            views, self._views = self._views, {}
+            if not history and not views:
+                return
+            if self._transaction is None:
+                await self._write_separately(history, views)
+                return
+            try:
+                async with self._transaction():
+                    await self._repository.add_requests_to_history(history)
+                    await self._repository.increase_number_of_film_views(list(views.values()))
+            except Exception:
+                self._requeue(history, views)
+                raise
+
+    async def _write_separately(self, history: list[HistoryRecord], views: dict[tuple[int, int], FilmViewIncrement]) -> None:
+        # каждый вызов репозитория - своя транзакция: записанная история не откатится, если не удалось записать счётчики
+        try:
+            await self._repository.add_requests_to_history(history)
+        except Exception:
+            self._requeue(history, views)
+            raise
+        try:
+            await self._repository.increase_number_of_film_views(list(views.values()))
+        except Exception:
+            self._requeue([], views)
+            raise
+
+    async def start(self) -> None:
+        await self._repository.start()
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        # записи, которые начали отменённые задачи, доводятся до конца
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+        try:
+            await self.flush()
+        finally:
+            await self._repository.close()
+
+    def _after_write(self) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+        if self.pending_items >= self.flush_max_items:
+            self._flush_requested.set()
+
+    async def _wait_for_space(self) -> None:
+        while self.pending_items >= self.max_pending_items:
+            await self.flush()
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush write-behind buffer")
+
+    def _merge_views(self, increments: list[FilmViewIncrement]) -> None:
+        for increment in increments:
+            key = (increment.user_id, increment.film_kinopoisk_id)
+            pending = self._views.get(key)
+            if pending is None:
+                self._views[key] = dataclasses.replace(increment)
+                continue
+            pending.views += increment.views
+            if pending.poster_size is None:
+                pending.poster_size = increment.poster_size
+
+    def _requeue(self, history: list[HistoryRecord], views: dict[tuple[int, int], FilmViewIncrement]) -> None:
+        # запись не удалась: возвращаем записи в буфер, но не больше лимита, иначе память будет расти без ограничений
+        free_space = self.max_pending_items - self.pending_items
+        if len(history) + len(views) > free_space:
+            logger.error("Write-behind buffer is full, dropping %d history records and %d view counters", len(history), len(views))
+            return
+        self._history[:0] = history
+        self._merge_views(list(views.values()))
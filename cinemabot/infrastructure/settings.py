@@ -26,6 +26,23 @@ class PostgresSettings(pydantic.BaseModel):
     min_pool_size: int
     max_pool_size: int
 
+    pgbouncer: bool = pydantic.Field(
+        default=True,
+        description="Подключение идёт через pgbouncer в режиме transaction pooling: подготовленные выражения не переживают транзакцию, кэш выражений выключается",
+    )
+    statement_cache_size: int = pydantic.Field(default=256, description="Размер кэша подготовленных выражений на соединение, если pgbouncer не используется")
+    slow_query_ms: float = pydantic.Field(
+        default=200,
+        description="Запросы дольше стольких миллисекунд пишутся в лог с типами параметров вместо значений, 0 - не писать",
+    )
+
+    replica_dsns: list[pydantic.SecretStr] = pydantic.Field(
+        default_factory=list,
+        description="Строки подключения к репликам в виде JSON-списка: история, статистика и топ читаются с них",
+    )
+    replica_health_check_interval: float = pydantic.Field(default=5, description="Как часто в секундах проверять, что реплики доступны")
+    replica_health_check_timeout: float = pydantic.Field(default=2, description="Сколько секунд ждать ответа реплики на проверке")
+
     @property
     def dsn(self) -> pydantic.SecretStr:
         """
@@ -54,6 +71,12 @@ class PostgresSettings(pydantic.BaseModel):
             f"{self.driver}://{self.user}:{urllib.parse.quote(self.password.get_secret_value())}@{self.host}:{self.port}/{self.database}",
         )
 
+    @property
+    def replicas(self) -> list["PostgresSettings"]:
+        """Настройки подключения к каждой реплике: размеры пулов и кэш выражений те же, что у основной базы."""
+        common = self.model_dump(include={"min_pool_size", "max_pool_size", "pgbouncer", "statement_cache_size"})
+        return [PostgresSettings.model_validate({**common, "dsn": dsn.get_secret_value()}) for dsn in self.replica_dsns]
+
     @pydantic.model_validator(mode="before")
     @classmethod
     def __parse_dsn(cls, values: dict[str, tp.Any]) -> dict[str, tp.Any]:
@@ -68,7 +91,8 @@ class PostgresSettings(pydantic.BaseModel):
         values["host"] = parsed_dsn.hostname
         values["port"] = parsed_dsn.port
         values["user"] = parsed_dsn.username
-        values["password"] = parsed_dsn.password
+        # в строке подключения пароль экранирован, а `dsn` экранирует его ещё раз
+        values["password"] = urllib.parse.unquote(parsed_dsn.password) if parsed_dsn.password is not None else None
         values["database"] = _remove_prefix(parsed_dsn.path, "/")
         return values
 
@@ -81,6 +105,137 @@ class KinopoiskSettings(pydantic.BaseModel):
     base_url: str = "https://kinopoiskapiunofficial.tech/"
     api_key: str
 
+    requests_per_second: float = pydantic.Field(default=20, description="Лимит запросов в секунду для ключа API (на одну реплику бота)")
+    burst: int = pydantic.Field(default=20, description="Сколько запросов можно отправить разом после простоя")
+    background_reserve: int = pydantic.Field(default=5, description="Сколько токенов фоновые запросы оставляют для пользовательских")
+    interactive_max_wait: float = pydantic.Field(default=5, description="Сколько секунд пользовательский запрос может ждать своей очереди")
+    background_max_wait: float = pydantic.Field(default=0.5, description="Сколько секунд фоновый запрос может ждать своей очереди")
+    daily_quota: int | None = pydantic.Field(
+        default=None,
+        description="Суточный лимит запросов для ключа API, None - без лимита. Считается в Redis, если кэш или состояния хранятся в нём, "
+        "иначе в памяти процесса: сбрасывается при перезапуске и отдельно у каждой реплики",
+    )
+    daily_quota_degrade_threshold: float = pydantic.Field(
+        default=0.95,
+        description="Доля суточной квоты, после которой бот отвечает только из кэша",
+    )
+
+    connection_limit: int = pydantic.Field(default=100, description="Максимальное количество открытых соединений")
+    connection_limit_per_host: int = pydantic.Field(default=30, description="Максимальное количество соединений с одним хостом, 0 - без ограничения")
+    keepalive_timeout: float = pydantic.Field(default=60, description="Сколько секунд держать неиспользуемое соединение открытым")
+    dns_cache_ttl: int | None = pydantic.Field(default=300, description="Время жизни DNS-кэша в секундах, None - не кэшировать")
+    connect_timeout: float | None = pydantic.Field(default=3, description="Таймаут установки соединения в секундах")
+    read_timeout: float | None = pydantic.Field(default=10, description="Таймаут чтения из сокета в секундах")
+
+
+class RedisSettings(pydantic.BaseModel):
+    """Настройки для подключения к Redis."""
+
+    host: str = "cinemabot_redis"
+    port: int = 6379
+    db: int = 0
+    password: pydantic.SecretStr | None = None
+
+    @property
+    def url(self) -> pydantic.SecretStr:
+        """Возвращает строку подключения к Redis, например для `redis.asyncio.Redis.from_url`."""
+        credentials = f":{urllib.parse.quote(self.password.get_secret_value())}@" if self.password else ""
+        return pydantic.SecretStr(f"redis://{credentials}{self.host}:{self.port}/{self.db}")
+
+
+class CacheSettings(pydantic.BaseModel):
+    """Настройки кэширования ответов API Кинопоиска и страниц истории и статистики."""
+
+    backend: tp.Literal["memory", "redis"] = pydantic.Field(
+        default="memory",
+        description="При нескольких репликах бота стоит использовать redis, чтобы кэш был общим",
+    )
+    search_ttl: int = pydantic.Field(default=6 * 60 * 60, description="Время жизни результатов поиска в секундах")
+    search_max_size: int = pydantic.Field(default=10_000, description="Максимальное количество результатов поиска в памяти")
+    details_ttl: int = pydantic.Field(default=7 * 24 * 60 * 60, description="Время, после которого описание фильма удаляется из кэша")
+    details_soft_ttl: int = pydantic.Field(default=24 * 60 * 60, description="Время, после которого описание фильма обновляется в фоне")
+    details_max_size: int = pydantic.Field(default=50_000, description="Максимальное количество описаний фильмов в памяти")
+    image_size_ttl: int = pydantic.Field(default=30 * 24 * 60 * 60, description="Время жизни размеров постеров в секундах")
+    image_size_max_size: int = pydantic.Field(default=100_000, description="Максимальное количество размеров постеров в памяти")
+    not_found_ttl: int = pydantic.Field(default=5 * 60, description="Сколько секунд помнить запросы, по которым ничего не нашлось")
+    not_found_max_size: int = pydantic.Field(default=50_000, description="Максимальное количество запомненных пустых запросов")
+    first_pages_enabled: bool = pydantic.Field(default=True, description="Кэшировать ли начало истории поиска и статистики показов пользователей")
+    first_pages_entries: int = pydantic.Field(default=20, description="Сколько первых записей истории и статистики держать в кэше")
+    first_pages_ttl: int = pydantic.Field(default=24 * 60 * 60, description="Время жизни закэшированного начала истории и статистики в секундах")
+    first_pages_max_size: int = pydantic.Field(default=50_000, description="Для скольких пользователей держать начало истории и статистики в памяти")
+    top_ttl: int = pydantic.Field(default=60, description="Сколько секунд показывать один и тот же готовый текст /top")
+
+
+class FSMSettings(pydantic.BaseModel):
+    """Настройки хранения состояний пользователей (поиск, страницы истории и статистики)."""
+
+    backend: tp.Literal["memory", "redis"] = pydantic.Field(
+        default="memory",
+        description="redis - состояния переживают перезапуск и общие для нескольких реплик бота, memory - только в памяти процесса",
+    )
+    ttl: int | None = pydantic.Field(
+        default=24 * 60 * 60,
+        description="Через сколько секунд без действий пользователя его состояние удаляется из Redis, None - хранить бессрочно",
+    )
+
+
+class PrefetchSettings(pydantic.BaseModel):
+    """Настройки фоновой подгрузки следующей карточки поиска."""
+
+    enabled: bool = True
+    max_tasks_per_user: int = pydantic.Field(
+        default=3,
+        description="Сколько фоновых подгрузок может одновременно выполняться для одного пользователя: "
+        "на карточку их до трёх (постер следующей, описание текущей и следующая страница поиска)",
+    )
+    details: bool = pydantic.Field(default=True, description="Подгружать ли подробное описание показанного фильма (расходует запросы к API)")
+    next_page_threshold: int = pydantic.Field(default=3, description="За сколько фильмов до конца страницы поиска подгружать следующую")
+
+
+class WriteBehindSettings(pydantic.BaseModel):
+    """Настройки отложенной записи истории поиска и счётчиков показов."""
+
+    enabled: bool = True
+    flush_interval_ms: int = pydantic.Field(default=500, description="Как часто сбрасывать накопленные записи в базу")
+    flush_max_items: int = pydantic.Field(default=500, description="Сколько записей можно накопить до внепланового сброса")
+    max_pending_items: int = pydantic.Field(default=10_000, description="Сколько записей можно держать в памяти, дальше запись ждёт сброса")
+
+
+class StorageSettings(pydantic.BaseModel):
+    """Настройки репозитория и его кэшей в памяти процесса."""
+
+    backend: tp.Literal["sqlalchemy", "asyncpg", "memory", "sqlite"] = pydantic.Field(
+        default="sqlalchemy",
+        description=(
+            "sqlalchemy - репозиторий на ORM, asyncpg - на пуле asyncpg с SQL-запросами без ORM (быстрее на горячем пути), "
+            "memory и sqlite - без Postgres, для локального профилирования и бенчмарков"
+        ),
+    )
+    sqlite_path: str = pydantic.Field(default="cinemabot.sqlite3", description="Файл базы для backend=sqlite, :memory: - база в памяти")
+    known_users_max_size: int = pydantic.Field(default=100_000, description="Сколько id пользователей, уже записанных в базу, держать в памяти")
+    films_max_size: int = pydantic.Field(default=50_000, description="Сколько соответствий kinopoisk_id -> id фильма держать в памяти")
+    warm_up: bool = pydantic.Field(default=True, description="Загружать ли недавних пользователей и фильмы в кэши при старте")
+
+
+class PartitionSettings(pydantic.BaseModel):
+    """Настройки обслуживания помесячных секций истории поиска."""
+
+    months_ahead: int = pydantic.Field(default=3, description="На сколько месяцев вперёд заранее создавать секции")
+    retention_months: int | None = pydantic.Field(
+        default=None,
+        description="Сколько прошлых месяцев истории хранить в таблице помимо текущего, None - хранить всё",
+    )
+    archive_dir: pathlib.Path | None = pydantic.Field(
+        default=pathlib.Path("archive"),
+        description="Куда выгружать устаревшие секции перед удалением, None - только отсоединять их от таблицы",
+    )
+
+    @pydantic.field_validator("archive_dir", mode="before")
+    @classmethod
+    def __parse_archive_dir(cls, value: tp.Any) -> tp.Any:
+        # пустая переменная окружения отключает архивацию
+        return None if value == "" else value
+
 
 class Settings(pydantic_settings.BaseSettings):
     run_migrations_on_startup: int = 1
@@ -88,6 +243,13 @@ class Settings(pydantic_settings.BaseSettings):
     postgres: PostgresSettings
     bot: BotSettings
     kinopoisk: KinopoiskSettings
+    redis: RedisSettings = pydantic.Field(default_factory=RedisSettings)
+    cache: CacheSettings = pydantic.Field(default_factory=CacheSettings)
+    prefetch: PrefetchSettings = pydantic.Field(default_factory=PrefetchSettings)
+    fsm: FSMSettings = pydantic.Field(default_factory=FSMSettings)
+    write_behind: WriteBehindSettings = pydantic.Field(default_factory=WriteBehindSettings)
+    storage: StorageSettings = pydantic.Field(default_factory=StorageSettings)
+    partitions: PartitionSettings = pydantic.Field(default_factory=PartitionSettings)
 
     log_level: str = pydantic.Field(
         default="INFO",
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from cinemabot.domain.models import FilmStat, HistoryCursor, HistoryEntry, HistoryRecord, StatsCursor
+from cinemabot.infrastructure.cache import MemoryCache
+from cinemabot.infrastructure.repository.cached_pages import CachedPagesStorageRepository
+from cinemabot.infrastructure.repository.memory import MemoryStorageRepository
+
+
+class CountingRepository(MemoryStorageRepository):
+    """Считает чтения и может задерживать их, чтобы запись успела пройти во время заполнения кэша."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.reads = 0
+        self.read_delay = 0.0
+
+    async def get_search_history(self, user_id: int, after: HistoryCursor | None = None, page_size: int = 10) -> list[HistoryEntry]:
+        self.reads += 1
+        entries = await super().get_search_history(user_id, after, page_size)
+        await asyncio.sleep(self.read_delay)
+        return entries
+
+    async def get_stats(self, user_id: int, after: StatsCursor | None = None, page_size: int = 10) -> list[FilmStat]:
+        self.reads += 1
+        stats = await super().get_stats(user_id, after, page_size)
+        await asyncio.sleep(self.read_delay)
+        return stats
+
+
+@pytest.fixture
+def inner() -> CountingRepository:
+    return CountingRepository()
+
+
+@pytest.fixture
+def repository(inner: CountingRepository) -> CachedPagesStorageRepository:
+    return CachedPagesStorageRepository(
+        repository=inner,
+        history_cache=MemoryCache(ttl=60, max_size=100),
+        stats_cache=MemoryCache(ttl=60, max_size=100),
+        cached_entries=5,
+    )
+
+
+async def test_writes_update_cached_pages_in_place(repository: CachedPagesStorageRepository, inner: CountingRepository) -> None:
+    await repository.add_request_to_history(1, "первый")
+    await repository.increase_number_of_film_view(1, 100, "Фильм", "Film")
+    assert [entry.request_text for entry in await repository.get_search_history(1)] == ["первый"]
+    assert [stat.views for stat in await repository.get_stats(1)] == [1]
+    reads = inner.reads
+
+    await repository.add_request_to_history(1, "второй")
+    await repository.increase_number_of_film_view(1, 100, "Фильм", "Film")
+    assert [entry.request_text for entry in await repository.get_search_history(1)] == ["второй", "первый"]
+    assert [stat.views for stat in await repository.get_stats(1)] == [2]
+    assert inner.reads == reads
+
+
+async def test_fill_does_not_overwrite_concurrent_write(repository: CachedPagesStorageRepository, inner: CountingRepository) -> None:
+    await repository.increase_number_of_film_view(1, 100, "Фильм", "Film")
+    inner.read_delay = 0.05
+    # заполнение читает базу до записи, а кладёт в кэш уже после неё
+    fill = asyncio.create_task(repository.get_stats(1))
+    await asyncio.sleep(0)
+    await repository.increase_number_of_film_view(1, 100, "Фильм", "Film")
+    assert [stat.views for stat in await fill] == [1]
+
+    inner.read_delay = 0.0
+    assert [stat.views for stat in await repository.get_stats(1)] == [2]
+    assert [stat.views for stat in await repository.get_stats(1)] == [2]
+
+
+async def test_history_records_are_added_once(repository: CachedPagesStorageRepository) -> None:
+    await repository.get_search_history(1)
+    await repository.add_requests_to_history([HistoryRecord.new(user_id=1, request_text=str(i)) for i in range(3)])
+    assert len(await repository.get_search_history(1)) == 3
@@ -0,0 +1,65 @@
+import asyncio
+import typing as tp
+
+import pytest
+
+from cinemabot import dependencies
+from cinemabot.domain.models import FilmStat, HistoryEntry
+from cinemabot.handlers import export
+from cinemabot.handlers.utils.export import Exporter
+
+
+class FailingHistoryStorage:
+    def __init__(self) -> None:
+        self.streams: list[str] = []
+
+    def stream_search_history(self, user_id: int, chunk_size: int = 1000) -> tp.AsyncIterator[HistoryEntry]:
+        self.streams.append("history")
+        return self._lost_connection()
+
+    def stream_stats(self, user_id: int, chunk_size: int = 1000) -> tp.AsyncIterator[FilmStat]:
+        self.streams.append("stats")
+        return self._lost_connection()
+
+    async def _lost_connection(self) -> tp.AsyncIterator[tp.Any]:
+        raise OSError("connection lost")
+        yield
+
+
+class FakeBot:
+    def __init__(self) -> None:
+        self.messages: list[str] = []
+
+    async def send_message(self, chat_id: int, text: str, **kwargs: tp.Any) -> None:
+        self.messages.append(text)
+
+
+async def test_failed_export_does_not_open_next_stream(monkeypatch: pytest.MonkeyPatch) -> None:
+    storage = FailingHistoryStorage()
+    monkeypatch.setattr(dependencies, "get_storage_repository", lambda: storage)
+    bot = FakeBot()
+
+    with pytest.raises(OSError):
+        await export._export(bot, chat_id=1, user_id=1, export_format="csv")  # type: ignore[arg-type]
+
+    assert storage.streams == ["history"]
+    assert bot.messages == ["Не получилось подготовить выгрузку, попробуйте позже"]
+
+
+async def test_one_export_per_user() -> None:
+    exporter = Exporter()
+    started, finish = asyncio.Event(), asyncio.Event()
+
+    async def run_export() -> None:
+        started.set()
+        await finish.wait()
+
+    assert await exporter.schedule(1, run_export)
+    await started.wait()
+    assert not await exporter.schedule(1, run_export)
+    assert await exporter.schedule(2, finish.wait)
+
+    finish.set()
+    await asyncio.gather(*exporter._tasks.values())
+    assert await exporter.schedule(1, finish.wait)
+    await exporter.close()
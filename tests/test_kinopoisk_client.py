@@ -0,0 +1,63 @@
+import asyncio
+import typing as tp
+
+import pytest
+
+from cinemabot.infrastructure.clients import rate_limit
+from cinemabot.infrastructure.clients.kinopoisk import KinopoiskClient
+from cinemabot.infrastructure.clients.rate_limit import Priority
+
+
+class FakeResponse:
+    status = 200
+
+    async def json(self) -> dict[str, tp.Any]:
+        return {"films": [{"filmId": 1}], "pagesCount": 2}
+
+    async def __aenter__(self) -> "FakeResponse":
+        return self
+
+    async def __aexit__(self, *_: tp.Any) -> None:
+        pass
+
+
+class FakeSession:
+    def __init__(self) -> None:
+        self.requests = 0
+
+    def get(self, *_: tp.Any, **__: tp.Any) -> FakeResponse:
+        self.requests += 1
+        return FakeResponse()
+
+
+@pytest.fixture
+def client() -> KinopoiskClient:
+    client = KinopoiskClient(
+        base_url="http://kinopoisk.test/",
+        api_key="key",
+        # фоновым запросам токенов не достаётся совсем: весь запас ведра отложен для интерактивных
+        rate_limiter=rate_limit.RateLimiter(
+            bucket=rate_limit.TokenBucket(rate=1, capacity=5, background_reserve=5, interactive_max_wait=2, background_max_wait=0.5),
+        ),
+    )
+    client._session = FakeSession()  # type: ignore[assignment]
+    return client
+
+
+async def test_interactive_call_retries_failed_background_flight(client: KinopoiskClient) -> None:
+    background = asyncio.create_task(client.search_film_with_keyword("брат", page=2, priority=Priority.BACKGROUND))
+    await asyncio.sleep(0)
+
+    assert (await client.search_film_with_keyword("брат", page=2))["pagesCount"] == 2
+    with pytest.raises(rate_limit.RateLimitExceededError):
+        await background
+    assert client.coalescing_stats["search_film_with_keyword"].coalesced == 1
+
+
+async def test_background_call_gets_its_own_rate_limit_error(client: KinopoiskClient) -> None:
+    with pytest.raises(rate_limit.RateLimitExceededError):
+        await asyncio.gather(
+            client.get_film_details(1, priority=Priority.BACKGROUND),
+            client.get_film_details(1, priority=Priority.BACKGROUND),
+        )
+    assert client.session.requests == 0  # type: ignore[attr-defined]
@@ -33,5 +33,5 @@ def run_linter(name: str, cmd: list[str], warn_only: bool = False) -> None:
 
 @pytest.mark.linting
 def test_ruff() -> None:
-    cmd = ["python3", "-m", "ruff", "check", "cinemabot", "tests"]
+    cmd = ["python3", "-m", "ruff", "check", "cinemabot", "benchmarks", "tests"]
     run_linter("ruff", cmd)
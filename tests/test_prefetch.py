@@ -0,0 +1,69 @@
+import asyncio
+import types
+import typing as tp
+
+import pytest
+
+from cinemabot import dependencies
+from cinemabot.handlers import find
+from cinemabot.handlers.utils.prefetch import Prefetcher
+from cinemabot.handlers.utils.search_cursor import SearchCursor
+from cinemabot.infrastructure import settings
+from cinemabot.infrastructure.clients.rate_limit import Priority
+from cinemabot.infrastructure.repository.memory import MemoryStorageRepository
+
+
+class FakeKinopoiskClient:
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, tp.Any, Priority]] = []
+
+    async def search_film_with_keyword(self, keyword: str, page: int = 1, priority: Priority = Priority.INTERACTIVE) -> dict[str, tp.Any]:
+        self.calls.append(("search", page, priority))
+        return {"films": [], "pagesCount": 2}
+
+    async def get_film_details(self, film_id: int, priority: Priority = Priority.INTERACTIVE) -> dict[str, tp.Any]:
+        self.calls.append(("details", film_id, priority))
+        return {}
+
+    async def get_image_size(self, url: str, priority: Priority = Priority.INTERACTIVE) -> int:
+        self.calls.append(("image_size", url, priority))
+        return 100
+
+
+@pytest.fixture
+def client(monkeypatch: pytest.MonkeyPatch) -> FakeKinopoiskClient:
+    client = FakeKinopoiskClient()
+    prefetch_settings = settings.PrefetchSettings()
+    prefetcher = Prefetcher(max_tasks_per_user=prefetch_settings.max_tasks_per_user)
+    storage = MemoryStorageRepository()
+    monkeypatch.setattr(dependencies, "get_settings", lambda: types.SimpleNamespace(prefetch=prefetch_settings))
+    monkeypatch.setattr(dependencies, "get_prefetcher", lambda: prefetcher)
+    monkeypatch.setattr(dependencies, "get_kinopoisk_client", lambda: client)
+    monkeypatch.setattr(dependencies, "get_storage_repository", lambda: storage)
+    return client
+
+
+async def test_all_prefetches_fit_default_budget(client: FakeKinopoiskClient) -> None:
+    films = [{"filmId": i, "posterUrl": f"poster {i}"} for i in range(5)]
+    # до конца страницы ближе, чем `next_page_threshold`: нужны все три подгрузки
+    find.prefetch_next_card(user_id=1, cursor=SearchCursor(keyword="брат", index=2, pages_count=2, film_id=2), films=films)
+    prefetcher = dependencies.get_prefetcher()
+    await asyncio.gather(*(task for tasks in prefetcher._tasks.values() for task in tasks))
+
+    assert sorted(client.calls) == [
+        ("details", 2, Priority.BACKGROUND),
+        ("image_size", "poster 3", Priority.INTERACTIVE),
+        ("search", 2, Priority.BACKGROUND),
+    ]
+
+
+async def test_next_page_is_prefetched_first(client: FakeKinopoiskClient) -> None:
+    prefetcher = dependencies.get_prefetcher()
+    # бюджет почти занят подгрузками предыдущих карточек
+    prefetcher.max_tasks_per_user = 1
+    films = [{"filmId": i, "posterUrl": f"poster {i}"} for i in range(5)]
+    threshold = dependencies.get_settings().prefetch.next_page_threshold
+    find.prefetch_next_card(user_id=1, cursor=SearchCursor(keyword="брат", index=len(films) - threshold, pages_count=2), films=films)
+    await asyncio.gather(*(task for tasks in prefetcher._tasks.values() for task in tasks))
+
+    assert client.calls == [("search", 2, Priority.BACKGROUND)]
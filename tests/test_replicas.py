@@ -0,0 +1,80 @@
+import asyncio
+
+from cinemabot.infrastructure.database.replicas import Replica, ReplicaSet, primary_reads
+
+
+class FakeTarget:
+    def __init__(self, in_use: int = 0) -> None:
+        self.in_use = in_use
+        self.down = False
+        self.hangs = False
+
+    async def ping(self) -> None:
+        if self.hangs:
+            await asyncio.sleep(3600)
+        if self.down:
+            raise OSError("connection refused")
+
+
+def replica_set(*targets: FakeTarget) -> ReplicaSet[FakeTarget]:
+    return ReplicaSet(
+        [Replica(name=f"replica-{i}", target=target) for i, target in enumerate(targets)],
+        in_use=lambda target: target.in_use,
+        ping=lambda target: target.ping(),
+        health_check_interval=60,
+        health_check_timeout=0.05,
+    )
+
+
+def test_least_loaded_replica_is_chosen() -> None:
+    replicas = replica_set(FakeTarget(in_use=3), FakeTarget(in_use=1), FakeTarget(in_use=2))
+
+    assert {replicas.choose().name for _ in range(3)} == {"replica-1"}  # type: ignore[union-attr]
+
+
+def test_equally_loaded_replicas_rotate() -> None:
+    replicas = replica_set(FakeTarget(), FakeTarget(), FakeTarget())
+
+    assert sorted(replicas.choose().name for _ in range(3)) == ["replica-0", "replica-1", "replica-2"]  # type: ignore[union-attr]
+
+
+def test_unhealthy_replica_is_skipped() -> None:
+    replicas = replica_set(FakeTarget(), FakeTarget())
+    replicas.mark_unhealthy(replicas.replicas[0], OSError())
+
+    assert {replicas.choose().name for _ in range(3)} == {"replica-1"}  # type: ignore[union-attr]
+
+
+def test_reads_fall_back_to_primary() -> None:
+    replicas = replica_set(FakeTarget())
+    with primary_reads():
+        assert replicas.choose() is None
+    replicas.mark_unhealthy(replicas.replicas[0], OSError())
+
+    assert replicas.choose() is None
+    assert replica_set().choose() is None
+
+
+async def test_failed_and_hung_pings_mark_replica_unhealthy() -> None:
+    down, hung = FakeTarget(), FakeTarget()
+    down.down = True
+    hung.hangs = True
+    replicas = replica_set(down, hung, FakeTarget())
+
+    await replicas.check()
+
+    assert [replica.healthy for replica in replicas.replicas] == [False, False, True]
+
+
+async def test_replica_recovers_after_successful_ping() -> None:
+    target = FakeTarget()
+    replicas = replica_set(target)
+    replicas.mark_unhealthy(replicas.replicas[0], OSError())
+
+    target.down = True
+    await replicas.check()
+    assert replicas.choose() is None
+
+    target.down = False
+    await replicas.check()
+    assert replicas.choose() is replicas.replicas[0]
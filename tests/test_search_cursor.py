@@ -0,0 +1,108 @@
+import types
+import typing as tp
+
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from cinemabot import dependencies
+from cinemabot.handlers import find
+from cinemabot.handlers.utils.search_cursor import SearchCursor
+from cinemabot.infrastructure.clients.kinopoisk import FilmNotFoundError
+from cinemabot.infrastructure.clients.rate_limit import Priority
+from cinemabot.infrastructure.repository.memory import MemoryStorageRepository
+
+
+class FakeKinopoiskClient:
+    def __init__(self, pages: dict[int, list[dict[str, tp.Any]]]) -> None:
+        self.pages = pages
+        self.details_calls: list[int] = []
+
+    async def search_film_with_keyword(self, keyword: str, page: int = 1, priority: Priority = Priority.INTERACTIVE) -> dict[str, tp.Any]:
+        if page not in self.pages:
+            raise FilmNotFoundError
+        return {"films": self.pages[page], "pagesCount": len(self.pages)}
+
+    async def get_film_details(self, film_id: int, priority: Priority = Priority.INTERACTIVE) -> dict[str, tp.Any]:
+        self.details_calls.append(film_id)
+        return {
+            "kinopoiskId": film_id,
+            "nameRu": f"Фильм {film_id}",
+            "nameOriginal": None,
+            "posterUrl": f"poster {film_id}",
+            "posterUrlPreview": f"preview {film_id}",
+            "year": 2000,
+            "genres": [],
+            "countries": [],
+            "description": "",
+            "ratingKinopoisk": None,
+            "ratingFilmCritics": None,
+            "filmLength": None,
+            "webUrl": f"https://www.kinopoisk.ru/film/{film_id}/",
+        }
+
+
+class FakeMessage:
+    def __init__(self) -> None:
+        self.answers: list[str] = []
+        self.captions: list[str] = []
+
+    async def answer(self, text: str, **kwargs: tp.Any) -> None:
+        self.answers.append(text)
+
+    async def edit_caption(self, caption: str, **kwargs: tp.Any) -> None:
+        self.captions.append(caption)
+
+
+def films(*film_ids: int) -> list[dict[str, tp.Any]]:
+    return [{"filmId": film_id} for film_id in film_ids]
+
+
+def test_state_without_film_id() -> None:
+    # состояние, сохранённое до появления film_id в курсоре
+    assert SearchCursor.from_state(["брат", 2, 3, 4]) == SearchCursor(keyword="брат", page=2, index=3, pages_count=4)
+    cursor = SearchCursor(keyword="брат", page=2, index=3, pages_count=4, film_id=42)
+    assert SearchCursor.from_state(cursor.to_state()) == cursor
+
+
+async def test_current_on_shorter_page() -> None:
+    client = FakeKinopoiskClient({1: films(1, 2)})
+    cursor = SearchCursor(keyword="брат", index=5, film_id=6)
+
+    assert await cursor.current(client) is None  # type: ignore[arg-type]
+
+
+async def test_advance_remembers_film_id() -> None:
+    client = FakeKinopoiskClient({1: films(1, 2), 2: films(3)})
+    cursor = SearchCursor(keyword="брат", pages_count=2, film_id=1)
+
+    assert await cursor.advance(client) == {"filmId": 2}  # type: ignore[arg-type]
+    assert cursor.film_id == 2
+    assert await cursor.advance(client) == {"filmId": 3}  # type: ignore[arg-type]
+    assert (cursor.page, cursor.index, cursor.film_id) == (2, 0, 3)
+    assert await cursor.advance(client) is None  # type: ignore[arg-type]
+
+
+async def test_advance_past_shorter_page() -> None:
+    # кэш поиска истёк, и повторный поиск вернул страницу короче той, что видел пользователь
+    client = FakeKinopoiskClient({1: films(1, 2), 2: []})
+    cursor = SearchCursor(keyword="брат", index=5, pages_count=2, film_id=6)
+
+    assert await cursor.advance(client) is None  # type: ignore[arg-type]
+
+
+async def test_details_are_fetched_by_film_id(monkeypatch: pytest.MonkeyPatch) -> None:
+    # повторный поиск вернул другие фильмы: описание всё равно берётся для показанного фильма
+    client = FakeKinopoiskClient({1: films(7)})
+    monkeypatch.setattr(dependencies, "get_kinopoisk_client", lambda: client)
+    monkeypatch.setattr(dependencies, "get_storage_repository", lambda: MemoryStorageRepository())
+    state = FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=1, chat_id=1, user_id=1))
+    await state.set_data({"find": SearchCursor(keyword="брат", index=3, film_id=42).to_state()})
+    message = FakeMessage()
+
+    await find.movie_description_in_find(types.SimpleNamespace(message=message), state)  # type: ignore[arg-type]
+
+    assert client.details_calls == [42]
+    assert message.answers == []
+    assert len(message.captions) == 1
@@ -0,0 +1,202 @@
+"""
+Общий контракт `AbstractStorageRepository`: одни и те же проверки для всех реализаций.
+
+`memory` и `sqlite` проверяются всегда. Репозитории на Postgres проверяются, если в окружении есть настройки
+подключения и база с применёнными миграциями доступна, иначе эти тесты пропускаются.
+"""
+
+import datetime as dt
+import random
+import typing as tp
+import uuid
+
+import pydantic
+import pytest
+
+from cinemabot.domain.models import FilmViewIncrement, HistoryRecord, TopPeriod
+from cinemabot.domain.repository.storage import AbstractStorageRepository
+from cinemabot.infrastructure import settings
+from cinemabot.infrastructure.database.session_provider import AsyncPostgresSessionProvider
+from cinemabot.infrastructure.repository.asyncpg_storage import AsyncpgStorageRepository
+from cinemabot.infrastructure.repository.memory import MemoryStorageRepository
+from cinemabot.infrastructure.repository.sqlite import SqliteStorageRepository
+from cinemabot.infrastructure.repository.storage import StorageRepository
+
+
+def _postgres_settings() -> settings.PostgresSettings:
+    try:
+        return settings.Settings().postgres
+    except pydantic.ValidationError:
+        pytest.skip("Postgres settings are not configured")
+
+
+@pytest.fixture(params=["memory", "sqlite", "sqlalchemy", "asyncpg"])
+async def repository(request: pytest.FixtureRequest, tmp_path: tp.Any) -> tp.AsyncIterator[AbstractStorageRepository]:
+    session_provider = None
+    if request.param == "memory":
+        repository: AbstractStorageRepository = MemoryStorageRepository()
+    elif request.param == "sqlite":
+        repository = SqliteStorageRepository(path=str(tmp_path / "storage.sqlite3"))
+    elif request.param == "asyncpg":
+        repository = AsyncpgStorageRepository(connection_settings=_postgres_settings(), warm_up=False)
+    else:
+        session_provider = AsyncPostgresSessionProvider(connection_settings=_postgres_settings())
+        repository = StorageRepository(session_provider=session_provider, warm_up=False)
+    try:
+        await repository.start()
+        # у репозитория на ORM соединение открывается только на первом запросе
+        await repository.get_film_poster_size(0)
+    except OSError as exc:
+        pytest.skip(f"Postgres is not available: {exc}")
+    yield repository
+    await repository.close()
+    if session_provider is not None:
+        await session_provider.close()
+
+
+@pytest.fixture
+def user_id() -> int:
+    # случайные id, чтобы тесты не мешали друг другу и данным в общей базе Postgres
+    return random.randint(10**12, 2 * 10**12)
+
+
+@pytest.fixture
+def kinopoisk_ids() -> list[int]:
+    first = random.randint(10**9, 2 * 10**9)
+    return [first + i for i in range(5)]
+
+
+async def test_create_user(repository: AbstractStorageRepository, user_id: int) -> None:
+    assert (await repository.create_user(user_id)).id == user_id
+    assert (await repository.create_user(user_id, get_or_create=True)).id == user_id
+
+
+async def test_get_or_create_film(repository: AbstractStorageRepository, kinopoisk_ids: list[int]) -> None:
+    assert await repository.get_film_poster_size(kinopoisk_ids[0]) is None
+
+    film = await repository.get_or_create_film(kinopoisk_ids[0], "Фильм", None)
+    assert (film.kinopoisk_id, film.name_ru, film.name_eng, film.poster_size) == (kinopoisk_ids[0], "Фильм", "", None)
+
+    # размер постера дописывается, если его ещё не было, а название не меняется
+    same_film = await repository.get_or_create_film(kinopoisk_ids[0], "Другое название", "Film", poster_size=100)
+    assert (same_film.id, same_film.name_ru, same_film.poster_size) == (film.id, "Фильм", 100)
+    assert (await repository.get_or_create_film(kinopoisk_ids[0], "Фильм", "Film", poster_size=200)).poster_size == 100
+    assert await repository.get_film_poster_size(kinopoisk_ids[0]) == 100
+
+
+async def test_get_or_create_user_film_view(repository: AbstractStorageRepository, user_id: int, kinopoisk_ids: list[int]) -> None:
+    await repository.create_user(user_id)
+    film = await repository.get_or_create_film(kinopoisk_ids[0], "Фильм", "Film")
+
+    view = await repository.get_or_create_user_film_view(user_id, film.id)
+    assert (view.user_id, view.film_id, view.views) == (user_id, film.id, 0)
+    await repository.increase_number_of_film_view(user_id, kinopoisk_ids[0], "Фильм", "Film")
+    assert (await repository.get_or_create_user_film_view(user_id, film.id)).views == 1
+
+
+async def test_search_history_pages(repository: AbstractStorageRepository, user_id: int) -> None:
+    assert await repository.get_search_history(user_id) == []
+
+    now = dt.datetime.now(dt.timezone.utc).replace(microsecond=0)
+    # две записи с одним временем: порядок между ними определяет id
+    records = [HistoryRecord(user_id, f"request {i}", now - dt.timedelta(seconds=i // 2), uuid.uuid4()) for i in range(7)]
+    await repository.add_requests_to_history(records[:4])
+    await repository.add_requests_to_history(records[4:])
+    expected = sorted(records, key=lambda record: (record.created_at, record.id), reverse=True)
+
+    pages = [await repository.get_search_history(user_id, page_size=3)]
+    while pages[-1]:
+        pages.append(await repository.get_search_history(user_id, after=pages[-1][-1].cursor, page_size=3))
+    assert [len(page) for page in pages] == [3, 3, 1, 0]
+    entries = [entry for page in pages for entry in page]
+    assert [(entry.id, entry.request_text, entry.created_at) for entry in entries] == [
+        (record.id, record.request_text, record.created_at) for record in expected
+    ]
+
+
+async def test_add_request_to_history(repository: AbstractStorageRepository, user_id: int) -> None:
+    await repository.add_request_to_history(user_id, "first")
+    await repository.add_request_to_history(user_id, "second")
+    await repository.add_request_to_history(user_id + 1, "other user")
+
+    assert [entry.request_text for entry in await repository.get_search_history(user_id)] == ["second", "first"]
+    # пользователь создаётся вместе с первой записью
+    assert (await repository.create_user(user_id, get_or_create=True)).id == user_id
+
+
+async def test_stats_pages(repository: AbstractStorageRepository, user_id: int, kinopoisk_ids: list[int]) -> None:
+    assert await repository.get_stats(user_id) == []
+
+    views = [3, 1, 3, 2, 1]
+    await repository.increase_number_of_film_views(
+        [FilmViewIncrement(user_id, kinopoisk_id, f"Фильм {i}", f"Film {i}", views=views[i]) for i, kinopoisk_id in enumerate(kinopoisk_ids)],
+    )
+    await repository.increase_number_of_film_view(user_id + 1, kinopoisk_ids[1], "Фильм 1", "Film 1")
+
+    pages = [await repository.get_stats(user_id, page_size=2)]
+    while pages[-1]:
+        pages.append(await repository.get_stats(user_id, after=pages[-1][-1].cursor, page_size=2))
+    assert [len(page) for page in pages] == [2, 2, 1, 0]
+    stats = [stat for page in pages for stat in page]
+    assert [stat.views for stat in stats] == [3, 3, 2, 1, 1]
+    assert [stat.cursor for stat in stats] == sorted((stat.cursor for stat in stats), reverse=True)
+    assert {stat.kinopoisk_id: (stat.name_ru, stat.views) for stat in stats} == {
+        kinopoisk_id: (f"Фильм {i}", views[i]) for i, kinopoisk_id in enumerate(kinopoisk_ids)
+    }
+    assert [(stat.kinopoisk_id, stat.views) for stat in await repository.get_stats(user_id + 1)] == [(kinopoisk_ids[1], 1)]
+
+
+async def test_increase_number_of_film_views(repository: AbstractStorageRepository, user_id: int, kinopoisk_ids: list[int]) -> None:
+    await repository.increase_number_of_film_view(user_id, kinopoisk_ids[0], "Фильм", "Film")
+    await repository.increase_number_of_film_views(
+        [
+            FilmViewIncrement(user_id, kinopoisk_ids[0], "Фильм", "Film", poster_size=100, views=2),
+            FilmViewIncrement(user_id + 1, kinopoisk_ids[0], "Фильм", "Film", poster_size=100),
+            FilmViewIncrement(user_id + 1, kinopoisk_ids[1], None, None, poster_size=200),
+        ],
+    )
+    await repository.increase_number_of_film_views([])
+
+    assert [(stat.kinopoisk_id, stat.views) for stat in await repository.get_stats(user_id)] == [(kinopoisk_ids[0], 3)]
+    assert sorted((stat.kinopoisk_id, stat.name_ru, stat.views) for stat in await repository.get_stats(user_id + 1)) == [
+        (kinopoisk_ids[0], "Фильм", 1),
+        (kinopoisk_ids[1], "", 1),
+    ]
+    assert await repository.get_film_poster_size(kinopoisk_ids[0]) == 100
+    assert await repository.get_film_poster_size(kinopoisk_ids[1]) == 200
+
+
+async def test_stream(repository: AbstractStorageRepository, user_id: int, kinopoisk_ids: list[int]) -> None:
+    now = dt.datetime.now(dt.timezone.utc)
+    await repository.add_requests_to_history([HistoryRecord(user_id, f"request {i}", now - dt.timedelta(seconds=i), uuid.uuid4()) for i in range(5)])
+    await repository.increase_number_of_film_views([FilmViewIncrement(user_id, kinopoisk_id, "", "", views=i + 1) for i, kinopoisk_id in enumerate(kinopoisk_ids)])
+
+    history = [entry async for entry in repository.stream_search_history(user_id, chunk_size=2)]
+    assert history == await repository.get_search_history(user_id, page_size=100)
+    stats = [stat async for stat in repository.stream_stats(user_id, chunk_size=2)]
+    assert stats == await repository.get_stats(user_id, page_size=100)
+    assert [stat.kinopoisk_id for stat in stats] == kinopoisk_ids[::-1]
+    assert [entry async for entry in repository.stream_search_history(user_id + 1)] == []
+
+
+async def test_get_top_films(repository: AbstractStorageRepository, user_id: int, kinopoisk_ids: list[int]) -> None:
+    before = {period: await _top_views(repository, period, kinopoisk_ids) for period in TopPeriod}
+    await repository.increase_number_of_film_views(
+        [
+            FilmViewIncrement(user_id, kinopoisk_ids[0], "Фильм 0", "", views=2),
+            FilmViewIncrement(user_id, kinopoisk_ids[1], "Фильм 1", ""),
+            FilmViewIncrement(user_id + 1, kinopoisk_ids[0], "Фильм 0", ""),
+        ],
+    )
+    await repository.increase_number_of_film_view(user_id + 2, kinopoisk_ids[1], "Фильм 1", "")
+
+    for period in TopPeriod:
+        top = await repository.get_top_films(period, limit=1000)
+        assert [stat.cursor for stat in top] == sorted((stat.cursor for stat in top), reverse=True)
+        after = await _top_views(repository, period, kinopoisk_ids)
+        assert {kinopoisk_id: after[kinopoisk_id] - before[period].get(kinopoisk_id, 0) for kinopoisk_id in after} == {kinopoisk_ids[0]: 3, kinopoisk_ids[1]: 2}
+    assert len(await repository.get_top_films(TopPeriod.day, limit=1)) == 1
+
+
+async def _top_views(repository: AbstractStorageRepository, period: TopPeriod, kinopoisk_ids: list[int]) -> dict[int, int]:
+    return {stat.kinopoisk_id: stat.views for stat in await repository.get_top_films(period, limit=1000) if stat.kinopoisk_id in kinopoisk_ids}
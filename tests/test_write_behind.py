@@ -0,0 +1,30 @@
+import asyncio
+
+from cinemabot.domain.models import FilmViewIncrement, HistoryRecord
+from cinemabot.infrastructure.repository.memory import MemoryStorageRepository
+from cinemabot.infrastructure.repository.write_behind import WriteBehindStorageRepository
+
+
+class SlowRepository(MemoryStorageRepository):
+    """Записывает с задержкой, как база под нагрузкой."""
+
+    async def add_requests_to_history(self, records: list[HistoryRecord]) -> None:
+        await asyncio.sleep(0.05)
+        await super().add_requests_to_history(records)
+
+    async def increase_number_of_film_views(self, increments: list[FilmViewIncrement]) -> None:
+        await asyncio.sleep(0.05)
+        await super().increase_number_of_film_views(increments)
+
+
+async def test_read_waits_for_flush_in_progress() -> None:
+    repository = WriteBehindStorageRepository(SlowRepository(), flush_interval=60, flush_max_items=1, max_pending_items=100)
+    await repository.add_request_to_history(1, "брат")
+    await repository.increase_number_of_film_view(1, 100, "Брат", "Brother")
+    # фоновый сброс забрал записи из буфера, но ещё не записал их
+    while repository.pending_items:
+        await asyncio.sleep(0)
+
+    assert [entry.request_text for entry in await repository.get_search_history(1)] == ["брат"]
+    assert [(stat.kinopoisk_id, stat.views) for stat in await repository.get_stats(1)] == [(100, 1)]
+    await repository.close()